@@ -17,7 +17,7 @@ exports.run_script = function(command, args, callback, dataCallback) {
     //Here is the output
     // data=data.toString();
 
-    var lines = data.match(/[^\r\n]+/g);
+    var lines = data.match(/[^\r\n]+/g) || []; // a chunk may hold only line breaks
     for (var i = 0; i < lines.length; i++) {
       console.log(lines[i]);
 
@@ -30,7 +30,7 @@ exports.run_script = function(command, args, callback, dataCallback) {
     // Return some data to the renderer process with the mainprocess-response ID
     // mainWindow.webContents.send('mainprocess-response', data);
     // data=data.toString();
-    var lines = data.match(/[^\r\n]+/g);
+    var lines = data.match(/[^\r\n]+/g) || []; // a chunk may hold only line breaks
     for (var i = 0; i < lines.length; i++) {
       console.log(lines[i]);
       
@@ -115,7 +115,7 @@ function updateGrid() {
       div.className = "info";
 
       let steps = document.createElement("P");
-      steps.innerHTML = `Steps: ${state.steps}/${startData.steps}`;
+      steps.innerHTML = stepsText(state, startData);
       div.appendChild(steps);
       sims_steps.push(steps);
 
@@ -146,6 +146,14 @@ function updateGrid() {
   require('electron').remote.getGlobal('vars').firstGridUpdate = false;
 }
 
+function stepsText(state, startData) {
+  let text = `Steps: ${state.steps}/${startData.steps}`;
+  if (state.eta !== undefined && state.eta !== null && state.steps < startData.steps) {
+    text += ` (${state.steps_per_sec.toFixed(1)} steps/sec, ${Math.round(state.eta)}s left)`;
+  }
+  return text;
+}
+
 let gradualUpdateInProgress = 0;
 
 function updateData(force) {
@@ -166,7 +174,7 @@ function updateData(force) {
         updatePbGradual(pb, p, firstGridUpdate ? initial_pb_time : update_pb_time);
       } else {
         // console.log(`update data helper is transitioning pbar ${i} from ${strokeDashoffsetToPercent(getChildByClass(pb, "bar"))} to ${p}`);
-        sims_steps[i].innerHTML = `Steps: ${state.steps}/${startData.steps}`;
+        sims_steps[i].innerHTML = stepsText(state, startData);
         updatePb(pb, p);
       }
     } catch (e) {
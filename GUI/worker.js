@@ -5,6 +5,7 @@ const cmd = require("./cmd.js")
 const Store = require('electron-store');
 const store = new Store();
 const fs = require('fs');
+const net = require('net');
 
 let sims = store.get("sims", []);
 
@@ -28,6 +29,105 @@ ipcRenderer.on('registerSim', (event, arg) => {
 });
 
 
+// Local runs are hosted by one long lived simulation server (proj/server.py), the worker sends it json requests over a
+// localhost tcp port and gets json events back, one per line.
+class SimServer {
+    constructor(port) {
+        this.port = port;
+        this.socket = null;
+        this.connecting = false;
+        this.starting = false;
+        this.waiting = []; // requests sent before the connection is up
+        this.ids = 0;
+        this.requests = {}; // request id -> sim waiting for its run id
+        this.runs = {}; // server run id -> sim
+    }
+
+    connect() {
+        if (this.socket !== null || this.connecting) {
+            return;
+        }
+        this.connecting = true;
+        let socket = net.connect(this.port, "127.0.0.1");
+        let buffer = "";
+        socket.setEncoding('utf8');
+        socket.on('connect', () => {
+            this.connecting = false;
+            this.socket = socket;
+            this.waiting.forEach((line) => socket.write(line));
+            this.waiting = [];
+        });
+        socket.on('data', (data) => {
+            buffer += data;
+            let lines = buffer.split("\n");
+            buffer = lines.pop();
+            lines.forEach((line) => {
+                if (line.trim() !== "") {
+                    this.receive(JSON.parse(line));
+                }
+            });
+        });
+        socket.on('error', (e) => {
+            if (this.connecting) {
+                this.connecting = false;
+            }
+            if (this.socket === null && !this.starting) {
+                this.start(); // nothing is listening yet
+            }
+        });
+        socket.on('close', () => {
+            this.socket = null;
+        });
+    }
+
+    start() {
+        //install the requirements and start the server once, then connect when it listens
+        this.starting = true;
+        let c_a = `cd ${store.get("env_sim_path", "")} && pip install -r requirements.txt && python server.py --port ${this.port}`;
+        cmd.run_script(c_a, [], null, (data) => {
+            if (data[1] !== -1 && data[0].startsWith("serving on")) {
+                this.starting = false;
+                this.connect();
+            }
+        });
+    }
+
+    send(request, sim) {
+        request.id = this.ids++;
+        if (sim !== undefined) {
+            this.requests[request.id] = sim;
+        }
+        let line = JSON.stringify(request) + "\n";
+        if (this.socket === null) {
+            this.waiting.push(line);
+            this.connect();
+        } else {
+            this.socket.write(line);
+        }
+    }
+
+    receive(message) {
+        if (message.event === undefined) { //a reply
+            let sim = this.requests[message.reply];
+            delete this.requests[message.reply];
+            if (sim !== undefined && message.ok) {
+                this.runs[message.run] = sim;
+                sim.serverRun = message.run;
+            } else if (sim !== undefined) {
+                console.log(`run ${sim.runID} was rejected: ${message.error}`);
+            }
+            return;
+        }
+        let sim = this.runs[message.run];
+        if (sim !== undefined) {
+            sim.receive(message);
+        }
+    }
+}
+
+const server = new SimServer(store.get("server_port", 8765));
+
+
 class Sim {
     constructor(json) {
         this.command = json.command;
@@ -36,6 +136,7 @@ class Sim {
         this.startData = json.startData;
         this.state_OT = [];
         this.spellID = -1;
+        this.serverRun = -1;
         this.path = `${root}\\EcoSystemProject(GUI-runs)\\run_${this.runID}`;
         fs.mkdirSync(this.path);
         this.state = {
@@ -48,6 +149,17 @@ class Sim {
     }
 
     run() {
+        if (!this.spell) {
+            //the auto.py arguments of the command, the server reports the progress itself
+            let argv = this.command.split("auto.py")[1].trim().split(/\s+/).filter((a) => a !== "--gui");
+            server.send({
+                cmd: "run",
+                argv: argv,
+                name: `gui/run_${this.runID}`
+            }, this);
+            return;
+        }
+
         const dataCallback = (data) => {
             this.data.push(data);
             this.update_statistics();
@@ -57,6 +169,43 @@ class Sim {
         cmd.run_script(c_a, [], null, dataCallback);
     }
 
+    pause() {
+        server.send({cmd: "pause", run: this.serverRun});
+    }
+
+    resume() {
+        server.send({cmd: "resume", run: this.serverRun});
+    }
+
+    cancel() {
+        server.send({cmd: "cancel", run: this.serverRun});
+    }
+
+    receive(event) {
+        this.data.push([JSON.stringify(event), 0]);
+        if (event.event === "progress") {
+            this.state = {
+                steps: event.steps,
+                food: event.food,
+                agents: event.agents,
+                steps_per_sec: event.steps_per_sec,
+                agent_steps_per_sec: event.agent_steps_per_sec,
+                eta: event.eta
+            };
+            this.state_OT.push(this.state);
+        } else if (event.event === "done") {
+            //sim is now complete, move the output files to local storage
+            this.copy_outputs(event.folder);
+        }
+        updateSims();
+    }
+
+    copy_outputs(origin) {
+        fs.readdirSync(`${origin}`).forEach((f) => {
+            fs.copyFileSync(`${origin}\\${f}`, `${root}\\EcoSystemProject(GUI-runs)\\run_${this.runID}\\${f}`);
+        });
+    }
+
     update_statistics() {
         let d = this.data[this.data.length - 1];
         if (d[1] == -1) {
@@ -64,7 +213,7 @@ class Sim {
         }
         let l = d[0];
         try {
-            if (this.spell && this.spellID === -1 && l.includes("Casting spell #")) {
+            if (this.spellID === -1 && l.includes("Casting spell #")) {
                 this.spellID = l.split("#")[1].split(".")[0]; //get the spellRunID
             }
 
@@ -74,14 +223,7 @@ class Sim {
         } catch (e) {
         }
 
-        if (l.startsWith("Simulation complete") && !this.spell) {
-            //sim is now complete, move the output files to local storage
-
-            let origin = l.split(": ")[1].trim();
-            fs.readdirSync(`${origin}`).forEach((f) => {
-                fs.copyFileSync(`${origin}\\${f}`, `${root}\\EcoSystemProject(GUI-runs)\\run_${this.runID}\\${f}`);
-            });
-        } else if (l.trim() === `Run ${this.spellID} complete`) {
+        if (l.trim() === `Run ${this.spellID} complete`) {
             //sim is complete and spell has finished pushing thee files to the spell file system
             cmd.run_script(`spell cp -f runs/${this.spellID}/proj/graphs-0.3/ ${root}/EcoSystemProject(GUI-runs)/run_${this.runID}`, [], null, (d) => {
             });
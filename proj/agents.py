@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+# Ecosystem project - studying natural biological systems using a simulated ecosystem and reinforcement learning.
+# Copyright (C) 2020 Inbar Koursh
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+
+# every per-agent field and the dtype of its column
+FIELDS = (
+    ("x", np.float64),
+    ("mass", np.float64),
+    ("energy", np.float64),
+    ("health", np.float64),
+    ("speed", np.float64),
+    ("final_mass", np.float64),
+    ("breed_mass_div", np.float64),
+    ("breed_chance", np.float64),
+    ("iq", np.int64),
+    ("eq", np.int64),
+    ("id", np.int64),
+    ("parent_id", np.int64),
+    ("group", np.int64),
+    ("move_row", np.int64),  # row of the move brain in the store's move_brains arena, keyed by iq
+    ("social_row", np.int64),  # row of the social brain in the store's social_brains arena, keyed by eq
+)
+
+FIELD_NAMES = tuple(name for name, _ in FIELDS)
+
+NO_PARENT = -1  # parent id used for the initial population
+
+
+class AgentStore:
+    """
+    A columnar (structure of arrays) container for the agents of a simulation.
+
+    Every per-agent field is kept in its own numpy array and an agent is identified by its slot (row) in those arrays.
+    Slots 0 to len(store) - 1 are alive, the arrays are over-allocated so that appending is amortized O(1).
+    Columns are read as attributes (``store.mass``) and return a view of the live slots, so they can be updated in place
+    (``store.energy -= 1``).
+
+    Args:
+        size_factor(float): The size factor of the simulation the agents belong to. See :attr:`model2.Sim.size_factor`
+        view(callable): A function ``view(store, slot)`` used to wrap a single slot when indexing or iterating the store
+        capacity(int): The initial number of allocated slots
+        move_brains(BrainArena): The arena holding the agents' move brains
+        social_brains(BrainArena): The arena holding the agents' social brains
+        config(SimConfig): The parameters of the simulation the agents belong to, see :class:`simconfig.SimConfig`
+        rng(numpy.random.Generator): The random number generator of the simulation the agents belong to
+
+    Attributes:
+        size_factor(float): The size factor of the simulation the agents belong to.
+        n(int): The number of live slots
+        move_brains(BrainArena): The arena holding the agents' move brains, see :class:`nn.BrainArena`
+        social_brains(BrainArena): The arena holding the agents' social brains
+        config(SimConfig): The parameters of the simulation the agents belong to
+        rng(numpy.random.Generator): The random number generator of the simulation the agents belong to
+    """
+
+    def __init__(self, size_factor: float = 1.0, view=None, capacity: int = 16, move_brains=None,
+                 social_brains=None, config=None, rng=None) -> None:
+        object.__setattr__(self, "_allocate", None)
+        object.__setattr__(self, "_cols", {name: self._zeros(capacity, dtype) for name, dtype in FIELDS})
+        object.__setattr__(self, "size_factor", size_factor)
+        object.__setattr__(self, "n", 0)
+        object.__setattr__(self, "_view", view)
+        object.__setattr__(self, "move_brains", move_brains)
+        object.__setattr__(self, "social_brains", social_brains)
+        object.__setattr__(self, "config", config)
+        object.__setattr__(self, "rng", rng)
+
+    def __getattr__(self, name: str) -> np.ndarray:
+        cols = self.__dict__.get("_cols")
+        if cols is not None and name in cols:
+            return cols[name][:self.n]
+        raise AttributeError(name)
+
+    def __setattr__(self, name: str, value) -> None:
+        if name in self._cols:
+            self._cols[name][:self.n] = value
+        else:
+            object.__setattr__(self, name, value)
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __getitem__(self, slot: int):
+        if slot < 0:
+            slot += self.n
+        if not 0 <= slot < self.n:
+            raise IndexError("agent slot out of range")
+        return self._view(self, slot) if self._view is not None else self.row(slot)
+
+    def __iter__(self):
+        for slot in range(self.n):
+            yield self[slot]
+
+    def __getstate__(self) -> dict:
+        # only the live slots are worth serializing, the copy lives in ordinary memory
+        state = dict(self.__dict__)
+        state["_cols"] = {name: col[:self.n].copy() for name, col in self._cols.items()}
+        state["_allocate"] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        state.setdefault("_allocate", None)
+        self.__dict__.update(state)
+
+    def _zeros(self, capacity: int, dtype) -> np.ndarray:
+        if self._allocate is None:
+            return np.zeros(capacity, dtype=dtype)
+        return self._allocate((capacity,), dtype)
+
+    def relocate(self, allocate) -> None:
+        """
+        Move the columns into memory given by allocate, the store keeps allocating there when it grows (see
+        :class:`parallel.SharedArrays`)
+
+        Args:
+            allocate(callable): A function ``allocate(shape, dtype)`` that returns a zeroed numpy array, None for ordinary memory
+        """
+        object.__setattr__(self, "_allocate", allocate)
+        for name, col in self._cols.items():
+            new = self._zeros(len(col), col.dtype)
+            new[:self.n] = col[:self.n]
+            self._cols[name] = new
+
+    @property
+    def capacity(self) -> int:
+        """
+        The number of allocated slots
+        """
+        return len(self._cols["x"])
+
+    def reserve(self, capacity: int) -> None:
+        """
+        Make sure that at least capacity slots are allocated, growing the columns geometrically
+
+        Args:
+            capacity(int): The required number of slots
+        """
+        if capacity <= self.capacity:
+            return
+        capacity = max(capacity, 2 * self.capacity)
+        for name, col in self._cols.items():
+            new = self._zeros(capacity, col.dtype)
+            new[:self.n] = col[:self.n]
+            self._cols[name] = new
+
+    def add(self, **values) -> int:
+        """
+        Append a single agent, fields that aren't given are zeroed
+
+        Args:
+            **values: The value of every field of the new agent. See :data:`agents.FIELDS`
+
+        Returns:
+            int: The slot of the new agent
+        """
+        self.reserve(self.n + 1)
+        slot = self.n
+        for name, col in self._cols.items():
+            col[slot] = values.get(name, 0)  # the slot may still hold a removed agent
+        object.__setattr__(self, "n", slot + 1)
+        return slot
+
+    def extend(self, **columns) -> None:
+        """
+        Append many agents at once, fields that aren't given are zeroed
+
+        Args:
+            **columns: An array for every field of the new agents, all of the same length. See :data:`agents.FIELDS`
+        """
+        count = len(next(iter(columns.values()), ()))
+        self.reserve(self.n + count)
+        for name, col in self._cols.items():
+            col[self.n:self.n + count] = columns.get(name, 0)  # the slots may still hold removed agents
+        object.__setattr__(self, "n", self.n + count)
+
+    def row(self, slot: int) -> dict:
+        """
+        Get all the fields of a single agent
+
+        Args:
+            slot(int): The slot of the agent
+
+        Returns:
+            dict: A mapping of field name to value
+        """
+        return {name: col[slot] for name, col in self._cols.items()}
+
+    def snapshot(self) -> dict:
+        """
+        Copy the state of the store (and its brain arenas)
+
+        Returns:
+            dict: Named arrays, see :meth:`agents.AgentStore.restore`
+        """
+        state = {name: col[:self.n].copy() for name, col in self._cols.items()}
+        for prefix in ("move_brains", "social_brains"):
+            arena = getattr(self, prefix)
+            if arena is not None:
+                state.update({prefix + "/" + name: value for name, value in arena.snapshot().items()})
+        return state
+
+    def restore(self, state: dict) -> None:
+        """
+        Restore the store to a snapshot, see :meth:`agents.AgentStore.snapshot`
+
+        Args:
+            state(dict): The snapshot
+        """
+        n = len(state["x"])
+        for name, col in self._cols.items():
+            self._cols[name] = self._zeros(max(n, 1), col.dtype)
+            self._cols[name][:n] = state[name]
+        object.__setattr__(self, "n", n)
+        for prefix in ("move_brains", "social_brains"):
+            arena = getattr(self, prefix)
+            if arena is not None:
+                arena.restore({name[len(prefix) + 1:]: value for name, value in state.items()
+                               if name.startswith(prefix + "/")})
+
+    def permute(self, order: np.ndarray) -> None:
+        """
+        Reorder the live slots
+
+        Args:
+            order(numpy.ndarray): The old slot of every new slot (as returned by numpy.argsort)
+        """
+        for name, col in self._cols.items():
+            col[:self.n] = col[:self.n][order]
+
+    def release(self, slots: np.ndarray) -> None:
+        """
+        Release the brains of agents that are about to be removed
+
+        Args:
+            slots(numpy.ndarray): The slots of the agents, or a boolean mask over the live slots
+        """
+        if self.move_brains is not None:
+            self.move_brains.free(self.iq[slots], self.move_row[slots])
+        if self.social_brains is not None:
+            self.social_brains.free(self.eq[slots], self.social_row[slots])
+
+    def resize(self, n: int) -> None:
+        """
+        Set the number of live slots, for columns that were rewritten in place (see :class:`parallel.ParallelSim`).
+        Slots past the old number of live slots hold garbage until they are written
+
+        Args:
+            n(int): The number of live slots
+        """
+        self.reserve(n)
+        object.__setattr__(self, "n", n)
+
+    def compact(self, keep: np.ndarray) -> None:
+        """
+        Remove agents, keeping the order of the survivors. The brains of the removed agents are released
+
+        Args:
+            keep(numpy.ndarray): A boolean mask over the live slots, False slots are removed
+        """
+        self.release(~keep)
+        n = int(np.count_nonzero(keep))
+        for name, col in self._cols.items():
+            col[:n] = col[:self.n][keep]
+        object.__setattr__(self, "n", n)
@@ -16,9 +16,15 @@
 # this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from model2 import Sim
 import argparse
 import math
+import os
+import sys
+import time
+
+# environment variables that set the number of threads used by numpy's BLAS/OpenMP backends
+BLAS_THREAD_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "VECLIB_MAXIMUM_THREADS",
+                    "NUMEXPR_NUM_THREADS")
 
 parser = argparse.ArgumentParser(description='Run an ecosystem simulation', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 parser.add_argument("-s", type=int, dest="steps",
@@ -41,6 +47,12 @@ parser.add_argument("-dp", type=int, dest="dp",
 parser.add_argument("--spss", help="output data in SPSS data format. Note that this will NOT force data points to max.",
                     dest="spss", action='store_true')
 
+parser.add_argument("--npz", help="output every recorded statistic to a compressed numpy archive",
+                    dest="npz", action='store_true')
+
+parser.add_argument("--csv", help="output every recorded statistic to a csv file",
+                    dest="csv", action='store_true')
+
 parser.add_argument("--no-excel",
                     help="Don't output data to excel format. Will be enabled automatically if the number of data points exceed " + str(
                         max_e),
@@ -52,34 +64,274 @@ parser.add_argument("--no-plt", help="Don't generate plt preview",
 parser.add_argument("--gui", help="Used to output progress in json format for GUI (in beta)",
                     dest="gui", action='store_true')
 
-args = parser.parse_args()
+parser.add_argument("--checkpoint", type=str, dest="checkpoint",
+                    help="Save keyframes of the run to this .envs file so it can be resumed with --resume")
+
+parser.add_argument("--checkpoint-freq", type=int, dest="checkpoint_freq",
+                    help="How often (in steps) to save keyframes, defaults to every 10%% of steps")
+
+parser.add_argument("--journal", type=str, dest="journal",
+                    help="Stream the recorded statistics to this directory instead of keeping them in memory")
+
+parser.add_argument("--record", type=str, dest="record",
+                    help="Record the agents and the food to this folder, render it later with replay.py")
+
+parser.add_argument("--record-freq", type=int, dest="record_freq",
+                    help="How often (in steps) to record a frame", default=1)
+
+parser.add_argument("--resume", type=str, dest="resume",
+                    help="Resume an interrupted run from a .envs checkpoint. Keyframes keep being saved to the same file unless --checkpoint is given. -s must match the original run")
+
+parser.add_argument("--config", type=str, dest="config",
+                    help="Read the simulation parameters from this file instead of config.ini")
+
+parser.add_argument("--set", type=str, dest="overrides", action="append", metavar="NAME=VALUE",
+                    help="Override a simulation parameter of the config file, e.g. --set FOOD_CONST=20. Can be repeated")
+
+parser.add_argument("--replicates", type=int, dest="replicates",
+                    help="Run this many independent simulations (each with its own random seed and outputs) in a process pool")
+
+parser.add_argument("--workers", type=int, dest="workers",
+                    help="Number of worker processes for --replicates, defaults to the number of cpus")
+
+parser.add_argument("--profile", help="Time every phase of the simulation, the summary is saved to profile.json in the output folder",
+                    dest="profile", action='store_true')
+
+parser.add_argument("--seed", type=int, dest="seed",
+                    help="Seed the random number generator, runs with the same seed and parameters are identical. "
+                         "With --replicates, every replicate's seed is derived from it")
+
+parser.add_argument("--backend", type=str, dest="backend", choices=("numpy", "numba"),
+                    help="Step the agents with numpy, a phase at a time, or with a compiled numba loop that takes one "
+                         "agent at a time through every phase like the original loop (falls back to numpy if numba "
+                         "isn't installed). The backends give different results, resumed runs keep the backend of "
+                         "their checkpoint", default="numpy")
+
+parser.add_argument("--parallel", type=int, dest="parallel", metavar="WORKERS",
+                    help="Step the simulation with this many worker processes, each owning a segment of the ring "
+                         "(see parallel.py). The results are the same as without it, --backend is not used")
+
+
+def replicate_path(path: str, replicate: int) -> str:
+    """
+    Give every replicate of an ensemble its own output file or folder
+
+    Args:
+        path(str): The path given on the command line
+        replicate(int): The replicate number, None if not running an ensemble
+
+    Returns:
+        str: path with the replicate number added before the extension
+    """
+    if path is None or replicate is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return "{}-{}{}".format(root, replicate, ext)
+
+
+def report_progress(queue, replicate: int, sim, steps: int, csteps: int, gui: bool) -> None:
+    """
+    Report the progress of an ensemble replicate, see :meth:`auto.simulate`
+
+    Args:
+        queue: The queue to put (replicate, step, agents, food) tuples on
+        replicate(int): The replicate number
+        sim(Sim): The simulation
+        steps(int): How many steps are there in total
+        csteps(int): The current step number
+        gui(bool): Ignored, the ensemble prints the progress
+    """
+    queue.put((replicate, csteps, len(sim.agents), len(sim.food)))
+
+
+def simulate(args, replicate: int = None, entropy: int = None, name: str = None, progress=None,
+             print_freq: int = None) -> str:
+    """
+    Run a single simulation and write its outputs
+
+    Args:
+        args: The parsed command line arguments
+        replicate(int): The replicate number, None if not running an ensemble
+        entropy(int): The ensemble's seed entropy, every replicate seeds its random number generator from it and its replicate number
+        name(str): The output folder name for the graphs, relative to the graphs folder
+        progress: Called with the simulation and the arguments of :meth:`model2.Sim.progress` instead of printing the progress
+        print_freq(int): How often (in steps) to report the progress, defaults to every 1% of steps
+
+    Returns:
+        str: The folder the requested files are stored at
+    """
+    import numpy as np
+    from model2 import Sim
+    from profiler import PhaseTimer
+    from simconfig import SimConfig
+
+    seed = args.seed if entropy is None else np.random.SeedSequence(entropy, spawn_key=(replicate,))
+
+    if args.parallel is not None:
+        from parallel import ParallelSim
+
+    if args.resume is not None:
+        ms = Sim.load(args.resume) if args.parallel is None else ParallelSim.load(args.resume, args.parallel)
+        if args.checkpoint is None:
+            args.checkpoint = args.resume
+        if args.v:
+            print("resuming from step {}".format(ms.checkpoint_step))
+        if args.profile:
+            ms.profiler = PhaseTimer()
+    elif args.parallel is not None:
+        ms = ParallelSim(args.pop, args.food, journal=replicate_path(args.journal, replicate),
+                         config=SimConfig(args.config, **SimConfig.parse(args.overrides)), seed=seed,
+                         profile=args.profile, workers=args.parallel)
+    else:
+        ms = Sim(args.pop, args.food, journal=replicate_path(args.journal, replicate),
+                 config=SimConfig(args.config, **SimConfig.parse(args.overrides)), seed=seed,
+                 profile=args.profile, backend=args.backend)
+    if progress is not None:
+        ms.progress = lambda steps, csteps, gui: progress(ms, steps, csteps, gui)
+
+    # because this model will only run once, we can maximise the amount of data points without exceeding the maximum of 18277
+    # total_data_points = steps/data_point_freq
+
+    dp = min(args.dp, args.steps)  # make sure that data points is smaller than steps
+    if dp is None:
+        dp = args.steps if args.no_excel else min(args.steps, max_e)
+    data_point_freq = math.floor(args.steps / dp)
+    data_point_freq += 1 if data_point_freq == 0 else 0
+
+    if args.v and replicate is None:
+        print("data point frequency selected {}".format(data_point_freq))
+        print("expected data points: {}".format(args.steps / data_point_freq))
+
+    if args.animate:
+        ms.animate(args.steps, data_point_freq=data_point_freq, gui=args.gui,
+                   **({} if print_freq is None else {"print_freq": print_freq}))
+    else:
+        ms.run(args.steps, print_freq=print_freq, data_point_freq=data_point_freq, gui=args.gui,
+               checkpoint_freq=args.checkpoint_freq,
+               checkpoint_file=replicate_path(args.checkpoint, replicate), start=ms.checkpoint_step,
+               record=replicate_path(args.record, replicate), record_freq=args.record_freq)
+
+    req_formats = ()
+    if not args.no_plt:
+        req_formats += ("plt",)
+    if not args.no_excel:
+        req_formats += ("excel",)
+    if args.spss:
+        req_formats += ("spss",)
+    if args.npz:
+        req_formats += ("npz",)
+    if args.csv:
+        req_formats += ("csv",)
+
+    # runs in a process pool (replicates and server runs) already fill the cpus, write their formats one after the other
+    pooled = replicate is not None or progress is not None
+    folder = ms.graph(info="generated via auto.py", output=req_formats, name=name, workers=1 if pooled else None)
+    if args.parallel is not None:
+        ms.close()  # the workers are also stopped if the run fails, when the simulation is collected
+    if args.profile and replicate is None:
+        print(ms.profiler.report())
+    return folder
+
+
+def ensemble(args) -> int:
+    """
+    Run args.replicates simulations in a process pool, printing a combined progress line whenever a replicate
+    progresses. A replicate that fails is reported and doesn't stop the others
+
+    Args:
+        args: The parsed command line arguments
+
+    Returns:
+        int: The number of replicates that failed
+    """
+    workers = min(args.workers or os.cpu_count(), args.replicates)
+    # every worker gets an equal share of the cpus, this has to be set before numpy is imported
+    threads = max(1, os.cpu_count() // workers)
+    for var in BLAS_THREAD_VARS:
+        os.environ[var] = str(threads)
 
-ms = Sim(args.pop, args.food)
+    import functools
+    import json
+    import multiprocessing
+    import secrets
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+    from profiler import Throughput, format_eta
 
-# because this model will only run once, we can maximise the amount of data points without exceeding the maximum of 18277
-# total_data_points = steps/data_point_freq
+    entropy = secrets.randbits(128) if args.seed is None else args.seed
+    name = "ensemble-" + time.strftime("%d%M%Y%H%M%S", time.localtime())
+    if args.v:
+        print("running {} replicates on {} workers, seed entropy {}".format(args.replicates, workers, entropy))
 
-args.dp = min(args.dp, args.steps)  # make sure that data points is smaller than steps
-if args.dp is None:
-    args.dp = args.steps if args.no_excel else min(args.steps, max_e)
-data_point_freq = math.floor(args.steps / args.dp)
-data_point_freq += 1 if data_point_freq == 0 else 0
+    progress = {}  # replicate -> (step, agents, food)
+    failed = 0
+    throughput = Throughput()  # of all the replicates together
+    with multiprocessing.Manager() as manager, ProcessPoolExecutor(max_workers=workers) as pool:
+        queue = manager.Queue()
+        futures = {pool.submit(simulate, args, replicate, entropy, "{}/replicate-{}".format(name, replicate),
+                               functools.partial(report_progress, queue, replicate)):
+                       replicate for replicate in range(args.replicates)}
+        pending = set(futures)
+        while pending:
+            finished, pending = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+            changed = bool(finished)
+            while not queue.empty():
+                replicate, step, agents, food = queue.get()
+                throughput.add((step - progress.get(replicate, (0,))[0]) * agents)
+                progress[replicate] = (step, agents, food)
+                changed = True
+            if not changed:
+                continue
+            for future in finished:
+                progress[futures[future]] = (args.steps, 0, 0)
+                try:
+                    folder = future.result()
+                except Exception as e:
+                    failed += 1
+                    print("Replicate {} failed: {!r}".format(futures[future], e))
+                    continue
+                print("Replicate {} complete. Requested files are stored at: {}".format(futures[future], folder))
+            steps = sum(p[0] for p in progress.values())
+            speed = throughput.sample(steps, args.steps * args.replicates)
+            if args.gui:
+                print(json.dumps({
+                    "steps": steps // args.replicates,
+                    "food": sum(p[2] for p in progress.values()),
+                    "agents": sum(p[1] for p in progress.values()),
+                    "steps_per_sec": speed["steps_per_sec"],
+                    "agent_steps_per_sec": speed["agent_steps_per_sec"],
+                    "eta": speed["eta"]
+                }))
+                sys.stdout.flush()
+            else:
+                print("{}% replicates done: {} of {} (failed: {}) total population size: {} steps/sec: {:.1f} "
+                      "agents*steps/sec: {:.0f} ETA: {}".format(
+                          round(steps / (args.steps * args.replicates) * 100, 2),
+                          args.replicates - len(pending), args.replicates, failed,
+                          sum(p[1] for p in progress.values()),
+                          speed["steps_per_sec"], speed["agent_steps_per_sec"], format_eta(speed["eta"])))
+    return failed
 
-if args.v:
-    print("data point frequency selected {}".format(data_point_freq))
-    print("expected data points: {}".format(args.steps / data_point_freq))
 
-if args.animate:
-    ms.animate(args.steps, data_point_freq=data_point_freq, gui=args.gui)
-else:
-    ms.run(args.steps, data_point_freq=data_point_freq, gui=args.gui)
+def main() -> None:
+    args = parser.parse_args()
+    from simconfig import SimConfig
+    try:
+        SimConfig(args.config, **SimConfig.parse(args.overrides))
+    except ValueError as e:
+        parser.error(str(e))
+    if args.replicates is None:
+        from export import ExportError
+        try:
+            print("Simulation complete. Requested files are stored at: " + simulate(args))
+        except ExportError as e:
+            print(e)
+            sys.exit(1)
+        return
+    if args.resume is not None:
+        parser.error("--resume can't be used with --replicates")
+    if ensemble(args):
+        sys.exit(1)
 
-req_formats = ()
-if not args.no_plt:
-    req_formats += ("plt",)
-if not args.no_excel:
-    req_formats += ("excel",)
-if args.spss:
-    req_formats += ("spss",)
 
-print("Simulation complete. Requested files are stored at: " + ms.graph(info="generated via auto.py", output=req_formats))
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+
+# Ecosystem project - studying natural biological systems using a simulated ecosystem and reinforcement learning.
+# Copyright (C) 2020 Inbar Koursh
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import importlib.metadata
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import kernels
+
+SEED = 20200101  # every benchmark starts from the same state, so runs on the same machine are comparable
+
+SIZES = (500, 2000, 10000, 50000, 100000)  # the population sizes of the step benchmark
+QUICK_SIZES = (500, 2000)
+
+FORMATS = ("plt", "excel", "spss", "npz", "csv")
+
+# importing model2 must stay fast for compute only workers: it may not load the plotting and export libraries and may
+# not create anything in the working directory
+IMPORT_BUDGET = 0.5  # seconds
+HEAVY_MODULES = ("matplotlib", "PIL", "openpyxl", "savReaderWriter")
+
+_IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import model2
+print(json.dumps({"seconds": time.perf_counter() - start,
+                  "loaded": [name for name in %r if name in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def measure(fn, repeat: int = 5) -> float:
+    """
+    Time a function
+
+    Args:
+        fn: The function to time, called without arguments
+        repeat(int): The number of calls
+
+    Returns:
+        float: The median time of a call, in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def result(name: str, seconds: float, steps: int = None, agent_steps: int = None, **params) -> dict:
+    """
+    Make a benchmark result
+
+    Args:
+        name(str): The name of the benchmark
+        seconds(float): The measured time, of all the steps if the benchmark runs steps and of one call otherwise
+        steps(int): The number of steps run in that time, if the benchmark runs steps
+        agent_steps(int): The number of agents updated in that time (summed over the steps)
+        **params: The parameters of the benchmark, e.g. the population size
+
+    Returns:
+        dict: The result, as stored in the JSON output
+    """
+    res = {"name": name, "params": params, "seconds": seconds}
+    if steps is not None:
+        res["steps_per_sec"] = steps / seconds
+    if agent_steps is not None:
+        res["agent_steps_per_sec"] = agent_steps / seconds
+    return res
+
+
+def bench_step(sizes, steps: int, backend: str = "numpy", workers: int = None) -> list:
+    """
+    Time :meth:`model2.Sim.step`, at every population size
+
+    Args:
+        sizes(list[int]): The initial population sizes
+        steps(int): The number of steps to run at every size, stops early if the population dies
+        backend(str): The step backend, see :class:`model2.Sim`. The warm up step compiles the numba kernels
+        workers(int): Step a :class:`parallel.ParallelSim` with this many worker processes instead
+
+    Returns:
+        list[dict]: A result per size
+    """
+    from model2 import Sim
+    from parallel import ParallelSim
+    results = []
+    for n in sizes:
+        sim = Sim(n, seed=SEED, backend=backend) if workers is None else ParallelSim(n, seed=SEED, workers=workers)
+        try:
+            sim.step()  # warm up
+            agent_steps = 0
+            done = 0
+            start = time.perf_counter()
+            while done < steps:
+                agent_steps += len(sim.agents)
+                done += 1
+                if not sim.step():
+                    break
+            seconds = time.perf_counter() - start
+        finally:
+            if workers is not None:
+                sim.close()
+        if workers is None:
+            results.append(result("step", seconds, done, agent_steps, agents=n, backend=backend))
+        else:
+            results.append(result("parallel_step", seconds, done, agent_steps, agents=n, workers=workers))
+    return results
+
+
+def bench_import(repeat: int) -> list:
+    """
+    Time a cold import of model2, each in a fresh interpreter started in an empty folder. The result also lists the
+    heavy modules that were loaded (see :data:`bench.HEAVY_MODULES`) and the files the import created
+
+    Args:
+        repeat(int): The number of imports to time
+
+    Returns:
+        list[dict]: A single result
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.dirname(os.path.realpath(__file__)),
+                                                      env.get("PYTHONPATH")]))
+    times = []
+    loaded = set()
+    created = set()
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as tmp:
+            out = subprocess.run([sys.executable, "-c", _IMPORT_PROBE], cwd=tmp, env=env, capture_output=True,
+                                 text=True, check=True).stdout
+            probe = json.loads(out.strip().splitlines()[-1])
+            times.append(probe["seconds"])
+            loaded.update(probe["loaded"])
+            created.update(os.listdir(tmp))
+    res = result("import", float(np.median(times)), module="model2")
+    res["loaded"] = sorted(loaded)
+    res["created"] = sorted(created)
+    return [res]
+
+
+def check_import(res: dict, budget: float) -> list:
+    """
+    Check an import result against the import budget
+
+    Args:
+        res(dict): The result of :meth:`bench.bench_import`
+        budget(float): The maximum import time, in seconds
+
+    Returns:
+        list[str]: The problems, empty if the import is within the budget
+    """
+    problems = []
+    if res["seconds"] > budget:
+        problems.append("importing model2 took {:.3f}s, the budget is {:.3f}s".format(res["seconds"], budget))
+    if res["loaded"]:
+        problems.append("importing model2 loaded " + ", ".join(res["loaded"]))
+    if res["created"]:
+        problems.append("importing model2 created " + ", ".join(res["created"]))
+    return problems
+
+
+def bench_feed_forward(n: int, repeat: int) -> list:
+    """
+    Time feeding n move brains forward one at a time (:meth:`nn.NeuralNetwork.feed_forward`) and batched by topology
+    from an arena (:meth:`nn.BrainArena.feed_forward`)
+
+    Args:
+        n(int): The number of networks
+        repeat(int): The number of calls to time
+
+    Returns:
+        list[dict]: A result per method
+    """
+    from model2 import move_topology
+    from nn import BrainArena, NeuralNetwork
+    rng = np.random.default_rng(SEED)
+    iq = rng.integers(1, 10, n)
+    xs = rng.random((n, 3))
+    networks = [NeuralNetwork(move_topology(i), rng) for i in iq]
+    arena = BrainArena(move_topology)
+    rows = arena.alloc(iq)
+    arena.randomize(iq, rows, rng)
+    return [
+        result("feed_forward", measure(lambda: [network.feed_forward(x) for network, x in zip(networks, xs)], repeat),
+               agent_steps=n, networks=n, method="single"),
+        result("feed_forward", measure(lambda: arena.feed_forward(iq, rows, xs), repeat), agent_steps=n,
+               networks=n, method="arena"),
+    ]
+
+
+def bench_stats(sizes, repeat: int) -> list:
+    """
+    Time :meth:`model2.Sim.group`, :meth:`model2.Sim.update_stats` and :meth:`model2.Sim._breed` (every agent breeds
+    once, on a copy restored before every call)
+
+    Args:
+        sizes(list[int]): The population sizes
+        repeat(int): The number of calls to time
+
+    Returns:
+        list[dict]: A result per function and size
+    """
+    from model2 import Sim
+    results = []
+    for n in sizes:
+        sim = Sim(n, seed=SEED)
+        sim.step()
+        agents = len(sim.agents)
+        results.append(result("group", measure(sim.group, repeat), agent_steps=agents, agents=n))
+        results.append(result("update_stats", measure(sim.update_stats, repeat), agent_steps=agents, agents=n))
+
+        state = sim.snapshot()
+        parents = np.arange(agents)
+        draws = np.random.default_rng(SEED).random((4, agents))
+        times = []
+        for _ in range(repeat):
+            sim.restore(state)
+            start = time.perf_counter()
+            sim._breed(parents, draws)
+            times.append(time.perf_counter() - start)
+        results.append(result("breed", float(np.median(times)), agent_steps=agents, agents=n))
+    return results
+
+
+def bench_graph(n: int, steps: int, repeat: int) -> list:
+    """
+    Time writing the outputs of :meth:`model2.Sim.graph` (see :meth:`export.export`), one output format at a time.
+    The outputs are written to a temporary folder
+
+    Args:
+        n(int): The initial population size
+        steps(int): The number of steps to run, a data point is recorded every step
+        repeat(int): The number of calls to time
+
+    Returns:
+        list[dict]: A result per format, formats that fail are skipped
+    """
+    import export
+    from model2 import Sim
+    sim = Sim(n, seed=SEED)
+    for _ in range(steps):
+        if not sim.step():
+            break
+        sim.update_stats()
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for ro in FORMATS:
+            errors = {}
+            names = iter(range(repeat))
+
+            def write():
+                fn = os.path.join(tmp, "bench-{}-{}".format(ro, next(names)))
+                os.makedirs(fn)
+                errors.update(export.export(fn, sim.sink, (ro,), list(Sim.GRAPHED), list(Sim.GRAPH_TITLES), "",
+                                            list(Sim.STATS), workers=1))
+
+            seconds = measure(write, repeat)
+            if errors:  # a failed format would report the time it took to fail
+                print("skipping {}: {!r}".format(ro, errors[ro]))
+                continue
+            results.append(result("graph", seconds, data_points=len(sim.sink), format=ro))
+    return results
+
+
+def machine() -> dict:
+    """
+    Describe the machine and the code the benchmarks ran on
+
+    Returns:
+        dict: The commit, the python, numpy and numba (None if it isn't installed) versions and the platform
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.realpath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "numba": importlib.metadata.version("numba") if kernels.available() else None,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "seed": SEED,
+    }
+
+
+def key(res: dict) -> str:
+    return res["name"] + json.dumps(res["params"], sort_keys=True)
+
+
+def compare(results: list, baseline: dict) -> None:
+    """
+    Print the speedup of every benchmark over a previous run
+
+    Args:
+        results(list[dict]): The results of this run
+        baseline(dict): The JSON output of the previous run
+    """
+    old = {key(res): res for res in baseline["results"]}
+    print("compared to {} ({})".format(baseline["machine"]["commit"], baseline["machine"]["date"]))
+    for res in results:
+        if key(res) in old:
+            print("{:<60} {:6.2f}x".format(key(res), old[key(res)]["seconds"] / res["seconds"]))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the simulation hot paths',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-o", type=str, dest="out", help="Write the results to this JSON file",
+                        default="bench.json")
+    parser.add_argument("--compare", type=str, dest="compare",
+                        help="Print the speedup over the results in this JSON file (from the same machine)")
+    parser.add_argument("--quick", help="Only run the small sizes, for a smoke test", dest="quick",
+                        action='store_true')
+    parser.add_argument("--sizes", type=int, nargs="+", dest="sizes", help="The population sizes of the step benchmark")
+    parser.add_argument("--steps", type=int, dest="steps", help="Number of steps timed at every population size",
+                        default=20)
+    parser.add_argument("--repeat", type=int, dest="repeat", help="Number of calls timed by the other benchmarks",
+                        default=5)
+    parser.add_argument("--skip-graph", help="Don't time the output formats", dest="skip_graph", action='store_true')
+    parser.add_argument("--import-budget", type=float, dest="import_budget",
+                        help="Fail if a cold import of model2 takes longer (in seconds), loads a plotting or export "
+                             "library or creates files", default=IMPORT_BUDGET)
+    parser.add_argument("--parallel", type=int, nargs="+", dest="parallel", metavar="WORKERS",
+                        help="Also time the step benchmark with these numbers of worker processes (see parallel.py)")
+    args = parser.parse_args()
+
+    sizes = args.sizes or (QUICK_SIZES if args.quick else SIZES)
+    results = []
+    for bench in (lambda: bench_import(args.repeat),
+                  lambda: bench_step(sizes, args.steps),
+                  lambda: bench_step(sizes, args.steps, "numba") if kernels.available() else [],
+                  lambda: [res for workers in args.parallel or () for res in bench_step(sizes, args.steps,
+                                                                                           workers=workers)],
+                  lambda: bench_feed_forward(1000 if args.quick else 10000, args.repeat),
+                  lambda: bench_stats(sizes, args.repeat),
+                  lambda: [] if args.skip_graph else bench_graph(500, 200 if args.quick else 2000, args.repeat)):
+        for res in bench():
+            results.append(res)
+            print("{:<60} {:10.6f}s".format(key(res), res["seconds"]) +
+                  ("  {:10.1f} steps/sec".format(res["steps_per_sec"]) if "steps_per_sec" in res else "") +
+                  ("  {:12.1f} agents*steps/sec".format(res["agent_steps_per_sec"])
+                   if "agent_steps_per_sec" in res else ""))
+            sys.stdout.flush()
+
+    with open(args.out, "w") as f:
+        json.dump({"machine": machine(), "results": results}, f, indent=2)
+    print("results written to " + args.out)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+    problems = check_import(results[0], args.import_budget)
+    for problem in problems:
+        print("FAIL " + problem)
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
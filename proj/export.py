@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+
+# Ecosystem project - studying natural biological systems using a simulated ecosystem and reinforcement learning.
+# Copyright (C) 2020 Inbar Koursh
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import zipfile
+
+import numpy as np
+
+# the plotting and spreadsheet libraries are slow to import, every writer imports what it needs when it is called
+
+EXCEL_MAX_ROWS = 1048576
+
+
+class ExportError(Exception):
+    """
+    Raised when some of the requested formats couldn't be written, the other formats are still written
+
+    Args:
+        folder(str): The output folder
+        errors(dict): The exception raised by every format that failed, see :meth:`export.export`
+
+    Attributes:
+        folder(str): The output folder
+        errors(dict): The exception raised by every format that failed
+    """
+
+    def __init__(self, folder: str, errors: dict) -> None:
+        super().__init__("error in generating {} file in {}: {}".format(
+            ", ".join(errors), folder, "; ".join("{}: {!r}".format(ro, e) for ro, e in errors.items())))
+        self.folder = folder
+        self.errors = errors
+
+
+def rows(sink, columns: list):
+    """
+    Read recorded statistics a row at a time, only one chunk of rows is in memory at once
+
+    Args:
+        sink(StatsBuffer): The recorded statistics, see :class:`journal.StatsBuffer`
+        columns(list[str]): The statistics to read, a statistic may be repeated
+
+    Yields:
+        list: The value of every requested statistic at a single data point
+    """
+    for chunk in sink.chunks(list(dict.fromkeys(columns))):
+        yield from np.stack([chunk[name] for name in columns], axis=1).tolist()
+
+
+def decimate(x: np.ndarray, y: np.ndarray, buckets: int):
+    """
+    Downsample a series for plotting: the points are split into buckets and only the minimum and the maximum of every
+    bucket are kept (in their original order), so every spike is still visible at the plotted resolution.
+
+    Args:
+        x(numpy.ndarray): The x values
+        y(numpy.ndarray): The y values
+        buckets(int): The number of buckets, usually the width of the plot in pixels
+
+    Returns:
+        (tuple): tuple containing:
+            (numpy.ndarray): The kept x values
+            (numpy.ndarray): The kept y values, at most 2 * buckets of them
+    """
+    n = len(y)
+    if n <= 2 * buckets:
+        return x, y
+    size = -(-n // buckets)  # points per bucket
+    grid = np.concatenate([y, np.full(-n % size, np.nan)]).reshape(-1, size)
+    missing = np.isnan(grid)  # padding and nan values are never picked, unless the whole bucket is missing
+    lo = np.where(missing, np.inf, grid).argmin(axis=1)
+    hi = np.where(missing, -np.inf, grid).argmax(axis=1)
+    start = np.arange(len(grid)) * size
+    picks = np.sort(np.stack([start + lo, start + hi], axis=1), axis=1).ravel()
+    return x[picks], y[picks]
+
+
+def write_plt(fn: str, sink, columns: list, titles: list, title: str) -> str:
+    """
+    Plot every statistic over time in a png file, the final values are added as png metadata.
+    The statistics are read a chunk at a time (see :meth:`journal.StatsBuffer.chunks`) and every chunk is decimated to
+    its share of the pixel width of the figure (see :meth:`export.decimate`), so a whole column is never in memory. The
+    tabular outputs keep the full resolution.
+
+    Args:
+        fn(str): The output folder
+        sink(StatsBuffer): The recorded statistics
+        columns(list[str]): The statistics to plot
+        titles(list[str]): The y label of every statistic
+        title(str): The title of the plot
+
+    Returns:
+        str: The file name
+    """
+    if len(titles) != len(columns):
+        raise Exception("Error len of titles must match len of vars")
+
+    import matplotlib.pyplot as plt
+    from PIL import Image  # work with metadata via pillow
+    from PIL import PngImagePlugin
+
+    fig, axs = plt.subplots(len(columns), sharex='all', figsize=(20, 60))
+    metadata = dict()
+    buckets = int(fig.get_size_inches()[0] * fig.dpi)
+    names = list(dict.fromkeys(columns))
+    xs = {name: [] for name in names}  # the decimated points of every chunk
+    ys = {name: [] for name in names}
+    top = dict.fromkeys(names, -np.inf)
+    last = dict.fromkeys(names)
+    for chunk in sink.chunks(list(dict.fromkeys(["i_OT"] + names))):
+        share = max(1, -(-buckets * len(chunk["i_OT"]) // len(sink)))
+        for name in names:
+            x, y = decimate(chunk["i_OT"], chunk[name], share)
+            xs[name].append(np.array(x))  # copied out of the chunk, which may be memory mapped
+            ys[name].append(np.array(y))
+            top[name] = np.fmax.reduce(chunk[name], initial=top[name])  # nan values are ignored
+            last[name] = chunk[name][-1]
+    for i in range(len(columns)):
+        name = columns[i]
+        axs[i].plot(np.concatenate(xs[name] + [np.empty(0)]), np.concatenate(ys[name] + [np.empty(0)]),
+                    linewidth=0.25)
+        if np.isfinite(top[name]):
+            axs[i].axes.set_ylim([0, top[name]])
+        axs[i].set_ylabel(titles[i])
+
+        metadata["Final" + titles[i]] = last[name]
+
+    axs[0].axes.set_xlim([0, len(sink)])
+    axs[0].set_title(title)
+
+    axs[-1].set_xlabel("Number Of Data Points")
+
+    plt.tight_layout()
+    plt.autoscale()
+
+    pltfn = fn + "/plt.png"
+    fig.savefig(pltfn, bbox_inches='tight')  # save graph
+    plt.close(fig)
+    # add metadata:
+    im = Image.open(pltfn)
+    meta = PngImagePlugin.PngInfo()
+    for x in metadata:
+        meta.add_text(x, str(metadata[x]))
+    im.save(pltfn, "png", pnginfo=meta)
+    return pltfn
+
+
+def write_excel(fn: str, sink, columns: list, titles: list) -> str:
+    """
+    Write the statistics to an excel spreadsheet, a row per data point
+
+    Args:
+        fn(str): The output folder
+        sink(StatsBuffer): The recorded statistics
+        columns(list[str]): The statistics to write
+        titles(list[str]): The header of every column
+
+    Returns:
+        str: The file name, or None if there are too many data points for excel
+    """
+    if len(sink) > EXCEL_MAX_ROWS:
+        print("to manny data points, skipping excel")
+        return None
+    import openpyxl  # work with excel
+
+    wb = openpyxl.Workbook(write_only=True)
+    sheet = wb.create_sheet()
+    sheet.append(titles)
+    for row in rows(sink, columns):
+        sheet.append(row)
+    wb.save(fn + "/excel.xlsx")
+    return fn + "/excel.xlsx"
+
+
+def write_spss(fn: str, sink, columns: list, titles: list) -> str:
+    """
+    Write the statistics to an spss compatible file
+
+    Args:
+        fn(str): The output folder
+        sink(StatsBuffer): The recorded statistics
+        columns(list[str]): The statistics to write
+        titles(list[str]): The name of every variable, spaces are replaced with underscores
+
+    Returns:
+        str: The file name
+    """
+    import savReaderWriter  # work with spss
+
+    savFileName = fn + '/spss.sav'
+    varNames = [i.replace(" ", "_") for i in titles]
+    varTypes = dict()
+    for t in varNames:
+        varTypes[t] = 0
+    with savReaderWriter.SavWriter(savFileName, varNames, varTypes) as writer:
+        for chunk in sink.chunks(list(dict.fromkeys(columns))):
+            writer.writerows(np.stack([chunk[name] for name in columns], axis=1).tolist())
+    return savFileName
+
+
+def write_npz(fn: str, sink, columns: list) -> str:
+    """
+    Write every statistic to a compressed numpy archive, one array per statistic.
+    Every array is streamed into the archive a chunk at a time (see :meth:`journal.StatsBuffer.chunks`), so a whole
+    column is never in memory.
+
+    Args:
+        fn(str): The output folder
+        sink(StatsBuffer): The recorded statistics
+        columns(list[str]): The statistics to write
+
+    Returns:
+        str: The file name, load it with numpy.load
+    """
+    npzfn = fn + "/stats.npz"
+    with zipfile.ZipFile(npzfn, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        for name in columns:
+            with zf.open(name + ".npy", "w", force_zip64=True) as f:
+                np.lib.format.write_array_header_1_0(f, {"descr": np.lib.format.dtype_to_descr(np.dtype(float)),
+                                                         "fortran_order": False, "shape": (len(sink),)})
+                for chunk in sink.chunks([name]):
+                    f.write(np.ascontiguousarray(chunk[name], dtype=float).tobytes())
+    return npzfn
+
+
+def write_csv(fn: str, sink, columns: list) -> str:
+    """
+    Write every statistic to a csv file, a row per data point and a header with the name of every statistic
+
+    Args:
+        fn(str): The output folder
+        sink(StatsBuffer): The recorded statistics
+        columns(list[str]): The statistics to write
+
+    Returns:
+        str: The file name
+    """
+    csvfn = fn + "/stats.csv"
+    with open(csvfn, "w") as f:
+        f.write(",".join(columns) + "\n")
+        for chunk in sink.chunks(columns):
+            np.savetxt(f, np.stack([chunk[name] for name in columns], axis=1), delimiter=",", fmt="%.17g")
+    return csvfn
+
+
+def export(fn: str, sink, output, columns: list, titles: list, title: str, stats: list, workers: int = None) -> dict:
+    """
+    Write the recorded statistics in every requested format, the formats are written concurrently by worker processes.
+    The exporters read the statistics chunk by chunk (see :meth:`journal.StatsBuffer.chunks`), so a journaled sink is
+    never loaded into memory as a whole.
+
+    Args:
+        fn(str): The output folder, it must exist
+        sink(StatsBuffer): The recorded statistics
+        output(Tuple[str]): The formats to write, any of "plt", "excel", "spss", "npz" and "csv"
+        columns(list[str]): The statistics used by the plt, excel and spss outputs
+        titles(list[str]): The title of every statistic in columns
+        title(str): The title of the plt plot
+        stats(list[str]): The statistics written to the npz and csv outputs
+        workers(int): The number of worker processes, defaults to one per format. If 1, the formats are written one after the other in this process
+
+    Returns:
+        dict: The exception raised by every format that failed
+    """
+    jobs = {
+        "plt": (write_plt, fn, sink, columns, titles, title),
+        "excel": (write_excel, fn, sink, columns, titles),
+        "spss": (write_spss, fn, sink, columns, titles),
+        "npz": (write_npz, fn, sink, stats),
+        "csv": (write_csv, fn, sink, stats),
+    }
+    jobs = {ro: jobs[ro] for ro in output if ro in jobs}
+    if workers is None:
+        workers = len(jobs)
+
+    errors = dict()
+    if workers <= 1:
+        for ro, job in jobs.items():
+            try:
+                job[0](*job[1:])
+            except Exception as e:
+                errors[ro] = e
+        return errors
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {ro: pool.submit(*job) for ro, job in jobs.items()}
+        for ro, future in futures.items():
+            e = future.exception()
+            if e is not None:
+                errors[ro] = e
+    return errors
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+# Ecosystem project - studying natural biological systems using a simulated ecosystem and reinforcement learning.
+# Copyright (C) 2020 Inbar Koursh
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+
+
+class FoodPool:
+    """
+    A fixed capacity pool of food items.
+
+    Food items are only positions, they are kept sorted in a single preallocated array and the first len(pool) slots are
+    alive. Eating compacts the array in place and regrowing draws new positions into it, so the memory used for food
+    never changes during a run.
+
+    Args:
+        capacity(int): The maximum number of food items
+
+    Attributes:
+        n(int): The number of food items that are alive
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self._x = np.empty(capacity)
+        self.n = 0
+
+    @property
+    def x(self) -> np.ndarray:
+        """
+        The sorted positions of the food items that are alive (a view, valid until the pool changes)
+        """
+        return self._x[:self.n]
+
+    def relocate(self, allocate) -> None:
+        """
+        Move the food into memory given by allocate (see :class:`parallel.SharedArrays`)
+
+        Args:
+            allocate(callable): A function ``allocate(shape, dtype)`` that returns a zeroed numpy array, None for ordinary memory
+        """
+        x = np.empty(self._x.shape) if allocate is None else allocate(self._x.shape, self._x.dtype)
+        x[:self.n] = self.x
+        self._x = x
+
+    @property
+    def capacity(self) -> int:
+        """
+        The maximum number of food items
+        """
+        return len(self._x)
+
+    def __len__(self) -> int:
+        return self.n
+
+    def regrow(self, rng=None) -> None:
+        """
+        Replace all the food with a full pool of uniformly distributed food items
+
+        Args:
+            rng(numpy.random.Generator): The random number generator to use, defaults to the global one
+        """
+        self._x[:] = (np.random if rng is None else rng).uniform(-1, 1, self.capacity)
+        self._x.sort()
+        self.n = self.capacity
+
+    def snapshot(self) -> dict:
+        """
+        Copy the food that is alive
+
+        Returns:
+            dict: Named arrays, see :meth:`food.FoodPool.restore`
+        """
+        return {"x": self.x.copy()}
+
+    def restore(self, state: dict) -> None:
+        """
+        Restore the pool to a snapshot, see :meth:`food.FoodPool.snapshot`
+
+        Args:
+            state(dict): The snapshot, it must fit in the pool
+        """
+        self.n = len(state["x"])
+        self._x[:self.n] = state["x"]
+
+    def remove(self, eaten: np.ndarray) -> None:
+        """
+        Remove food items, the remaining food stays sorted
+
+        Args:
+            eaten(numpy.ndarray): A boolean mask over the alive food items, True items are removed
+        """
+        left = self.x[~eaten]
+        self.n = len(left)
+        self._x[:self.n] = left
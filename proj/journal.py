@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+# Ecosystem project - studying natural biological systems using a simulated ecosystem and reinforcement learning.
+# Copyright (C) 2020 Inbar Koursh
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import glob
+import json
+import os
+
+import numpy as np
+
+
+class StatsBuffer:
+    """
+    An in-memory statistics sink. Every data point is a row with a float value for every column.
+
+    Args:
+        names(list[str]): The names of the columns
+        capacity(int): The initial number of allocated rows
+
+    Attributes:
+        names(tuple[str]): The names of the columns
+    """
+
+    def __init__(self, names, capacity: int = 1024) -> None:
+        self.names = tuple(names)
+        self._index = {name: i for i, name in enumerate(self.names)}
+        self._data = np.empty((len(self.names), capacity))
+        self._n = 0
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __getstate__(self) -> dict:
+        # only the recorded rows are worth sending to another process
+        state = dict(self.__dict__)
+        state["_data"] = self._data[:, :max(self._n, 1)].copy()
+        return state
+
+    def append(self, row: dict) -> None:
+        """
+        Record a data point
+
+        Args:
+            row(dict): The value of every column
+        """
+        if self._n == self._data.shape[1]:
+            grown = np.empty((len(self.names), 2 * self._data.shape[1]))
+            grown[:, :self._n] = self._data[:, :self._n]
+            self._data = grown
+        for name, value in row.items():
+            self._data[self._index[name], self._n] = value
+        self._n += 1
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        Read a whole column
+
+        Args:
+            name(str): The name of the column
+
+        Returns:
+            numpy.ndarray: The column's values
+        """
+        return self._data[self._index[name], :self._n]
+
+    def last(self) -> dict:
+        """
+        Read the most recent data point
+
+        Returns:
+            dict: The value of every column, None if nothing was recorded
+        """
+        if not self._n:
+            return None
+        return {name: float(self._data[i, self._n - 1]) for i, name in enumerate(self.names)}
+
+    def chunks(self, names=None, size: int = 65536):
+        """
+        Read the data a chunk of rows at a time
+
+        Args:
+            names(list[str]): The columns to read, defaults to all of them
+            size(int): The maximum number of rows in a chunk
+
+        Yields:
+            dict: An array of values for every column
+        """
+        names = self.names if names is None else names
+        for start in range(0, self._n, size):
+            yield {name: self._data[self._index[name], start:min(start + size, self._n)] for name in names}
+
+    def truncate(self, n: int) -> None:
+        """
+        Drop every data point after the first n
+
+        Args:
+            n(int): The number of data points to keep
+        """
+        self._n = min(self._n, n)
+
+    def flush(self) -> None:
+        """
+        Make sure the recorded data is stored (nothing to do in memory)
+        """
+
+
+class StatsJournal(StatsBuffer):
+    """
+    A statistics sink that streams data points to a directory as the run proceeds, so memory stays bounded regardless
+    of the length of the run and a crash doesn't lose the collected data.
+
+    Data points are buffered in a fixed size chunk. Every full chunk is written to its own ``.npy`` file as a
+    (columns x rows) matrix, so a column of a chunk is contiguous on disk and is read back lazily with a memory map.
+    :meth:`journal.StatsJournal.flush` also writes the partially filled chunk.
+    Opening a directory that already holds a journal continues it, unless new is set.
+
+    Args:
+        path(str): The journal directory
+        names(list[str]): The names of the columns, ignored if the journal already exists
+        chunk_size(int): The number of data points in every chunk, ignored if the journal already exists
+        new(bool): Start an empty journal, the data of a journal that is already in the directory is deleted
+
+    Attributes:
+        path(str): The journal directory
+        chunk_size(int): The number of data points in every chunk
+    """
+
+    def __init__(self, path: str, names=None, chunk_size: int = 4096, new: bool = False) -> None:
+        self.path = path
+        header = os.path.join(path, "journal.json")
+        if new:
+            for file in glob.glob(os.path.join(path, "chunk-*.npy")) + [self._partial_file(), header]:
+                if os.path.isfile(file):
+                    os.remove(file)
+        if os.path.isfile(header):
+            with open(header) as f:
+                meta = json.load(f)
+            names = meta["names"]
+            chunk_size = meta["chunk_size"]
+        else:
+            os.makedirs(path, exist_ok=True)
+            with open(header, "w") as f:
+                json.dump({"names": list(names), "chunk_size": chunk_size}, f)
+        super().__init__(names, chunk_size)
+        self.chunk_size = chunk_size
+        self._chunks = len(glob.glob(os.path.join(path, "chunk-*.npy")))
+        partial = self._partial_file()
+        if os.path.isfile(partial):
+            data = np.load(partial)
+            self._data[:, :data.shape[1]] = data
+            self._n = data.shape[1]
+
+    def _chunk_file(self, i: int) -> str:
+        return os.path.join(self.path, "chunk-{:06d}.npy".format(i))
+
+    def _partial_file(self) -> str:
+        return os.path.join(self.path, "partial.npy")
+
+    def _save(self, file: str, data: np.ndarray) -> None:
+        with open(file + ".tmp", "wb") as f:  # write then move so a crash never leaves a broken chunk
+            np.save(f, data)
+        os.replace(file + ".tmp", file)
+
+    def __getstate__(self) -> dict:
+        return dict(self.__dict__)  # the chunk buffer keeps its fixed size
+
+    def __len__(self) -> int:
+        return self._chunks * self.chunk_size + self._n
+
+    def append(self, row: dict) -> None:
+        super().append(row)
+        if self._n == self.chunk_size:
+            self._save(self._chunk_file(self._chunks), self._data)
+            self._chunks += 1
+            self._n = 0
+            if os.path.isfile(self._partial_file()):
+                os.remove(self._partial_file())
+
+    def flush(self) -> None:
+        """
+        Write the partially filled chunk to disk
+        """
+        self._save(self._partial_file(), self._data[:, :self._n])
+
+    def last(self) -> dict:
+        if self._n or not self._chunks:
+            return super().last()
+        data = np.load(self._chunk_file(self._chunks - 1), mmap_mode="r")
+        return {name: float(data[i, -1]) for i, name in enumerate(self.names)}
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        Read a whole column into memory, e.g. for :attr:`model2.Sim.mass_OT`. The exporters read the journal with
+        :meth:`journal.StatsJournal.chunks` instead
+
+        Args:
+            name(str): The name of the column
+
+        Returns:
+            numpy.ndarray: The column's values
+        """
+        return np.concatenate([chunk[name] for chunk in self.chunks([name])] + [np.empty(0)])
+
+    def chunks(self, names=None, size: int = None):
+        """
+        Read the data a chunk at a time, chunks on disk are memory mapped
+
+        Args:
+            names(list[str]): The columns to read, defaults to all of them
+            size(int): Ignored, the journal's chunk size is used
+
+        Yields:
+            dict: An array of values for every column
+        """
+        names = self.names if names is None else names
+        for i in range(self._chunks):
+            data = np.load(self._chunk_file(i), mmap_mode="r")
+            yield {name: data[self._index[name]] for name in names}
+        if self._n:
+            yield {name: self._data[self._index[name], :self._n] for name in names}
+
+    def truncate(self, n: int) -> None:
+        if n >= len(self):
+            return
+        full, rest = divmod(n, self.chunk_size)
+        if full < self._chunks:
+            self._data[:] = np.load(self._chunk_file(full))
+            for i in range(full, self._chunks):
+                os.remove(self._chunk_file(i))
+            self._chunks = full
+        self._n = rest
+        self.flush()
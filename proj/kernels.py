@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+
+# Ecosystem project - studying natural biological systems using a simulated ecosystem and reinforcement learning.
+# Copyright (C) 2020 Inbar Koursh
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import importlib.util
+import types
+
+import numpy as np
+
+# the step backends of :class:`model2.Sim`
+BACKENDS = ("numpy", "numba")
+
+_compiled = None
+
+
+def available() -> bool:
+    """
+    Check if numba is installed, without importing it
+
+    Returns:
+        bool: If the numba backend can be used
+    """
+    return importlib.util.find_spec("numba") is not None
+
+
+def resolve_backend(backend: str) -> str:
+    """
+    Pick the backend a simulation will use, the numba backend falls back to numpy if numba isn't installed
+
+    Args:
+        backend(str): The requested backend, one of :data:`kernels.BACKENDS`
+
+    Returns:
+        str: The backend to use
+
+    Raises:
+        ValueError: If the backend is unknown
+    """
+    if backend not in BACKENDS:
+        raise ValueError("Unknown backend {}, expected one of {}".format(backend, ", ".join(BACKENDS)))
+    if backend == "numba" and not available():
+        print("WARNING numba is not installed, using the numpy backend")
+        return "numpy"
+    return backend
+
+
+def load():
+    """
+    Compile the kernels with numba, once per process (the machine code is cached on disk between processes)
+
+    Returns:
+        A namespace with the compiled :func:`kernels.step`
+    """
+    global _compiled, feed_forward
+    if _compiled is None:
+        import numba  # slow to import, only loaded when the backend is used
+
+        jit = numba.njit(cache=True, nogil=True)
+        feed_forward = jit(feed_forward)  # the step kernel calls it, so it has to be compiled first
+        _compiled = types.SimpleNamespace(step=jit(step))
+    return _compiled
+
+
+def brain_tables(arena) -> tuple:
+    """
+    Gather the parameter matrices of a :class:`nn.BrainArena` in the form :func:`kernels.step` reads them. The
+    numba backend has to be loaded (see :func:`kernels.load`)
+
+    Args:
+        arena(BrainArena): The arena, stored with numpy
+
+    Returns:
+        (tuple): tuple containing:
+            (numba.typed.List): The parameter matrix of every key
+            (numpy.ndarray): The index of every key in the list (-1 if the arena has no such key)
+            (numpy.ndarray): The amount of nodes for every layer of every key, one row per key padded with zeros
+            (numpy.ndarray): The amount of layers of every key
+    """
+    from numba.typed import List
+
+    keys = arena.keys()
+    topologies = [list(arena.topology(key)) for key in keys]
+    params = List()
+    slots = np.full(max(keys, default=0) + 1, -1, dtype=np.int64)
+    nodes = np.zeros((len(keys), max((len(t) for t in topologies), default=0)), dtype=np.int64)
+    layers = np.zeros(len(keys), dtype=np.int64)
+    for k, (key, topology) in enumerate(zip(keys, topologies)):
+        params.append(np.ascontiguousarray(arena.params(key), dtype=np.float64))
+        slots[key] = k
+        nodes[k, :len(topology)] = topology
+        layers[k] = len(topology) - 1
+    return params, slots, nodes, layers
+
+
+# The kernels below are plain python so they can be compiled by numba (see kernels.load).
+
+def feed_forward(params, nodes, layers, scratch):
+    """
+    Feed forward one network, see :meth:`nn.BrainArena.feed_forward`
+
+    Args:
+        params(numpy.ndarray): The network's row of the arena
+        nodes(numpy.ndarray): The amount of nodes for every layer
+        layers(int): The amount of layers
+        scratch(numpy.ndarray): Two rows of working memory, the first holds the inputs
+
+    Returns:
+        int: The row of scratch that holds the outputs
+    """
+    offset = 0
+    src = 0
+    for layer in range(layers):
+        m = nodes[layer]
+        n = nodes[layer + 1]
+        dst = 1 - src
+        for j in range(n):
+            scratch[dst, j] = params[offset + m * n + j]  # the bias
+        for i in range(m):  # a row of weights at a time, they are stored row major
+            a = scratch[src, i]
+            row = offset + i * n
+            for j in range(n):
+                scratch[dst, j] += a * params[row + j]
+        for j in range(n):
+            scratch[dst, j] = 1 / (1 + np.exp(-scratch[dst, j]))  # sigmoid
+        offset += m * n + n
+        src = 1 - src
+    return src
+
+
+def step(order, x, mass, final_mass, energy, health, speed, iq, eq, ids, parent_id, move_row, social_row, breed_chance,
+         roll, food, eaten, move_params, move_slots, move_nodes, move_layers, social_params, social_slots, social_nodes,
+         social_layers, col_const, food_const, engb_const, size_factor, speed_factor, int_const, mov_const, aging_time,
+         age_const, enlb_const, enl_const, eng_const, will_breed, counts):
+    """
+    Step every agent through all the per agent phases in turn, in position order like the original per agent loop:
+    it eats the closest food item that is left, interacts with its nearest agent (at that agent's current position and
+    energy), thinks, moves, ages, heals and rolls for breeding before the next agent starts. See
+    :meth:`model2.Sim._step_kernels`
+
+    Args:
+        order(numpy.ndarray): The agents' slots ordered by position, see :attr:`spatial.RingIndex.order`
+        x(numpy.ndarray): The positions of the agents, updated
+        mass(numpy.ndarray): The agents' mass, updated
+        final_mass(numpy.ndarray): The agents' final mass
+        energy(numpy.ndarray): The agents' energy, updated
+        health(numpy.ndarray): The agents' health, updated
+        speed(numpy.ndarray): The agents' speed, updated
+        iq(numpy.ndarray): The agents' iq
+        eq(numpy.ndarray): The agents' eq
+        ids(numpy.ndarray): The agents' ids
+        parent_id(numpy.ndarray): The agents' parent ids
+        move_row(numpy.ndarray): The row of every agent's move brain
+        social_row(numpy.ndarray): The row of every agent's social brain
+        breed_chance(numpy.ndarray): The agents' breed chance
+        roll(numpy.ndarray): A uniform [0, 1) random number for every agent
+        food(numpy.ndarray): The sorted positions of the food items
+        eaten(numpy.ndarray): A False mask over the food items that is set for the eaten ones
+        move_params: The move brains, see :func:`kernels.brain_tables`
+        move_slots(numpy.ndarray): The index of every iq in move_params
+        move_nodes(numpy.ndarray): The layers of every move brain topology
+        move_layers(numpy.ndarray): The amount of layers of every move brain topology
+        social_params: The social brains, see :func:`kernels.brain_tables`
+        social_slots(numpy.ndarray): The index of every eq in social_params
+        social_nodes(numpy.ndarray): The layers of every social brain topology
+        social_layers(numpy.ndarray): The amount of layers of every social brain topology
+        col_const(float): The collision distance
+        food_const(float): The amount of food every agent eats
+        engb_const(float): The energy to mass ratio over which agents grow and gain health
+        size_factor(float): The size factor of the simulation
+        speed_factor(float): The speed factor of the simulation (G_SPEED_FACTOR)
+        int_const(float): The energy cost of a thought
+        mov_const(float): The energy cost of moving
+        aging_time(float): The part of the final mass after which agents age
+        age_const(float): The health lost to aging every step
+        enlb_const(float): The energy to mass ratio under which agents lose health
+        enl_const(float): The health lost by sick agents
+        eng_const(float): The health gained by healthy agents
+        will_breed(numpy.ndarray): Output, if the agent will breed
+        counts(numpy.ndarray): Output, the number of agents that ate, interactions, fights, helps and interactions the second agent didn't help in
+    """
+    n = len(order)
+    n_food = len(food)
+    left = n_food  # food items that weren't eaten
+    width = max(move_nodes.max(), social_nodes.max())
+    scratch = np.empty((2, width))
+    for k in range(n):
+        i = order[k]
+
+        dfood = 1.0  # the distance to the closest food item that is left
+        if left > 0:
+            tf = np.searchsorted(food, x[i], side="right") % n_food  # the first food item after the agent
+            while eaten[tf]:
+                tf = (tf + 1) % n_food
+            lf = (tf - 1 + n_food) % n_food  # and the last one before it
+            while eaten[lf]:
+                lf = (lf - 1 + n_food) % n_food
+            dtf = food[tf] - x[i]
+            if dtf > 1:  # see model2.mk_round
+                dtf = dtf - 2
+            elif dtf < -1:
+                dtf = -dtf - 1
+            dlf = food[lf] - x[i]
+            if dlf > 1:
+                dlf = dlf - 2
+            elif dlf < -1:
+                dlf = -dlf - 1
+            if dtf < dlf:
+                dfood = dtf
+                target = tf
+            else:
+                dfood = dlf
+                target = lf
+            if abs(dfood) < col_const:  # eat, see model2.Sim._eat
+                eaten[target] = True
+                left -= 1
+                counts[0] += 1
+                if mass[i] < final_mass[i] and energy[i] / mass[i] > engb_const:
+                    mass[i] += food_const  # update mass and speed
+                    speed[i] = (1 / mass[i]) * size_factor * speed_factor
+                else:
+                    energy[i] += food_const
+
+        ta = order[(k + 1) % n]  # the closest agent is either the agent before or the one after
+        la = order[(k - 1 + n) % n]
+        dta = x[ta] - x[i]
+        if dta > 1:
+            dta = dta - 2
+        elif dta < -1:
+            dta = -dta - 1
+        dla = x[la] - x[i]
+        if dla > 1:
+            dla = dla - 2
+        elif dla < -1:
+            dla = -dla - 1
+        if dta < dla:
+            dagent = dta
+            other = ta
+        else:
+            dagent = dla
+            other = la
+
+        if abs(dagent) < col_const:  # interact, see model2.interact
+            counts[1] += 1
+            energy[i] -= eq[i] * int_const  # subtract energy used for interaction thought
+            energy[other] -= eq[other] * int_const
+            close_family = 1.0 if parent_id[i] == ids[other] or parent_id[other] == ids[i] else 0.0
+            r1 = energy[i] / mass[i]
+            r2 = energy[other] / mass[other]
+            s = social_slots[eq[i]]
+            scratch[0, 0] = close_family
+            scratch[0, 1] = r1
+            scratch[0, 2] = r2
+            scratch[0, 3] = 1.0 if mass[i] > mass[other] else 0.0
+            out = feed_forward(social_params[s][social_row[i]], social_nodes[s], social_layers[s], scratch)
+            fight1 = scratch[out, 0] > 0.5
+            help1 = scratch[out, 1] > 0.5
+            s = social_slots[eq[other]]
+            scratch[0, 0] = close_family
+            scratch[0, 1] = r2
+            scratch[0, 2] = r1
+            scratch[0, 3] = 1.0 if mass[i] < mass[other] else 0.0
+            out = feed_forward(social_params[s][social_row[other]], social_nodes[s], social_layers[s], scratch)
+            fight2 = scratch[out, 0] > 0.5
+            help2 = scratch[out, 1] > 0.5
+            if fight1 or fight2:  # if either agent wants to fight
+                health[i] -= mass[other]
+                health[other] -= mass[i]
+                energy[i] += mass[other]
+                energy[other] += mass[i]
+                counts[2] += 1
+            if help1:  # if an agent wants to help
+                energy[i] -= food_const
+                energy[other] += food_const
+                counts[3] += 1
+            if help2:
+                energy[i] += food_const
+                energy[other] -= food_const
+                counts[3] += 1
+            else:
+                counts[4] += 1
+
+        s = move_slots[iq[i]]  # think, see model2.Sim._think
+        scratch[0, 0] = (dfood + 1) / 2  # see model2.map_from_to
+        scratch[0, 1] = (dagent + 1) / 2
+        scratch[0, 2] = 1.0 if mass[other] > mass[i] else 0.0
+        out = feed_forward(move_params[s][move_row[i]], move_nodes[s], move_layers[s], scratch)
+        energy[i] -= iq[i] * int_const
+        dx = scratch[out, 0] * (speed[i] - -speed[i]) + -speed[i]
+        nx = x[i] + dx  # move, see model2.Sim._move
+        if nx > 1:  # make the world round
+            nx = 1 - nx
+        if nx < -1:
+            nx = -nx - 1
+        x[i] = nx
+        energy[i] -= mov_const * dx
+
+        if mass[i] > final_mass[i] * aging_time:  # age, see model2.Sim._age
+            health[i] -= age_const
+        if energy[i] < enlb_const * mass[i]:  # if the agent is sick, lose health
+            health[i] -= enl_const
+        if energy[i] > engb_const * mass[i]:  # if the agent is healthy, gain health
+            health[i] += eng_const
+        will_breed[i] = roll[i] < breed_chance[i] and health[i] > 0 and mass[i] >= final_mass[i]
@@ -15,34 +15,26 @@
 # You should have received a copy of the GNU General Public License along with
 # this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import configparser
 import copy
-import gc
 import os
-import random
 import time
 from typing import Tuple
 
-import matplotlib
-
-import matplotlib.pyplot as plt
-
 import numpy as np
-from matplotlib import animation
-from nn import NeuralNetwork
-
-from PIL import Image  # work with metadata via pillow
-from PIL import PngImagePlugin
-
-import openpyxl  # work with excel
-import savReaderWriter  # work with spss
-
-import pickle  # support serialization
+from agents import AgentStore, FIELD_NAMES, NO_PARENT
+import export
+from food import FoodPool
+from journal import StatsBuffer, StatsJournal
+import kernels
+from spatial import RingIndex
+from nn import BrainArena, NeuralNetwork, array_module
+from profiler import NullTimer, PhaseTimer, Throughput, format_eta
+from recorder import Recorder
+from render import RingRenderer
+from simconfig import SimConfig
 
 import json  # work with gui
 
-matplotlib.get_backend()
-
 import sys
 
 if sys.version_info[0] < 3 or sys.version_info[1] < 4:
@@ -52,37 +44,7 @@ if sys.version_info[0] < 3 or sys.version_info[1] < 4:
 if sys.version_info[0] > 3:
     print("WARNING this program was write to support python 3. Use any future versions at your discretion")
 
-dir_path = os.path.dirname(os.path.realpath(__file__))
-
-config = configparser.ConfigParser(inline_comment_prefixes="#")
-config.read(os.path.join(dir_path, 'config.ini'))
-
-INT_CONST = float(config["VARIABLES"]["INT_CONST"])
-MOV_CONST = float(config["VARIABLES"]["MOV_CONST"])
-ENLB_CONST = float(config["VARIABLES"]["ENLB_CONST"])
-ENGB_CONST = float(config["VARIABLES"]["ENGB_CONST"])
-ENL_CONST = float(config["VARIABLES"]["ENL_CONST"])
-ENG_CONST = float(config["VARIABLES"]["ENG_CONST"])
-MAX_LIFE_SPAN = float(config["VARIABLES"]["MAX_LIFE_SPAN"])
-
-AGE_CONST = config["VARIABLES"]["AGE_CONST"]
-if AGE_CONST == "auto":
-    AGE_CONST = ENG_CONST - (100 / MAX_LIFE_SPAN)
-else:
-    AGE_CONST = float(AGE_CONST)
-
-POP_DENCITY = float(config["VARIABLES"]["POP_DENCITY"])
-AGING_TIME = float(config["VARIABLES"]["AGING_TIME"])
-G_SPEED_FACTOR = float(config["VARIABLES"]["G_SPEED_FACTOR"])
-FOOD_CONST = float(config["VARIABLES"]["FOOD_CONST"])
-START_MASS_P = float(config["VARIABLES"]["START_MASS_P"])
-G_COL_CONST = float(config["VARIABLES"]["G_COL_CONST"])
-MIN_IQ = float(config["VARIABLES"]["MIN_IQ"])
-MAX_IQ = float(config["VARIABLES"]["MAX_IQ"])
-MIN_EQ = float(config["VARIABLES"]["MIN_EQ"])
-MAX_EQ = float(config["VARIABLES"]["MAX_EQ"])
-FOOD_FLUCT = float(config["VARIABLES"]["FOOD_FLUCT"])
-GROUP_FACTOR = float(config["VARIABLES"]["GROUP_FACTOR"])
+CHECKPOINT_VERSION = 1  # the schema version of the files written by Sim.save
 
 
 def map_from_to(x: float, a: float, b: float, c: float, d: float) -> float:
@@ -105,22 +67,18 @@ def map_from_to(x: float, a: float, b: float, c: float, d: float) -> float:
     return (x - a) / (b - a) * (d - c) + c
 
 
-# create folders for model outputs
-GRAPHS_FOLDER = "/graphs-0.3"
-ANIMATION_FOLDER = '/animations-0.1'
-if not os.path.isdir('.' + GRAPHS_FOLDER):
-    os.mkdir('.' + GRAPHS_FOLDER)
-if not os.path.isdir('.' + ANIMATION_FOLDER):
-    os.mkdir('.' + ANIMATION_FOLDER)
-
-if not os.path.isdir("./saved"):
-    os.mkdir("./saved")
+# folders for model outputs, relative to the working directory. They are created when something is written to them
+GRAPHS_FOLDER = "graphs-0.3"
+ANIMATION_FOLDER = "animations-0.1"
+SAVE_FOLDER = "saved"
 
 
 class Agent:
     """
     A class that models the behavior of wild creatures.
 
+    The agent's fields live in a columnar :class:`agents.AgentStore`, an Agent is a thin view of one of its slots (see :meth:`model2.Agent.view`).
+    Creating an Agent directly gives it a store of its own.
 
     Args:
         x (float): The agents initial position. See :attr:`model2.Agent.x`
@@ -143,6 +101,9 @@ class Agent:
 
         parent_id(int): This variable is used to detect close family by the simulation. It is then used as a variable in agent interactions. See :attr:`model2.Agent.parent_id`
 
+        config(SimConfig): The parameters of the simulation, defaults to config.ini. See :class:`simconfig.SimConfig`
+        rng(numpy.random.Generator): The random number generator of the simulation, defaults to a new unseeded one
+
     Attributes:
         energy(float): Tracks the amount of energy an agent has. energy is acquired by eating and lost by moving or thinking. Energy allows agents to grow and regenerate health. If an agent has low energy, he will take damage. See :meth:`model2.Agent.think`, :meth:`model2.Agent.move`, :meth:`model2.interact`
 
@@ -185,41 +146,94 @@ class Agent:
                  size_factor,
                  move_brain=None,
                  social_brain=None,
-                 parent_id=None):
-        self.iq = iq
-        self.eq = eq
+                 parent_id=None,
+                 config=None,
+                 rng=None):
+        if config is None:
+            config = SimConfig()
+        if rng is None:
+            rng = np.random.default_rng()
+        xp = array_module(config.USE_GPU)
+        store = AgentStore(size_factor, Agent.view, 1, BrainArena(move_topology, xp), BrainArena(social_topology, xp),
+                           config, rng)
+        store.add(iq=iq, eq=eq, parent_id=NO_PARENT if parent_id is None else parent_id,
+                  mass=mass, energy=mass, health=mass, speed=(1 / mass) * size_factor * config.G_SPEED_FACTOR,
+                  final_mass=final_mass, breed_mass_div=breed_mass_div, breed_chance=breed_chance, x=x, id=id,
+                  move_row=store.move_brains.alloc(np.array([iq]))[0],
+                  social_row=store.social_brains.alloc(np.array([eq]))[0])
+        self._store = store
+        self._slot = 0
         if move_brain is not None:
             self.move_brain = move_brain
         else:
-            if iq == 1:  # if the size of the hidden layers is 1, the amount of hidden layers doesn't matter
-                self.move_brain = NeuralNetwork([3, 1])
-            else:
-                self.move_brain = NeuralNetwork([3, iq, iq, 1])
-
+            store.move_brains.randomize(store.iq, store.move_row, rng)
         if social_brain is not None:
             self.social_brain = social_brain
         else:
-            if eq == 1:  # if the size of the hidden layers is 1, the amount of hidden layers doesn't matter
-                self.social_brain = NeuralNetwork([4, eq, 2])
-            else:
-                self.social_brain = NeuralNetwork([4, eq, eq, 2])
+            store.social_brains.randomize(store.eq, store.social_row, rng)
 
-        self.parent_id = parent_id
+    @classmethod
+    def view(cls, store: AgentStore, slot: int) -> 'Agent':
+        """
+        Wrap a slot of an :class:`agents.AgentStore` without copying it.
+        The view is only valid until the store is reordered or compacted (every :meth:`model2.Sim.step`)
 
-        self.mass = mass
-        self.energy = mass
-        self.speed = (1 / mass) * size_factor * G_SPEED_FACTOR
-        self.health = mass
-        self.final_mass = final_mass
+        Args:
+            store(AgentStore): The store holding the agent
+            slot(int): The slot of the agent
 
-        self.breed_mass_div = breed_mass_div
-        self.breed_chance = breed_chance
+        Returns:
+            Agent: A view of the agent
+        """
+        a = cls.__new__(cls)
+        a._store = store
+        a._slot = slot
+        return a
 
-        self.x = x
+    def row(self) -> dict:
+        """
+        Get all the fields of the agent, see :meth:`agents.AgentStore.add`
+
+        Returns:
+            dict: A mapping of field name to value
+        """
+        return self._store.row(self._slot)
 
-        self.id = id
+    @property
+    def size_factor(self) -> float:
+        return self._store.size_factor
+
+    @property
+    def config(self) -> SimConfig:
+        """
+        The parameters of the agent's simulation, shared with every agent in its store
+        """
+        return self._store.config
 
-        self.size_factor = size_factor
+    @property
+    def parent_id(self):
+        parent_id = self._store.parent_id[self._slot]
+        return None if parent_id == NO_PARENT else int(parent_id)
+
+    @parent_id.setter
+    def parent_id(self, value) -> None:
+        self._store.parent_id[self._slot] = NO_PARENT if value is None else value
+
+    @property
+    def move_brain(self) -> NeuralNetwork:
+        return self._store.move_brains.network(self.iq, self.move_row)
+
+    @move_brain.setter
+    def move_brain(self, network: NeuralNetwork) -> None:
+        self._store.move_brains.set(self.iq, self.move_row, network)
+
+    @property
+    def social_brain(self) -> NeuralNetwork:
+        return self._store.social_brains.network(self.eq, self.social_row)
+
+    @social_brain.setter
+    def social_brain(self, network: NeuralNetwork) -> None:
+        self._store.social_brains.set(self.eq, self.social_row, network)
 
     def age(self) -> None:
         """
@@ -228,8 +242,8 @@ class Agent:
         See Also:
              :attr:`model2.Agent.health`
         """
-        if self.mass > self.final_mass * AGING_TIME:
-            self.health -= AGE_CONST
+        if self.mass > self.final_mass * self.config.AGING_TIME:
+            self.health -= self.config.AGE_CONST
 
     def think(self, d_food: float, d_agent: float, s_agent: 'Agent') -> float:
         """
@@ -251,7 +265,7 @@ class Agent:
         out = self.move_brain.feed_forward(
             [map_from_to(d_food, -1, 1, 0, 1), map_from_to(d_agent, -1, 1, 0, 1),
              int(s_agent.mass > self.mass)])
-        self.energy -= self.iq * INT_CONST
+        self.energy -= self.iq * self.config.INT_CONST
         return map_from_to(float(out[0]), 0, 1, -self.speed, self.speed)
 
     def move(self, dx: float) -> None:
@@ -271,7 +285,7 @@ class Agent:
             self.x = 1 - self.x
         if self.x < -1:
             self.x = -self.x - 1
-        self.energy -= MOV_CONST * dx
+        self.energy -= self.config.MOV_CONST * dx
 
     def breed(self, nid: int) -> 'Agent':
         """
@@ -289,22 +303,23 @@ class Agent:
         Returns:
             Agent: A child that is a mutated version of the agent, None if the agent died in childbirth
         """
+        rng = self._store.rng
         nb = copy.deepcopy(self.move_brain)
-        nb.mutate()
+        nb.mutate(rng)
 
         nsb = copy.deepcopy(self.social_brain)
-        nsb.mutate()
+        nsb.mutate(rng)
 
-        nm = np.ceil((self.mass + random.randrange(-10, 10)) * self.breed_mass_div)
+        nm = np.ceil((self.mass + rng.integers(-10, 10)) * self.breed_mass_div)
         self.health -= nm
         self.mass -= nm
         if self.health <= 0 or self.mass < 1 or nm < 1:
             self.health = -1
             return None  # died in childbirth
-        return Agent(self.iq, self.eq, nm, self.x + random.uniform(0.001, -0.001), nid,
+        return Agent(self.iq, self.eq, nm, self.x + rng.uniform(-0.001, 0.001), nid,
                      np.ceil(nm / self.breed_mass_div),
-                     self.breed_mass_div + random.uniform(0.01, -0.01), self.breed_chance + random.uniform(0.01, -0.01),
-                     self.size_factor, nb, nsb, self.id)
+                     self.breed_mass_div + rng.uniform(-0.01, 0.01), self.breed_chance + rng.uniform(-0.01, 0.01),
+                     self.size_factor, nb, nsb, self.id, self.config, rng)
 
     def eat(self, food: int) -> None:
         """
@@ -313,9 +328,9 @@ class Agent:
         Args:
             food(int): The amount of food the agent should eat
         """
-        if self.mass < self.final_mass and self.energy / self.mass > ENGB_CONST:
+        if self.mass < self.final_mass and self.energy / self.mass > self.config.ENGB_CONST:
             self.mass += food  # update mass and speed
-            self.speed = (1 / self.mass) * self.size_factor * G_SPEED_FACTOR
+            self.speed = (1 / self.mass) * self.size_factor * self.config.G_SPEED_FACTOR
         else:
             self.energy += food
 
@@ -323,6 +338,56 @@ class Agent:
         return str(self.id)
 
 
+def _column(name: str) -> property:
+    """
+    Create a property that reads and writes a column of the agent's store
+    """
+
+    def fget(self):
+        value = self._store._cols[name][self._slot]
+        return value.item() if isinstance(value, np.generic) else value
+
+    def fset(self, value):
+        self._store._cols[name][self._slot] = value
+
+    return property(fget, fset)
+
+
+for _name in FIELD_NAMES:
+    if _name != "parent_id":
+        setattr(Agent, _name, _column(_name))
+
+
+def move_topology(iq: int) -> list:
+    """
+    The structure of a move brain, see :attr:`model2.Agent.move_brain`
+
+    Args:
+        iq(int): The number of neurons in every hidden layer
+
+    Returns:
+        list[int]: The amount of nodes for every layer
+    """
+    if iq == 1:  # if the size of the hidden layers is 1, the amount of hidden layers doesn't matter
+        return [3, 1]
+    return [3, iq, iq, 1]
+
+
+def social_topology(eq: int) -> list:
+    """
+    The structure of a social brain, see :attr:`model2.Agent.social_brain`
+
+    Args:
+        eq(int): The number of neurons in every hidden layer
+
+    Returns:
+        list[int]: The amount of nodes for every layer
+    """
+    if eq == 1:  # if the size of the hidden layers is 1, the amount of hidden layers doesn't matter
+        return [4, eq, 2]
+    return [4, eq, eq, 2]
+
+
 def fight(a1: Agent, a2: Agent) -> None:
     """
     Makes the given agents fight
@@ -354,8 +419,8 @@ def interact(a1: Agent, a2: Agent, s) -> None:
         a2(Agent): Agent 2
         s(Sim): The simulation that is requesting the interaction (used to update statistics)
     """
-    a1.energy -= a1.eq * INT_CONST  # subtract energy used for interaction thought
-    a2.energy -= a2.eq * INT_CONST
+    a1.energy -= a1.eq * a1.config.INT_CONST  # subtract energy used for interaction thought
+    a2.energy -= a2.eq * a2.config.INT_CONST
     close_family = a1.parent_id == a2.id or a2.parent_id == a1.id
     s1 = a1.social_brain.feed_forward(
         [1 if close_family else 0, a1.energy / a1.mass, a2.energy / a2.mass, 1 if a1.mass > a2.mass else 0])
@@ -366,29 +431,111 @@ def interact(a1: Agent, a2: Agent, s) -> None:
         fight(a1, a2)
         s.fight += 1
     if s1[1] > 0.5:  # if an agent wants to help
-        a1.energy -= FOOD_CONST
-        a2.energy += FOOD_CONST
+        a1.energy -= a1.config.FOOD_CONST
+        a2.energy += a1.config.FOOD_CONST
         s.help += 1
     if s2[1] > 0.5:
-        a1.energy += FOOD_CONST
-        a2.energy -= FOOD_CONST
+        a1.energy += a1.config.FOOD_CONST
+        a2.energy -= a1.config.FOOD_CONST
         s.help += 1
     else:
         s.nothing += 1
 
 
-class Food:
-    """ Food class
+def interact_batch(agents: AgentStore, a1: np.ndarray, a2: np.ndarray, s) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Makes every given pair of agents interact, equivalent to calling :func:`model2.interact` on every pair.
+    All the social decisions are evaluated together (see :meth:`nn.BrainArena.feed_forward`) from the energy the agents
+    have once every pair has paid for its interaction thought, then fights and help are resolved for all pairs at once.
 
     Args:
-        x(float): Food position
+        agents(AgentStore): The store holding the agents
+        a1(numpy.ndarray): The slots of the first agent of every pair
+        a2(numpy.ndarray): The slots of the second agent of every pair
+        s(Sim): The simulation that is requesting the interaction (used to update statistics), None to skip the statistics
 
-    Attributes:
-        x(float): Food position
+    Returns:
+        (tuple): tuple containing:
+            (numpy.ndarray): If every pair fought
+            (numpy.ndarray): If the first agent of every pair helped the second
+            (numpy.ndarray): If the second agent of every pair helped the first
+    """
+    if len(a1) == 0:
+        return np.zeros(0, dtype=bool), np.zeros(0, dtype=bool), np.zeros(0, dtype=bool)
+    np.subtract.at(agents.energy, a1, agents.eq[a1] * agents.config.INT_CONST)  # subtract energy used for interaction thought
+    np.subtract.at(agents.energy, a2, agents.eq[a2] * agents.config.INT_CONST)
+    s1, s2 = social_decisions(agents, a1, a2)
+
+    fights = (s1[:, 0] > 0.5) | (s2[:, 0] > 0.5)  # if either agent wants to fight
+    f1 = a1[fights]
+    f2 = a2[fights]
+    m1 = agents.mass[f1]
+    m2 = agents.mass[f2]
+    np.subtract.at(agents.health, f1, m2)
+    np.subtract.at(agents.health, f2, m1)
+    np.add.at(agents.energy, f1, m2)
+    np.add.at(agents.energy, f2, m1)
+
+    help1 = s1[:, 1] > 0.5  # if an agent wants to help
+    help2 = s2[:, 1] > 0.5
+    gift = (help2.astype(float) - help1.astype(float)) * agents.config.FOOD_CONST
+    np.add.at(agents.energy, a1, gift)
+    np.subtract.at(agents.energy, a2, gift)
+
+    if s is not None:
+        s.fight += int(np.count_nonzero(fights))
+        s.help += int(np.count_nonzero(help1) + np.count_nonzero(help2))
+        s.nothing += len(a1) - int(np.count_nonzero(help2))
+    return fights, help1, help2
+
+
+def social_decisions(agents: AgentStore, a1: np.ndarray, a2: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Evaluate the social brains of interacting pairs, see :func:`model2.interact_batch`
+
+    Args:
+        agents(AgentStore): The store holding the agents
+        a1(numpy.ndarray): The slots of the first agent of every pair
+        a2(numpy.ndarray): The slots of the second agent of every pair
+
+    Returns:
+        (tuple): tuple containing:
+            (numpy.ndarray): The decisions (fight, help) of the first agent of every pair
+            (numpy.ndarray): The decisions of the second agent of every pair
     """
+    close_family = ((agents.parent_id[a1] == agents.id[a2]) | (agents.parent_id[a2] == agents.id[a1])).astype(float)
+    r1 = agents.energy[a1] / agents.mass[a1]
+    r2 = agents.energy[a2] / agents.mass[a2]
+    inputs = np.concatenate([np.stack([close_family, r1, r2, (agents.mass[a1] > agents.mass[a2]).astype(float)], axis=1),
+                             np.stack([close_family, r2, r1, (agents.mass[a1] < agents.mass[a2]).astype(float)], axis=1)])
+    out = agents.social_brains.feed_forward(np.concatenate([agents.eq[a1], agents.eq[a2]]),
+                                            np.concatenate([agents.social_row[a1], agents.social_row[a2]]), inputs)
+    return out[:len(a1)], out[len(a1):]
 
-    def __init__(self, x: float) -> None:
-        self.x = x
+
+def nearest_food(food: np.ndarray, x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find the closest food item to every position.
+    The food positions are kept sorted so the food items before and after every position are found with a single binary
+    search.
+
+    Args:
+        food(numpy.ndarray): The sorted positions of the food items, at least one
+        x(numpy.ndarray): The positions
+
+    Returns:
+        (tuple): tuple containing:
+            (numpy.ndarray): The distance of every position to its closest food item
+            (numpy.ndarray): The index of that food item
+    """
+    tf = np.searchsorted(food, x, side="right")  # the first food item after every agent
+    lf = tf - 1  # and the last one before it, -1 wraps around the world
+    tf %= len(food)
+
+    dtf = mk_round(food[tf] - x)
+    dlf = mk_round(food[lf] - x)
+    closest = dtf < dlf
+    return np.where(closest, dtf, dlf), np.where(closest, tf, lf % len(food))
 
 
 def mk_round(d: float) -> float:
@@ -396,12 +543,14 @@ def mk_round(d: float) -> float:
     Gets the smallest distance between 2 objects on a circle with flattened coordinates from -1 to 1
 
     Args:
-        d(float): The distance to process
+        d(float): The distance to process, or a numpy.ndarray of distances
 
 
     Returns:
-        float: The processed distance
+        float: The processed distance (numpy.ndarray if an array was passed)
     """
+    if np.ndim(d) != 0:  # element wise for arrays of distances
+        return np.where(d > 1, d - 2, np.where(d < -1, -d - 1, d))
     if d > 1:  # if the distance between them is greater than 1, then the other distance must be smaller Ex. 1.2 -> -0.8
         return d - 2
     if d < -1:  # if the distance between them is smaller than -1, then the other distance must be smaller Ex. -1.2 -> 0.8
@@ -416,12 +565,23 @@ class Sim:
 
     Args:
         agents: The number of agents the simulation should start with. See :class:`model2.Agent`
-        food_count: The amount of food that should be provided. See :class:`model2.Food`
+        food_count: The amount of food that should be provided. See :class:`food.FoodPool`
+        journal: A directory to stream the recorded statistics to (see :class:`journal.StatsJournal`), a journal that is already there is replaced. If None, they are kept in memory
+        config: The parameters of the simulation, defaults to the values in config.ini. See :class:`simconfig.SimConfig`
+        seed: The seed of the simulation's random number generator (anything numpy.random.default_rng accepts). If None, the simulation is not reproducible
+        profile: Time every phase of the simulation, see :attr:`model2.Sim.profiler`
+        backend: How the per agent phases of a step are computed, "numpy" (vectorized, every phase is applied to all the agents before the next one) or "numba" (:func:`kernels.step`, every agent goes through all the phases in turn like the original per agent loop, falls back to numpy if numba isn't installed). The two backends don't give the same results
 
     Attributes:
 
-        agents(list[Agent]): A list of all the agents that are alive in the simulation.
-        size_factor(float): A constant that scales the simulation. calculated via  1 / (agents / POP_DENCITY)
+        config(SimConfig): The parameters of the simulation, shared with its agents
+        rng(numpy.random.Generator): The source of all of the simulation's randomness, shared with its agents
+        profiler(PhaseTimer): The time spent in every phase of the simulation, a :class:`profiler.NullTimer` unless profiling
+        throughput(Throughput): The speed of the current run, reported by :meth:`model2.Sim.progress`
+
+        agents(AgentStore): A columnar store of all the agents that are alive in the simulation. Indexing or iterating it gives :class:`model2.Agent` views
+        index(RingIndex): A spatial index of the agents, kept up to date at the end of every step
+        size_factor(float): A constant that scales the simulation. calculated via  1 / (agents / config.POP_DENCITY)
         col_const(float): The minimum distance at which 2 objects are considered to be colliding.
         food_count(int): The amount of food that should be provided.
 
@@ -435,35 +595,59 @@ class Sim:
 
         eat(int): The number of times agents ate in the last step
 
-        food(list[Food]): A list of all the food items
+        food(FoodPool): The food items, at most (1 - config.FOOD_FLUCT) * food_count of them
         gcsteps(int): The number of total steps taken (if run/animate is used more than once)
+        checkpoint_step(int): The run step the sim was saved at, if it was loaded from a checkpoint. See :meth:`model2.Sim.load`
         dataPoints(int): The nummber of datapoints recorded
+        sink(StatsBuffer): Where the statistics are recorded, either in memory or in an on-disk journal. The *_OT attributes read their column from it
 
-        i_OT(list[int]): The x array for the model's graphs - composed of datapoints over time
+        i_OT(numpy.ndarray): The x array for the model's graphs - composed of datapoints over time
 
-        number_of_agents_OT(list[int]): A list of the number of agents over time
-        mass_OT(list[float]): A list of the average agent mass over time. See :attr:`model2.Agent.mass`
-        eat_OT(list[int]): A list of the rate of eating over time. See :meth:`model2.Agent.eat`
+        number_of_agents_OT(numpy.ndarray): An array of the number of agents over time
+        mass_OT(numpy.ndarray): An array of the average agent mass over time. See :attr:`model2.Agent.mass`
+        eat_OT(numpy.ndarray): An array of the rate of eating over time. See :meth:`model2.Agent.eat`
 
-        iq_OT(list[float]): A list of the average iq over time. See :attr:`model2.Agent.iq`
-        eq_OT(list[float]): A list of the average eq over time. See :attr:`model2.Agent.eq`
+        iq_OT(numpy.ndarray): An array of the average iq over time. See :attr:`model2.Agent.iq`
+        eq_OT(numpy.ndarray): An array of the average eq over time. See :attr:`model2.Agent.eq`
 
-        breed_mass_div_OT(list[float]): A list of the average mass to final mass ratio of newborns over time. See :attr:`model2.Agent.breed_mass_div`
-        breed_chance_OT(list[float]): A list of the average breeding chase of agents over time. See :attr:`model2.Agent.breed_chance`
+        breed_mass_div_OT(numpy.ndarray): An array of the average mass to final mass ratio of newborns over time. See :attr:`model2.Agent.breed_mass_div`
+        breed_chance_OT(numpy.ndarray): An array of the average breeding chase of agents over time. See :attr:`model2.Agent.breed_chance`
 
-        fight_OT(list[int]): A list of the amount of fighting over time. See :meth:`model2.fight`, :meth:`model2.interact`
-        help_OT(list[int]): A list of the number of creatures helping one another over time. See :meth:`model2.interact`
-        nothing_OT(list[int]): A list of the number of creatures ignoring one another over time. See :meth:`model2.interact`
+        fight_OT(numpy.ndarray): An array of the amount of fighting over time. See :meth:`model2.fight`, :meth:`model2.interact`
+        help_OT(numpy.ndarray): An array of the number of creatures helping one another over time. See :meth:`model2.interact`
+        nothing_OT(numpy.ndarray): An array of the number of creatures ignoring one another over time. See :meth:`model2.interact`
 
     Raises:
         TypeError: If agents or food_count aren't integers
 
     """
 
+    # counters that are part of the simulation state
+    COUNTERS = ("breed", "kill", "fight", "help", "nothing", "id", "eat", "gcsteps", "dataPoints", "interactions")
+
+    # statistics recorded every data point
+    STATS = ("i_OT", "number_of_agents_OT", "mass_OT", "eat_OT", "iq_OT", "eq_OT", "breed_mass_div_OT",
+             "breed_chance_OT", "interactions_OT", "fight_OT", "help_OT", "nothing_OT", "relative_groups_OT",
+             "close_family_in_group_OT")
+
+    # the statistics in the plt, excel and spss outputs of graph, and their titles
+    GRAPHED = ("number_of_agents_OT", "mass_OT", "eat_OT", "iq_OT", "iq_OT", "breed_mass_div_OT", "breed_chance_OT",
+               "fight_OT", "help_OT", "nothing_OT", "relative_groups_OT", "close_family_in_group_OT")
+    GRAPH_TITLES = ("Number Of Agents", "Average Agent Mass",
+                    "Amount of Food Consumed", "Average Agent IQ", "Average Agent EQ",
+                    "Average breeding mass divider", "Average Agent Breed Chance",
+                    "Fight count relative to population size", "Help count relative to population size",
+                    "Ignore count relative to population size", "Number of groups", "Close family ration in group")
+
     def __init__(
             self,
             agents: int = 500,
             food_count: int = None,
+            journal: str = None,
+            config: SimConfig = None,
+            seed=None,
+            profile: bool = False,
+            backend: str = "numpy",
     ) -> None:
         if food_count is None:
             food_count = 5 * agents
@@ -471,8 +655,14 @@ class Sim:
         if (not isinstance(food_count, int)) or (not isinstance(agents, int)):
             raise TypeError
 
-        self.size_factor = 1 / (agents / POP_DENCITY)
-        self.col_const = G_COL_CONST * self.size_factor
+        self.config = SimConfig() if config is None else config
+        self.rng = np.random.default_rng(seed)
+        self.backend = kernels.resolve_backend(backend)
+        self._kernels = kernels.load() if self.backend == "numba" else None
+        self.profiler = PhaseTimer() if profile else NullTimer()
+        self.throughput = Throughput()
+        self.size_factor = 1 / (agents / self.config.POP_DENCITY)
+        self.col_const = self.config.G_COL_CONST * self.size_factor
 
         self.food_count = food_count
         self.breed = 0
@@ -482,42 +672,36 @@ class Sim:
         self.nothing = 0
         self.id = 0
         self.eat = 0
-        self.agents = []
-        self.food = []
+        xp = array_module(self.config.USE_GPU)
+        self.agents = AgentStore(self.size_factor, Agent.view, agents, BrainArena(move_topology, xp),
+                                 BrainArena(social_topology, xp), self.config, self.rng)
+        self.food = FoodPool(int((1 - self.config.FOOD_FLUCT) * food_count))
         self.gcsteps = 0
         self.dataPoints = 0
         self.interactions = 0
-        for i in range(agents):  # create initial population
-            mass = np.ceil(random.randrange(1, 100))
-            self.agents.append(
-                Agent(int(random.randrange(MIN_IQ,
-                                           MAX_IQ)), int(random.randrange(MIN_EQ, MAX_EQ)),
-                      np.ceil(mass * START_MASS_P),
-                      random.uniform(-1, 1), self.id, mass, random.random(), random.random(), self.size_factor))
-            self.id += 1
+        self.checkpoint_step = 0
+        # create initial population
+        rng = self.rng
+        mass = np.ceil(rng.integers(1, 100, agents)).astype(float)
+        start_mass = np.ceil(mass * self.config.START_MASS_P)
+        iq = rng.integers(int(self.config.MIN_IQ), int(self.config.MAX_IQ), agents)
+        eq = rng.integers(int(self.config.MIN_EQ), int(self.config.MAX_EQ), agents)
+        self.agents.extend(iq=iq, eq=eq, mass=start_mass, energy=start_mass, health=start_mass,
+                           speed=(1 / start_mass) * self.size_factor * self.config.G_SPEED_FACTOR, final_mass=mass,
+                           x=rng.uniform(-1, 1, agents), breed_mass_div=rng.random(agents),
+                           breed_chance=rng.random(agents), id=np.arange(agents),
+                           parent_id=np.full(agents, NO_PARENT),
+                           move_row=self.agents.move_brains.alloc(iq), social_row=self.agents.social_brains.alloc(eq))
+        self.agents.move_brains.randomize(self.agents.iq, self.agents.move_row, rng)  # one random fill per topology
+        self.agents.social_brains.randomize(self.agents.eq, self.agents.social_row, rng)
+        self.id = agents
+
+        self.index = RingIndex()
+        self.index.update(self.agents.x)
 
         # create statistic helpers
         self.group()
-        self.i_OT = []
-
-        self.number_of_agents_OT = []
-        self.mass_OT = []
-        self.eat_OT = []
-
-        self.iq_OT = []
-        self.eq_OT = []
-
-        self.breed_mass_div_OT = []
-        self.breed_chance_OT = []
-
-        self.interactions_OT = []
-
-        self.fight_OT = []
-        self.help_OT = []
-        self.nothing_OT = []
-
-        self.relative_groups_OT = []
-        self.close_family_in_group_OT = []
+        self.sink = StatsBuffer(self.STATS) if journal is None else StatsJournal(journal, self.STATS, new=True)
         self.cfood()
 
         return
@@ -537,47 +721,158 @@ class Sim:
             len(self.agents), self.gcsteps,
             time.strftime("%d%M%Y%H%M%S", time.localtime()))
 
-    def save(self, file: str = None) -> None:
+    def save(self, file: str = None, run_step: int = 0) -> str:
         """
-        Save the simulation state to a file.
+        Save the simulation state to a checkpoint file.
+
+        The checkpoint is an uncompressed numpy ``.npz`` archive of named arrays: everything in :meth:`model2.Sim.snapshot`,
+        the recorded statistics (or the path of the statistics journal), the config and a schema version (see
+        :data:`model2.CHECKPOINT_VERSION`).
+        The file is written next to its destination and then moved into place, so an interrupted save never corrupts an
+        older checkpoint.
 
         Args:
-            file: The path to save the state to.
+            file: The path to save the state to. Defaults to a unique name in the saved folder
+            run_step(int): The step of the current :meth:`model2.Sim.run` the checkpoint was taken at, used to resume the run
+
+        Returns:
+            str: The path of the checkpoint
 
         Throws:
             ValueError: if the filename does not end with .envs
         """
-        if file is not None and file.endswith(".envs"):
+        if file is None:
+            os.makedirs(SAVE_FOLDER, exist_ok=True)
+            file = SAVE_FOLDER + "/" + self.get_fn() + ".envs"
+        if not file.endswith(".envs"):
             raise ValueError("File must end with .envs")
-        pickle.dump(self, open(file if file is not None else "save/" + self.get_fn() + ".envs", "w"), 4)
+
+        state = self.snapshot()
+        if isinstance(self.sink, StatsJournal):  # the statistics are already on disk, only point to them
+            self.sink.flush()
+            state["stats/journal"] = np.array(os.path.abspath(self.sink.path))
+        else:
+            state.update({"stats/" + name: self.sink.column(name) for name in self.STATS})
+        state.update({"schema_version": np.array(CHECKPOINT_VERSION), "sim/food_count": np.array(self.food_count),
+                      "sim/size_factor": np.array(self.size_factor), "sim/col_const": np.array(self.col_const),
+                      "sim/backend": np.array(self.backend), "run/step": np.array(run_step)})
+        state.update({"config/" + name: np.array(str(value)) for name, value in self.config.items().items()})
+        with open(file + ".tmp", "wb") as f:
+            np.savez(f, **state)
+        os.replace(file + ".tmp", file)
+        return file
 
     @classmethod
     def load(cls, filename: str) -> "Sim":
         """
-        Load a simulation from a file
+        Load a simulation from a checkpoint file, see :meth:`model2.Sim.save`.
+        The random number generator is restored too, so the simulation continues exactly as it would have.
+
         Args:
             filename: the path to the file
 
         Returns:
-            the loaded sim
+            the loaded sim, its checkpoint_step attribute is the run step the checkpoint was taken at
+
+        Throws:
+            ValueError: if the file has a different schema version
+        """
+        with np.load(filename) as f:
+            state = {name: f[name] for name in f.files}
+        version = int(state["schema_version"])
+        if version != CHECKPOINT_VERSION:
+            raise ValueError("Checkpoint schema version {} isn't the supported version {}"
+                             .format(version, CHECKPOINT_VERSION))
+
+        sim = cls.__new__(cls)
+        sim.config = SimConfig(**{name[len("config/"):]: str(value) for name, value in state.items()
+                                  if name.startswith("config/")})
+        sim.food_count = int(state["sim/food_count"])
+        sim.size_factor = float(state["sim/size_factor"])
+        sim.col_const = float(state["sim/col_const"])
+        sim.rng = np.random.default_rng()
+        sim.backend = kernels.resolve_backend(str(state["sim/backend"]))
+        sim._kernels = kernels.load() if sim.backend == "numba" else None
+        sim.profiler = NullTimer()
+        sim.throughput = Throughput()
+        xp = array_module(sim.config.USE_GPU)
+        sim.agents = AgentStore(sim.size_factor, Agent.view, 1, BrainArena(move_topology, xp),
+                                BrainArena(social_topology, xp), sim.config, sim.rng)
+        sim.food = FoodPool(int((1 - sim.config.FOOD_FLUCT) * sim.food_count))
+        if "stats/journal" in state:
+            sim.sink = StatsJournal(str(state["stats/journal"]))
+        else:
+            sim.sink = StatsBuffer(cls.STATS, max(len(state["stats/i_OT"]), 1))
+            for chunk in zip(*(state["stats/" + name] for name in cls.STATS)):
+                sim.sink.append(dict(zip(cls.STATS, chunk)))
+        sim.restore(state)
+        sim.checkpoint_step = int(state["run/step"])
+        return sim
+
+    def snapshot(self) -> dict:
+        """
+        Capture the state of the simulation: the agents (with their brains), the food, the counters, the random number
+        generator and the amount of recorded data points. Statistics that were already recorded aren't copied, restoring
+        only drops the data points recorded after the snapshot.
+
+        See also:
+            :meth:`model2.Sim.restore`
+
+        Returns:
+            dict: A mapping of names to numpy arrays
         """
-        with open(filename, 'rb') as f:
-            return pickle.load(f)
+        state = {"agents/" + name: value for name, value in self.agents.snapshot().items()}
+        state.update({"food/" + name: value for name, value in self.food.snapshot().items()})
+        state.update({"counters/" + name: np.array(getattr(self, name)) for name in self.COUNTERS})
+        state["rng/state"] = np.array(json.dumps(self.rng.bit_generator.state))
+        return state
+
+    def restore(self, state: dict, rng: bool = True) -> None:
+        """
+        Restore the simulation to a snapshot
+
+        Args:
+            state(dict): A snapshot taken with :meth:`model2.Sim.snapshot`
+            rng(bool): Whether to restore the random number generator too. If not, the simulation continues differently than it did after the snapshot
+        """
+        self.agents.restore({name[len("agents/"):]: value for name, value in state.items()
+                             if name.startswith("agents/")})
+        self.food.restore({name[len("food/"):]: value for name, value in state.items() if name.startswith("food/")})
+        for name in self.COUNTERS:
+            setattr(self, name, state["counters/" + name].item())
+        self.sink.truncate(self.dataPoints)
+        if rng:
+            self.rng.bit_generator.state = json.loads(str(state["rng/state"]))
+        self.index = RingIndex()
+        self.index.update(self.agents.x)
 
     def run(self, steps: int = 1000, print_freq: int = None, max_attempts: int = 1, data_point_freq: int = 10,
-            gui: bool = False) -> Tuple[bool, int]:
+            gui: bool = False, snapshot_freq: int = None, keep_snapshots: int = 2, checkpoint_freq: int = None,
+            checkpoint_file: str = None, start: int = 0, record: str = None, record_freq: int = 1) -> Tuple[bool, int]:
         """
         Runs the mode
 
+        A snapshot of the simulation is taken every snapshot_freq steps. If the population dies, the simulation is
+        restored to the most recent snapshot and continues from there (with different random events).
+        If it dies again before the next snapshot is taken, that snapshot is dropped and an older one is used.
+
         Args:
             max_attempts: The maximum amount of attempts the simulation should try before quitting, -1 is effectively infinity
             steps(int): The number of steps to run the model
             print_freq(int): The frequency to print progress updates
             data_point_freq: The frequency to update data points. Note: the maximum number of data points for excel is 16,383.
+            snapshot_freq(int): The frequency to take snapshots, defaults to every 10% of steps
+            keep_snapshots(int): The number of snapshots to keep
+            checkpoint_freq(int): The frequency to save keyframes to checkpoint_file (see :meth:`model2.Sim.save`), defaults to every 10% of steps
+            checkpoint_file(str): The checkpoint file to save keyframes to, keyframes are disabled if None
+            start(int): The step to start from, used to resume a run from a checkpoint (see :meth:`model2.Sim.load`)
+            record(str): A folder to record the agents and the food to, for replaying the run later (see :class:`recorder.Recorder`). Recording is disabled if None
+            record_freq(int): The frequency to record frames
 
         See also:
             :meth:`model2.Sim.step`
             :meth:`model2.Sim.update_stats`
+            :meth:`model2.Sim.snapshot`
 
         Returns:
             (tuple): tuple containing:
@@ -587,60 +882,112 @@ class Sim:
         if max_attempts == -1:  # if maximum attempts is -1, make it effectively infinite
             max_attempts = 2 ** 32
 
-        sim_copy = copy.deepcopy(self)  # create a copy of the sim to use as a restore point
-
         if print_freq is None:  # if print frequency is not specified, set it so that the model prints every 1% of steps
             print_freq = steps / 100
-        for a in range(max_attempts):
-            failed = False
-            for i in range(steps):
-                if not self.step():  # call step, if it failed, stop this attempt
-                    self.__dict__.update(copy.deepcopy(sim_copy).__dict__)  # resetting the sim to its original state
-                    failed = True
-                    break
-                if i % print_freq == 0:
-                    self.progress(steps, i, gui)
-                if i % data_point_freq == 0:
+        if snapshot_freq is None:
+            snapshot_freq = max(steps // 10, 1)
+        if checkpoint_freq is None:
+            checkpoint_freq = max(steps // 10, 1)
+
+        recorder = None
+        if record is not None:
+            recorder = Recorder(record, self.size_factor)
+            recorder.truncate(start)  # frames after the start step belong to a run that is being replaced
+
+        timer = self.profiler
+        self.throughput = Throughput(start)
+        snapshots = [(start, self.snapshot())]  # (step to resume from, snapshot), the first one is the restore point
+        failures = 0
+        failed_since_snapshot = False
+        i = start
+        while i < steps:
+            agent_count = len(self.agents)
+            with timer.phase("step"):
+                alive = self.step()
+            if not alive:  # if the step failed, go back to the last snapshot
+                failures += 1
+                if failures >= max_attempts:
+                    if recorder is not None:
+                        recorder.close()
+                    return False, max_attempts
+                if failed_since_snapshot and len(snapshots) > 1:
+                    snapshots.pop()  # this snapshot is probably doomed, try an older one
+                i, state = snapshots[-1]
+                self.restore(state, rng=False)
+                if recorder is not None:
+                    recorder.truncate(i)
+                failed_since_snapshot = True
+                continue
+            if i % print_freq == 0:
+                self.progress(steps, i, gui)
+            self.throughput.add(agent_count)  # counted after the progress update, which reports the steps before i
+            if i % data_point_freq == 0:
+                with timer.phase("update_stats"):
                     self.update_stats()  # update statistics
-            if not failed:
-                self.progress(steps, steps, gui)
-                return True, a
-        return False, max_attempts
+            if recorder is not None and i % record_freq == 0:
+                with timer.phase("record"):
+                    if i % data_point_freq != 0:
+                        self.group()  # the groups are only kept up to date by update_stats
+                    recorder.append(i, self.agents.x, self.agents.mass, self.agents.group, self.food.x)
+            i += 1
+            if i % snapshot_freq == 0 and i < steps:
+                with timer.phase("snapshot"):
+                    snapshots.append((i, self.snapshot()))
+                    del snapshots[:-keep_snapshots]
+                    failed_since_snapshot = False
+                    self.sink.flush()
+            if checkpoint_file is not None and (i % checkpoint_freq == 0 or i == steps):
+                with timer.phase("checkpoint"):
+                    self.save(checkpoint_file, run_step=i)
+        self.sink.flush()
+        if recorder is not None:
+            recorder.close()
+        self.progress(steps, steps, gui)
+        return True, failures
 
     def group(self) -> int:
         """
-        Group agents via position
+        Group agents via position, into :attr:`model2.Agent.group`.
+        Agents are visited in position order, the first agent is in group 0 and every agent whose gap to the previous
+        one is at least ``col_const * GROUP_FACTOR`` starts the next group, so group ids are consecutive
+
         Returns:
-            number of groups
+            int: The id of the last group, the number of groups minus one
         """
-        prev_a = self.agents[0]
-        prev_a.group = 0
-        for a in self.agents:
-            a.group = prev_a.group + (0 if abs(a.x - prev_a.x) < self.col_const * GROUP_FACTOR else 1)
-            prev_a = a
-        return prev_a.group
+        xs = self.index.xs
+        # a new group starts wherever the gap to the previous agent is too big
+        groups = np.concatenate([[0], np.cumsum(np.abs(np.diff(xs)) >= self.col_const * self.config.GROUP_FACTOR)])
+        self.agents.group[self.index.order] = groups
+        return int(groups[-1])
 
     def progress(self, steps: int, csteps: int, gui: bool) -> None:
         """
-        Print model progress
+        Print model progress, with the speed since the previous update and the estimated time left (see
+        :class:`profiler.Throughput`)
          Args:
             steps(int): How many steps are there in total
             csteps(int): The current step number
         """
+        speed = self.throughput.sample(csteps, steps)
         if gui:
             print(json.dumps({
                 "steps": csteps,
                 "food": len(self.food),
-                "agents": len(self.agents)
+                "agents": len(self.agents),
+                "steps_per_sec": speed["steps_per_sec"],
+                "agent_steps_per_sec": speed["agent_steps_per_sec"],
+                "eta": speed["eta"]
             }))
             sys.stdout.flush()
         else:
             print(
-                "{}% ({} of {}) current population size: {} amount of food: {}"
+                "{}% ({} of {}) current population size: {} amount of food: {} steps/sec: {:.1f} agents*steps/sec: {:.0f} ETA: {}"
                     .format(round((csteps / steps) * 100, 2),
                             csteps, steps,
                             len(self.agents),
-                            len(self.food)))  # print status
+                            len(self.food),
+                            speed["steps_per_sec"], speed["agent_steps_per_sec"],
+                            format_eta(speed["eta"])))  # print status
 
     def update_stats(self) -> None:
         """
@@ -650,58 +997,44 @@ class Sim:
         self.gcsteps += 1
         self.dataPoints += 1
 
-        # append statistics:
-        self.i_OT.append(self.gcsteps)
-        self.number_of_agents_OT.append(agent_count)
-        self.interactions_OT.append(self.interactions)
-        self.interactions = 0
-
         # group based statistics:
-        self.relative_groups_OT.append(self.group())
-
-        # in order to reduce compute time all for data collection will occur once
-
-        helper_mass = np.ndarray([agent_count])
-        helper_iq = np.ndarray([agent_count])
-        helper_eq = np.ndarray([agent_count])
-        helper_bmd = np.ndarray([agent_count])
-        helper_bch = np.ndarray([agent_count])
-        helper_group_i = -1
-        helper_group_size = []
-        helper_close_family_group = []
-
-        for i in range(agent_count):
-            a = self.agents[i]
-            helper_mass[i] = a.mass
-            helper_iq[i] = a.iq
-            helper_eq[i] = a.eq
-            helper_bmd[i] = a.breed_mass_div
-            helper_bch[i] = a.breed_chance
-            if a.group != helper_group_i:
-                a.group = helper_group_i
-                helper_close_family_group.append([])
-                helper_group_size.append(0)
-                helper_group_i += 1
-
-            helper_close_family_group[helper_group_i].extend([a.id, a.parent_id])
-            helper_group_size[helper_group_i] += 1
-
-        self.close_family_in_group_OT.append(np.mean(
-            [(len(helper_close_family_group[i]) - len(set(helper_close_family_group[i]))) / helper_group_size[i] for i
-             in
-             range(helper_group_i)]))  # the average amount of duplicates is the amount of close family
-        self.mass_OT.append(np.mean(helper_mass))
-        self.eat_OT.append(self.eat)
+        relative_groups = self.group()
+
+        # group ids are ordered by position, so they are sorted in index order
+        order = self.index.order
+        groups = self.agents.group[order]
+        group_count = relative_groups + 1
+        group_size = np.bincount(groups, minlength=group_count)
+
+        # every member contributes its id and its parent id, a value that appears twice in a group is close family
+        family = np.concatenate([self.agents.id[order], self.agents.parent_id[order]])
+        span = int(family.max()) + 2
+        keys = np.unique(np.concatenate([groups, groups]) * span + (family + 1))
+        distinct = np.bincount(keys // span, minlength=group_count)
+        close_family = (2 * group_size - distinct) / group_size
+
+        # the first member of every group is marked with the previous group id
+        first = np.flatnonzero(np.diff(groups, prepend=-1))
+        self.agents.group[order[first]] = groups[first] - 1
+
+        self.sink.append({
+            "i_OT": self.gcsteps,
+            "number_of_agents_OT": agent_count,
+            "interactions_OT": self.interactions,
+            "relative_groups_OT": relative_groups,
+            "close_family_in_group_OT": np.mean(close_family[:-1]),  # the last group is left out
+            "mass_OT": np.mean(self.agents.mass),
+            "eat_OT": self.eat,
+            "iq_OT": np.mean(self.agents.iq),
+            "eq_OT": np.mean(self.agents.eq),
+            "breed_mass_div_OT": np.mean(self.agents.breed_mass_div),
+            "breed_chance_OT": np.mean(self.agents.breed_chance),
+            "fight_OT": self.fight / agent_count,
+            "help_OT": self.help / agent_count,
+            "nothing_OT": self.nothing / agent_count,
+        })
+        self.interactions = 0
         self.eat = 0
-        self.iq_OT.append(np.mean(helper_iq))
-        self.eq_OT.append(np.mean(helper_eq))
-        self.breed_mass_div_OT.append(np.mean(helper_bmd))
-        self.breed_chance_OT.append(np.mean(helper_bch))
-
-        self.fight_OT.append(self.fight / agent_count)
-        self.help_OT.append(self.help / agent_count)
-        self.nothing_OT.append(self.nothing / agent_count)
-
         self.help = 0
         self.fight = 0
         self.nothing = 0
@@ -710,114 +1043,337 @@ class Sim:
         """
         Create food
         """
-        self.food = []
-        for i in range(int((1 - FOOD_FLUCT) * self.food_count)):
-            self.food.append(Food(random.uniform(-1, 1)))
+        self.food.regrow(self.rng)
 
     def step(self) -> bool:
         """
         Update the model
 
+        With the numpy backend every phase of the step (eating, interacting, thinking, moving, aging and breeding) is
+        applied to all the agents before the next phase starts. The numba backend takes one agent at a time through all
+        the phases, in the order of the spatial index. Either way every living agent is updated exactly once per step.
+        The phases are timed by :attr:`model2.Sim.profiler`.
+        Deaths are only marked and births are only queued during the step, at the end of the step the dead are
+        compacted away and the newborns are appended in one go.
+
         Returns:
             bool: If all the agents in the model are dead
         """
+        timer = self.profiler
         self.gcsteps += 1
-        if len(self.food) < FOOD_FLUCT * self.food_count:
-            self.cfood()
+        if len(self.food) < self.config.FOOD_FLUCT * self.food_count:
+            with timer.phase("step/food"):
+                self.cfood()
 
         agent_count = len(self.agents)
 
         if agent_count <= 1:
             print("ALERT: the model has died")
             return False
-        self.agents.sort(
-            key=lambda ag: ag.x
-        )  # sort agents by position, allows to quickly determine the closest agent with low complexity
-        self.food.sort(key=lambda ag: ag.x)
-        food_index = 0  # used to find closest food item with low complexity
+        # every random number of the step, drawn at once: the breeding roll and the newborn's mass, position,
+        # breed_mass_div and breed_chance jitter. Only the rows of the breeding agents are used
+        rolls = self.rng.random((5, agent_count))
+        self._update_agents(rolls)
+        return True
 
-        for a in range(agent_count):
-            agent_count = len(self.agents)
+    def _update_agents(self, rolls: np.ndarray) -> None:
+        """
+        Everything a step does to the agents: the per agent phases, breeding, deaths and updating the spatial index
 
-            if a >= agent_count:  # agents can be removed but the range isn't updated
-                return True
-
-            ax = self.agents[a].x
-
-            tf = None
-            lf = None
-            for i in range(food_index, len(self.food)):
-                if self.food[i].x > ax:
-                    food_index = i - 1
-                    tf = self.food[i]
-                    break
-                else:
-                    lf = self.food[i]
-
-            if tf is None:
-                tf = self.food[0]
-            if lf is None:
-                lf = self.food[-1]
-
-            dtf = mk_round(tf.x - ax)
-            dlf = mk_round(lf.x - ax)
-
-            dfood = dtf if dtf < dlf else dlf
-
-            if abs(
-                    dfood
-            ) < self.col_const:  # if the abs distance is smaller than the required collision const
-                self.food.remove(tf if dtf < dlf else lf)  # remove food
-                self.agents[a].eat(FOOD_CONST)  # eat food
-                self.eat += 1  # update food statistic
-                food_index -= 1
-
-            # because agents have been sorted by x values, it is easy to find the closest agent by comparing the agent before and the one after
-
-            ta = self.agents[a + 1 if a != agent_count - 1 else 0]
-            la = self.agents[(a - 1) if a != 1 else agent_count - 1]
-
-            dta = mk_round(ta.x - ax)
-            dla = mk_round(la.x - ax)
-
-            if dta < dla:
-                dagent = dta
-                a_s = ta
-            else:
-                dagent = dla
-                a_s = la
-
-            if abs(dagent) < self.col_const:
-                self.interactions += 1
-                interact(self.agents[a], a_s, self)
-
-            self.agents[a].move(
-                self.agents[a].think(
-                    dfood, dagent, a_s
-                )  # pass the environment variables to the brain of the agent
-            )  # updating agent position
-
-            self.agents[a].age()  # applying age effect
-
-            if self.agents[a].energy < ENLB_CONST * self.agents[a].mass:  # if the agent is sick, lose health
-                self.agents[a].health -= ENL_CONST
-
-            if self.agents[a].energy > ENGB_CONST * self.agents[a].mass:  # if the agent is healthy, gain health
-                self.agents[a].health += ENG_CONST
-
-            if (random.random() < self.agents[a].breed_chance
-                    and self.agents[a].health > 0
-                    and self.agents[a].mass >= self.agents[a].final_mass):  # determine if an agent will breed
-                nk = self.agents[a].breed(self.id)
-                if nk is not None:  # if the agent did not die in childbirth, append the newborn to the sim
-                    self.breed += 1
-                    self.id += 1
-                    self.agents.append(nk)
-
-            if self.agents[a].health < -1e-5:  # if the agent's health is <=0, kill it
-                self.kill += 1
-                self.agents.remove(self.agents[a])
-        return True
+        Args:
+            rolls(numpy.ndarray): The random numbers of the step, see :meth:`model2.Sim.step`
+        """
+        timer = self.profiler
+        agents = self.agents
+        agent_count = len(agents)
+        will_breed = self._step_agents(rolls[0])
+
+        with timer.phase("step/breed"):
+            parents = np.flatnonzero(will_breed)
+            newborns = self._breed(parents, rolls[1:, parents])
+
+        with timer.phase("step/deaths"):
+            alive = agents.health >= -1e-5  # if the agent's health is <=0, kill it
+            self.kill += agent_count - int(np.count_nonzero(alive))
+            agents.compact(alive)
+            agents.extend(**newborns)  # newborns are only checked in the next step
+        with timer.phase("step/sort"):
+            self.index.update(agents.x, alive)
+
+    def _step_agents(self, roll: np.ndarray) -> np.ndarray:
+        """
+        The per agent phases of a step: eating, interacting, thinking, moving, aging and the breeding roll
+
+        Args:
+            roll(numpy.ndarray): The breeding roll of every agent
+
+        Returns:
+            numpy.ndarray: If every agent will breed
+        """
+        if self._kernels is not None:
+            return self._step_kernels(roll)
+        return self._step_numpy(roll)
+
+    def _step_numpy(self, roll: np.ndarray) -> np.ndarray:
+        """
+        The per agent phases of a step, vectorized with numpy
+
+        Args:
+            roll(numpy.ndarray): The breeding roll of every agent
+
+        Returns:
+            numpy.ndarray: If every agent will breed
+        """
+        timer = self.profiler
+        agents = self.agents
+        with timer.phase("step/forage"):
+            dfood, eaters = self._forage()
+        with timer.phase("step/eat"):
+            self._eat(eaters, self.config.FOOD_CONST)  # eat food
+        self.eat += len(eaters)  # update food statistic
+
+        with timer.phase("step/neighbours"):
+            # the closest agent is either the agent before or the one after
+            ta, la = self.index.neighbours()
+
+            dta = mk_round(agents.x[ta] - agents.x)
+            dla = mk_round(agents.x[la] - agents.x)
+
+            closest = dta < dla
+            dagent = np.where(closest, dta, dla)
+            a_s = np.where(closest, ta, la)
+
+        with timer.phase("step/interact"):
+            colliding = np.flatnonzero(np.abs(dagent) < self.col_const)
+            self.interactions += len(colliding)
+            interact_batch(agents, colliding, a_s[colliding], self)
+
+        with timer.phase("step/think"):
+            dx = self._think(dfood, dagent, a_s)  # pass the environment variables to the brains
+        with timer.phase("step/move"):
+            self._move(dx)  # update positions
+
+        with timer.phase("step/age"):
+            self._age()  # applying age effect
+            self._health()
+
+        return (roll < agents.breed_chance) & (agents.health > 0) & (agents.mass >= agents.final_mass)
+
+    def _step_kernels(self, roll: np.ndarray) -> np.ndarray:
+        """
+        The per agent phases of a step with :func:`kernels.step`, which steps every agent through all of them in turn
+        like the original per agent loop. The phases aren't timed separately.
+
+        Args:
+            roll(numpy.ndarray): The breeding roll of every agent
+
+        Returns:
+            numpy.ndarray: If every agent will breed
+        """
+        agents = self.agents
+        config = self.config
+        n = len(agents)
+        with self.profiler.phase("step/agents"):
+            eaten = np.zeros(len(self.food), dtype=bool)
+            will_breed = np.empty(n, dtype=bool)
+            counts = np.zeros(5, dtype=np.int64)
+            self._kernels.step(self.index.order, agents.x, agents.mass, agents.final_mass, agents.energy, agents.health,
+                               agents.speed, agents.iq, agents.eq, agents.id, agents.parent_id, agents.move_row,
+                               agents.social_row, agents.breed_chance, roll, self.food.x, eaten,
+                               *kernels.brain_tables(agents.move_brains), *kernels.brain_tables(agents.social_brains),
+                               self.col_const, config.FOOD_CONST, config.ENGB_CONST, self.size_factor,
+                               config.G_SPEED_FACTOR, config.INT_CONST, config.MOV_CONST, config.AGING_TIME,
+                               config.AGE_CONST, config.ENLB_CONST, config.ENL_CONST, config.ENG_CONST, will_breed,
+                               counts)
+            self.food.remove(eaten)
+        eat, interactions, fights, helps, nothing = counts.tolist()
+        self.eat += eat
+        self.interactions += interactions
+        self.fight += fights
+        self.help += helps
+        self.nothing += nothing
+        return will_breed
+
+    def _breed(self, parents: np.ndarray, draws: np.ndarray) -> dict:
+        """
+        Make agents have children, see :meth:`model2.Agent.breed`.
+        The children's mass is removed from the parents and parents that die in childbirth get a health of -1.
+
+        Args:
+            parents(numpy.ndarray): The slots of the breeding agents
+            draws(numpy.ndarray): Uniform [0, 1) random numbers, 4 rows (mass, x, breed_mass_div and breed_chance) with a column per parent
+
+        Returns:
+            dict: The fields of the newborns (for :meth:`agents.AgentStore.extend`), they are not added to the sim
+        """
+        parents, newborns = self._offspring(parents, draws)
+        newborns["move_row"], newborns["social_row"] = self._inherit(parents)
+        count = len(parents)
+        newborns["id"] = np.arange(self.id, self.id + count)
+        self.breed += count
+        self.id += count
+        return newborns
+
+    def _offspring(self, parents: np.ndarray, draws: np.ndarray) -> Tuple[np.ndarray, dict]:
+        """
+        The part of :meth:`model2.Sim._breed` that only depends on every parent: the children's mass is removed from the
+        parents, parents that die in childbirth get a health of -1 and the fields the newborns get from their parent
+        are computed
+
+        Args:
+            parents(numpy.ndarray): The slots of the breeding agents
+            draws(numpy.ndarray): Uniform [0, 1) random numbers, 4 rows (mass, x, breed_mass_div and breed_chance) with a column per parent
+
+        Returns:
+            (tuple): tuple containing:
+                (numpy.ndarray): The slots of the parents that survived childbirth, one per newborn
+                (dict): The fields of the newborns, without their brains and ids
+        """
+        agents = self.agents
+        nm = np.ceil((agents.mass[parents] + np.floor(draws[0] * 20) - 10) * agents.breed_mass_div[parents])
+        agents.health[parents] -= nm
+        agents.mass[parents] -= nm
+        died = (agents.health[parents] <= 0) | (agents.mass[parents] < 1) | (nm < 1)
+        agents.health[parents[died]] = -1  # died in childbirth
+
+        parents = parents[~died]
+        nm = nm[~died]
+        jitter = draws[1:, ~died] * 2 - 1
+        bmd = agents.breed_mass_div[parents]
+        return parents, dict(iq=agents.iq[parents], eq=agents.eq[parents], mass=nm, energy=nm, health=nm,
+                             speed=(1 / nm) * self.size_factor * self.config.G_SPEED_FACTOR,
+                             final_mass=np.ceil(nm / bmd), x=agents.x[parents] + jitter[0] * 0.001,
+                             breed_mass_div=bmd + jitter[1] * 0.01,
+                             breed_chance=agents.breed_chance[parents] + jitter[2] * 0.01,
+                             parent_id=agents.id[parents])
+
+    def _inherit(self, parents: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Copy the brains of parents for their newborns and mutate the copies
+
+        Args:
+            parents(numpy.ndarray): The slot of the parent of every newborn
+
+        Returns:
+            (tuple): tuple containing:
+                (numpy.ndarray): The rows of the newborns' move brains
+                (numpy.ndarray): The rows of the newborns' social brains
+        """
+        agents = self.agents
+        iq = agents.iq[parents]
+        eq = agents.eq[parents]
+        move_rows = agents.move_brains.clone(iq, agents.move_row[parents])  # a row copy and a vectorized mutation
+        agents.move_brains.mutate(iq, move_rows, self.rng)
+        social_rows = agents.social_brains.clone(eq, agents.social_row[parents])
+        agents.social_brains.mutate(eq, social_rows, self.rng)
+        return move_rows, social_rows
+
+    def _forage(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the closest food item of every agent and remove the food items that are eaten.
+
+        If several agents reach the same food item, the first agent (by position) gets it. See
+        :func:`model2.nearest_food`.
+
+        Returns:
+            (tuple): tuple containing:
+                (numpy.ndarray): The distance of every agent to its closest food item
+                (numpy.ndarray): The slots of the agents that reached a food item
+        """
+        x = self.agents.x
+        food = self.food.x
+        if len(food) == 0:
+            return np.ones(len(x)), np.empty(0, dtype=int)
+
+        dfood, target = nearest_food(food, x)
+        hungry = np.flatnonzero(np.abs(dfood) < self.col_const)  # if the abs distance is smaller than the required collision const
+        hungry = hungry[np.argsort(self.index.rank[hungry], kind="stable")]
+        _, first = np.unique(target[hungry], return_index=True)
+        eaters = hungry[first]
+
+        eaten = np.zeros(len(food), dtype=bool)
+        eaten[target[eaters]] = True
+        self.food.remove(eaten)  # remove food, masking keeps the array sorted
+        return dfood, eaters
+
+    def _eat(self, slots: np.ndarray, food: float) -> None:
+        """
+        Make agents eat, see :meth:`model2.Agent.eat`
+
+        Args:
+            slots(numpy.ndarray): The slots of the agents that eat, each slot may only appear once
+            food(float): The amount of food every agent should eat
+        """
+        agents = self.agents
+        grow = (agents.mass[slots] < agents.final_mass[slots]) & (
+                agents.energy[slots] / agents.mass[slots] > self.config.ENGB_CONST)
+        growing = slots[grow]
+        agents.mass[growing] += food  # update mass and speed
+        agents.speed[growing] = (1 / agents.mass[growing]) * self.size_factor * self.config.G_SPEED_FACTOR
+        agents.energy[slots[~grow]] += food
+
+    def _think(self, dfood: np.ndarray, dagent: np.ndarray, a_s: np.ndarray) -> np.ndarray:
+        """
+        Trigger the move brain of every agent, see :meth:`model2.Agent.think`
+
+        Args:
+            dfood(numpy.ndarray): The distance of every agent to its nearest food item
+            dagent(numpy.ndarray): The distance of every agent to its nearest agent
+            a_s(numpy.ndarray): The slot of every agent's nearest agent
+
+        Returns:
+            numpy.ndarray: DX of every agent, fed into :meth:`model2.Sim._move`
+        """
+        agents = self.agents
+        out = self._move_decisions(dfood, dagent, a_s)
+        agents.energy -= agents.iq * self.config.INT_CONST
+        return map_from_to(out, 0, 1, -agents.speed, agents.speed)
+
+    def _move_decisions(self, dfood: np.ndarray, dagent: np.ndarray, a_s: np.ndarray) -> np.ndarray:
+        """
+        Evaluate the move brain of every agent, without paying for the thought
+
+        Args:
+            dfood(numpy.ndarray): The distance of every agent to its nearest food item
+            dagent(numpy.ndarray): The distance of every agent to its nearest agent
+            a_s(numpy.ndarray): The slot of every agent's nearest agent
+
+        Returns:
+            numpy.ndarray: The output of every agent's move brain, from 0 to 1
+        """
+        agents = self.agents
+        inputs = np.stack([map_from_to(dfood, -1, 1, 0, 1), map_from_to(dagent, -1, 1, 0, 1),
+                           (agents.mass[a_s] > agents.mass).astype(float)], axis=1)
+        return agents.move_brains.feed_forward(agents.iq, agents.move_row, inputs)[:, 0]
+
+    def _move(self, dx: np.ndarray) -> None:
+        """
+        Move every agent, see :meth:`model2.Agent.move`
+
+        Args:
+            dx(numpy.ndarray): The distance every agent should travel
+        """
+        agents = self.agents
+        x = agents.x + dx
+        x = np.where(x > 1, 1 - x, x)  # make the world round
+        agents.x = np.where(x < -1, -x - 1, x)
+        agents.energy -= self.config.MOV_CONST * dx
+
+    def _age(self) -> None:
+        """
+        Make every agent experience aging, see :meth:`model2.Agent.age`
+        """
+        agents = self.agents
+        agents.health -= np.where(agents.mass > agents.final_mass * self.config.AGING_TIME, self.config.AGE_CONST, 0)
+
+    def _health(self) -> None:
+        """
+        Sick agents (energy to mass ratio under :attr:`simconfig.SimConfig.ENLB_CONST`) lose health and healthy agents (over
+        :attr:`simconfig.SimConfig.ENGB_CONST`) gain health
+        """
+        agents = self.agents
+        agents.health -= np.where(agents.energy < self.config.ENLB_CONST * agents.mass, self.config.ENL_CONST, 0)
+        agents.health += np.where(agents.energy > self.config.ENGB_CONST * agents.mass, self.config.ENG_CONST, 0)
 
     def stats(self) -> str:
         """
@@ -828,28 +1384,33 @@ class Sim:
 
         """
         return "breed:{} kill:{} eat:{}\n".format(
-            self.breed, self.kill, sum(self.eat_OT)
-        ) + "avg mass: {}\n".format(np.mean([
-            a.mass for a in self.agents
-        ])) + "avg speed: {}\n".format(np.mean([
-            a.speed for a in self.agents
-        ])) + "avg breed chance: {}\n".format(
-            np.mean([a.breed_chance for a in self.agents
-                     ])) + "avg breed mass divider: {}\n".format(
-            np.mean([a.breed_mass_div for a in self.agents]))
-
-    def graph(self, info: str = None, output=("plt", "excel")) -> str:
+            self.breed, self.kill, int(np.sum(self.eat_OT))
+        ) + "avg mass: {}\n".format(np.mean(self.agents.mass)) + "avg speed: {}\n".format(
+            np.mean(self.agents.speed)) + "avg breed chance: {}\n".format(
+            np.mean(self.agents.breed_chance)) + "avg breed mass divider: {}\n".format(
+            np.mean(self.agents.breed_mass_div))
+
+    def graph(self, info: str = None, output=("plt", "excel"), workers: int = None, name: str = None) -> str:
         """
         Graph the recorded statistics in a plt plot, in an excel spreadsheet or in an ssps compatible file.
+        Every recorded statistic can also be written to a compressed numpy archive (npz) or a csv file.
+        The formats are written concurrently, see :meth:`export.export`.
+        When profiling, the timing summary (see :meth:`profiler.PhaseTimer.summary`) is written to profile.json in the
+        output folder.
 
         Args:
             output (Tuple[str]): the output formats to use.
             info(str): Additional notes for the plt plot. If None is passed the function will ask via input so if you don't want info, pass an empty string.
+            workers(int): The number of worker processes used to write the formats, defaults to one per format
+            name(str): The output folder, relative to the graphs folder. Defaults to a unique name, see :meth:`model2.Sim.get_fn`
 
         Returns:
             str: folder name for output
+
+        Raises:
+            export.ExportError: If a requested format couldn't be written, after the other formats are written
         """
-        compatible_out = ["plt", "excel", "spss"]
+        compatible_out = ["plt", "excel", "spss", "npz", "csv"]
         e = False
         for ro in output:
             if ro not in compatible_out:
@@ -861,86 +1422,24 @@ class Sim:
         if info is None:
             info = input("Enter additional information about the sim: ")
 
-        titles = [
-            "Number Of Agents", "Average Agent Mass",
-            "Amount of Food Consumed", "Average Agent IQ", "Average Agent EQ",
-            "Average breeding mass divider", "Average Agent Breed Chance", "Fight count relative to population size",
-            "Help count relative to population size", "Ignore count relative to population size",
-            "Number of groups", "Close family ration in group"
-        ]
-
-        values = [
-            self.number_of_agents_OT, self.mass_OT, self.eat_OT, self.iq_OT, self.iq_OT,
-            self.breed_mass_div_OT, self.breed_chance_OT, self.fight_OT, self.help_OT, self.nothing_OT,
-            self.relative_groups_OT, self.close_family_in_group_OT
-        ]
-        extention = "png"
-        fn = "graphs-0.3/" + self.get_fn()
-        os.mkdir(fn)
-
-        try:
-            if "plt" in output:
-                if len(titles) != len(values):
-                    raise Exception("Error len of titles must match len of vars")
-
-                fig, axs = plt.subplots(len(values), sharex='all', figsize=(20, 60))
-                metadata = dict()
-                for i in range(len(values)):
-                    axs[i].plot(self.i_OT, values[i], linewidth=0.25)
-                    axs[i].axes.set_ylim([0, max(values[i])])
-                    axs[i].set_ylabel(titles[i])
-
-                    metadata["Final" + titles[i]] = values[i][-1]
-
-                axs[0].axes.set_xlim([0, self.dataPoints])
-                axs[0].set_title(
-                    "Simulation with {} initial agents and {} steps\nDate: {}\nNotes: {}\n\nStats:\n{}\n"
-                        .format(len(self.agents), self.gcsteps, time.strftime("%D"), info,
-                                self.stats()), )
-
-                axs[-1].set_xlabel("Number Of Data Points")
-
-                plt.tight_layout()
-                plt.autoscale()
-
-                pltfn = fn + "/plt." + extention
-                fig.savefig(pltfn, bbox_inches='tight')  # save graph
-                # add metadata:
-                im = Image.open(pltfn)
-                meta = PngImagePlugin.PngInfo()
-                for x in metadata:
-                    meta.add_text(x, str(metadata[x]))
-                im.save(pltfn, extention, pnginfo=meta)
-        except:
-            print("error in generating plt file")
-        transposed_data = []
-        for i in range(self.dataPoints):
-            transposed_data.append([j[i] for j in values])
-        try:
-            if "excel" in output:
-                if len(values[0]) > 1048576:
-                    print("to manny data points, skipping excel")
-                else:
-                    wb = openpyxl.Workbook(write_only=True)
-                    sheet = wb.create_sheet()
-                    sheet.append(titles)
-                    for i in transposed_data:
-                        sheet.append(i)
-                    wb.save(fn + "/excel.xlsx")
-        except:
-            print("error in generating excel file")
-
-        if "spss" in output:
-            savFileName = fn + '/spss.sav'
-            varNames = [i.replace(" ", "_") for i in titles]
-            varTypes = dict()
-            for t in varNames:
-                varTypes[t] = 0
-            with savReaderWriter.SavWriter(savFileName, varNames, varTypes) as writer:
-                for i in range(self.dataPoints):
-                    writer.writerow(transposed_data[i])
-
-        return os.getcwd() + "\\" + fn.replace("/", "\\");
+        fn = GRAPHS_FOLDER + "/" + (self.get_fn() if name is None else name)
+        os.makedirs(fn)
+
+        title = "Simulation with {} initial agents and {} steps\nDate: {}\nNotes: {}\n\nStats:\n{}\n".format(
+            len(self.agents), self.gcsteps, time.strftime("%D"), info, self.stats())
+        with self.profiler.phase("graph"):
+            self.sink.flush()  # workers read a journal from disk
+            errors = export.export(fn, self.sink, output, list(self.GRAPHED), list(self.GRAPH_TITLES), title,
+                                   list(self.STATS), workers)
+        for ro in errors:
+            print("error in generating {} file".format(ro))
+        if self.profiler.enabled:
+            self.profiler.save(fn + "/profile.json")
+
+        folder = os.getcwd() + "\\" + fn.replace("/", "\\")
+        if errors:
+            raise export.ExportError(folder, errors)
+        return folder
 
     def animate(self, steps, res_mult=5, fps=10, bitrate=20000, print_freq=10, data_point_freq: int = 10,
                 gui: bool = False) -> str:
@@ -956,91 +1455,35 @@ class Sim:
             data_point_freq: The frequency to update data points. Note: the maximum number of data points for excel is 16,383.
 
         Returns:
-            str: The filename of the animation
-
-        Danger:
-            As of now this function has a memory leak. Until it is resolved you will need extremely high ram capacity
+            str: The filename of the animation, or the folder of png frames if ffmpeg isn't available. See :class:`render.RingRenderer`
         """
-        # TODO: fix memory leak
-        ims = []
-        fig = plt.figure(figsize=(res_mult, res_mult))
-        for i in range(steps):
-            if not self.step():
-                return
-            if i % data_point_freq == 0:
-                self.update_stats()
-            if i % print_freq == 0:
-                self.progress(steps, i, gui)
-            acu = self.size_factor / 25
-            row = [0 for i in np.arange(0, 1, acu)]
-            for f in self.food:
-                try:
-                    row[round(f.x / acu)] = 100
-                except:
-                    if round(f.x / acu) > 1 / acu:
-                        row[-1] = 100
-                    else:
-                        row[0] = 100
-            for a in self.agents:
-                try:
-                    row[round(a.x / acu)] = 255
-                except:
-                    if round(a.x / acu) > 1 / acu:
-                        row[-1] = 255
-                    else:
-                        row[0] = 255
-
-            r = len(row) / (2 * np.pi)
-
-            p = np.zeros((np.ceil(2 * r) + 10, np.ceil(2 * r) + 10))
-
-            dist_proj = 2 * np.pi / len(row)
-            angle = 0
-            for v in row:
-                x = round(r * np.cos(angle) + r)
-                y = round(r * np.sin(angle) + r)
-                p[y][x] = v
-                p[y + 1][x] = v
-                p[y - 1][x] = v
-                p[y][x + 1] = v
-                p[y][x - 1] = v
-                angle += dist_proj
-
-            ims.append([
-                plt.imshow(p,
-                           interpolation='nearest',
-                           aspect='auto')
-            ])
-            acu = None
-            r = None
-            dist_proj = None
-            p = None
-            row = None
-            angle = None
-            gc.collect()
-        self.progress(steps, steps, gui)
+        timer = self.profiler
+        self.throughput = Throughput()
+        os.makedirs(ANIMATION_FOLDER, exist_ok=True)
+        with RingRenderer(self.size_factor, ANIMATION_FOLDER + "/" + self.get_fn(), res_mult, fps, bitrate) as renderer:
+            for i in range(steps):
+                agent_count = len(self.agents)
+                with timer.phase("step"):
+                    if not self.step():
+                        return
+                if i % data_point_freq == 0:
+                    with timer.phase("update_stats"):
+                        self.update_stats()
+                if i % print_freq == 0:
+                    self.progress(steps, i, gui)
+                self.throughput.add(agent_count)
+                with timer.phase("render"):
+                    renderer.write(self.agents.x, self.food.x)
+            self.progress(steps, steps, gui)
+        return renderer.file
+
+
+def _statistic(name: str) -> property:
+    """
+    Create a read only property that reads a recorded statistic from the simulation's sink
+    """
+    return property(lambda self: self.sink.column(name))
+
 
-        ani = animation.ArtistAnimation(fig,
-                                        ims,
-                                        interval=100,
-                                        blit=False,
-                                        repeat_delay=1000)
-
-        # Set up formatting for the movie files
-        Writer = animation.writers['ffmpeg']
-        writer = Writer(fps=fps, metadata=dict(artist='Me'), bitrate=bitrate)
-
-        fn = "animations-0.1/" + self.get_fn() + '.mp4'
-        ani.save(fn, writer=writer)
-
-        # optimize:
-        # de-initialize variables:
-        fig = None
-        ims = None
-        ani = None
-        writer = None
-        Writer = None
-        # call garbage collector:
-        gc.collect()
-        # return animation file name
-        return fn
+for _name in Sim.STATS:
+    setattr(Sim, _name, _statistic(_name))
@@ -16,34 +16,72 @@
 # this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-import configparser
 import numpy
-import os
 
-dir_path = os.path.dirname(os.path.realpath(__file__))
+var = numpy.ndarray
+
+
+def array_module(use_gpu: bool = False):
+    """
+    Get the array module neural networks should use, see :attr:`simconfig.SimConfig.USE_GPU`
+
+    Args:
+        use_gpu(bool): Whether to use the GPU
 
-config = configparser.ConfigParser(inline_comment_prefixes="#")
-config.read(os.path.join(dir_path, 'config.ini'))
+    Returns:
+        module: cupy if use_gpu, else numpy
 
-if config["GPU"]["USE_GPU"].lower() == "true":
+    Raises:
+        Exception: If the GPU is requested but CuPy can't be imported
+    """
+    if not use_gpu:
+        return numpy
     print("use GPU is on")
     try:
-        import cupy as xp
+        import cupy
     except:
         raise Exception(
             "Error importing CuPy. To ensure that your installation is setup properly go to "
             "https://docs-cupy.chainer.org/en/stable/install.html")
-else:
-    import numpy as xp
-var = numpy.ndarray
+    return cupy
+
+
+def get_array_module(a):
+    """
+    Get the array module of an array
+
+    Args:
+        a(numpy.ndarray): A numpy or a cupy array
+
+    Returns:
+        module: numpy or cupy
+    """
+    if isinstance(a, numpy.ndarray):
+        return numpy
+    import cupy  # the array is a cupy array, so cupy is already imported
+    return cupy
+
+
+def asnumpy(a) -> numpy.ndarray:
+    """
+    Move an array to the CPU (a no-op unless the GPU is used)
+
+    Args:
+        a(numpy.ndarray): An array created with xp
+
+    Returns:
+        numpy.ndarray: The array as a numpy array
+    """
+    return a.get() if hasattr(a, "get") else a
 
 
-def sigmoid(a: numpy.ndarray) -> numpy.ndarray:
+def sigmoid(a: numpy.ndarray, xp=numpy) -> numpy.ndarray:
     """
     Sigmoid Function
 
     Args:
         a(numpy.ndarray): Input
+        xp(module): The array module of the input, numpy or cupy
 
     Returns:
         numpy.ndarray: Result
@@ -51,18 +89,19 @@ def sigmoid(a: numpy.ndarray) -> numpy.ndarray:
     return 1 / (1 + xp.exp(-a))
 
 
-def mutate(a: numpy.ndarray) -> numpy.ndarray:
+def mutate(a: numpy.ndarray, rng=None) -> numpy.ndarray:
     """
     Mutate Function
 
     Args:
         a(numpy.ndarray): Input
+        rng(numpy.random.Generator): The random number generator to use, defaults to the global one
 
 
     Returns:
         numpy.ndarray: Result
     """
-    return a + xp.random.normal(0, 0.1)
+    return a + (numpy.random if rng is None else rng).normal(0, 0.1)
 
 
 class NNLayer:
@@ -73,6 +112,7 @@ class NNLayer:
     Args:
         nodes(int): The number of nodes this layer should have
         prev_nodes(int): The number of nodes the previous layer has
+        rng(numpy.random.Generator): The random number generator used to initialize the layer, defaults to the global one
 
     Attributes:
         nodes(int): The number of nodes this layer should have
@@ -80,13 +120,15 @@ class NNLayer:
 
         weights(numpy.ndarray): A matrix consisting of the weights of the layer
         bias(numpy.ndarray): A vector consisting of the biases of the layer
+    The weights and biases are numpy arrays, or cupy arrays if the layer is a view into a GPU :class:`nn.BrainArena`
     """
 
-    def __init__(self, nodes: int, prev_nodes: int) -> None:
+    def __init__(self, nodes: int, prev_nodes: int, rng=None) -> None:
+        rng = numpy.random if rng is None else rng
         self.nodes = nodes
         self.prev_nodes = prev_nodes
-        self.weights = xp.random.random((prev_nodes, nodes))
-        self.bias = xp.random.random(nodes)
+        self.weights = rng.random((prev_nodes, nodes))
+        self.bias = rng.random(nodes)
 
     def feed_forward(self, xs: numpy.ndarray) -> numpy.ndarray:
         """
@@ -98,20 +140,24 @@ class NNLayer:
             xs(numpy.ndarray): Inputs
 
         Returns:
-            numpy.ndarray: Layer outputs for the inputs
+            numpy.ndarray: Layer outputs for the inputs, in the layer's array module
         """
         if len(xs) != self.prev_nodes:
             raise Exception(
                 "error, wrong input size, expected {} got {}".format(
                     self.prev_nodes, len(xs)))
-        return sigmoid(xp.add(xp.matmul(xp.array(xs), self.weights), self.bias))
+        xp = get_array_module(self.weights)
+        return sigmoid(xp.add(xp.matmul(xp.asarray(xs, dtype=float), self.weights), self.bias), xp)
 
-    def mutate(self) -> None:
+    def mutate(self, rng=None) -> None:
         """
         Mutates the layer
+
+        Args:
+            rng(numpy.random.Generator): The random number generator to use, defaults to the global one
         """
-        self.weights = mutate(self.weights)
-        self.bias = mutate(self.bias)
+        self.weights = mutate(self.weights, rng)
+        self.bias = mutate(self.bias, rng)
 
     def __repr__(self) -> str:
         return "weights: {} bias: {}".format(self.weights, self.bias)
@@ -123,6 +169,7 @@ class NeuralNetwork:
 
     Args:
         nodes(list[int]): A list of the amount of nodes for every layer
+        rng(numpy.random.Generator): The random number generator used to initialize the layers, defaults to the global one
 
     Attributes:
         layers(np.ndarray[NNLayer]): A list of all the layers composing the neural network
@@ -132,14 +179,40 @@ class NeuralNetwork:
 
     """
 
-    def __init__(self, nodes: list) -> None:
+    @classmethod
+    def from_params(cls, nodes: list, params: numpy.ndarray) -> 'NeuralNetwork':
+        """
+        Create a neural network whose weights and biases are views into a flat parameter vector (see :class:`nn.BrainArena` for the layout)
+
+        Args:
+            nodes(list[int]): A list of the amount of nodes for every layer
+            params(numpy.ndarray): The flat parameter vector, a numpy or a cupy array
+
+        Returns:
+            NeuralNetwork: The neural network, changes to its layers change params
+        """
+        network = cls.__new__(cls)
+        network.layers = numpy.ndarray([len(nodes) - 1], dtype=NeuralNetwork)
+        offset = 0
+        for i in range(len(nodes) - 1):
+            layer = NNLayer.__new__(NNLayer)
+            layer.prev_nodes = nodes[i]
+            layer.nodes = nodes[i + 1]
+            layer.weights = params[offset:offset + nodes[i] * nodes[i + 1]].reshape(nodes[i], nodes[i + 1])
+            offset += nodes[i] * nodes[i + 1]
+            layer.bias = params[offset:offset + nodes[i + 1]]
+            offset += nodes[i + 1]
+            network.layers[i] = layer
+        return network
+
+    def __init__(self, nodes: list, rng=None) -> None:
         if len(nodes) < 2:
             raise Exception(
                 "error, the neural network needs to have an input and output layer"
             )
-        self.layers = xp.ndarray([len(nodes) - 1], dtype=NeuralNetwork)
+        self.layers = numpy.ndarray([len(nodes) - 1], dtype=NeuralNetwork)
         for i in range(len(nodes) - 1):
-            self.layers[i] = NNLayer(nodes[i + 1], nodes[i])
+            self.layers[i] = NNLayer(nodes[i + 1], nodes[i], rng)
 
     def feed_forward(self, xs: numpy.ndarray) -> numpy.ndarray:
         """
@@ -150,7 +223,7 @@ class NeuralNetwork:
 
 
         Returns:
-            numpy.ndarray: The output of the neural network
+            numpy.ndarray: The output of the neural network, on the CPU
 
         Warnings:
             it is advised that all inputs be between 0 and 1
@@ -161,16 +234,370 @@ class NeuralNetwork:
                 ys = l.feed_forward(xs)
             else:
                 ys = l.feed_forward(ys)
-        return ys
+        return asnumpy(ys)
+
+    @property
+    def topology(self) -> tuple:
+        """
+        The amount of nodes for every layer, networks with the same topology can be fed forward together. See :meth:`nn.BrainArena.feed_forward`
+        """
+        return (self.layers[0].prev_nodes,) + tuple(l.nodes for l in self.layers)
 
     def __repr__(self) -> str:
         return str([l.__repr__()
                     for l in self.layers]).replace("\\n",
                                                    "").replace(",", "\n")
 
-    def mutate(self) -> None:
+    def mutate(self, rng=None) -> None:
         """
         Mutate all the layers of the neural network
+
+        Args:
+            rng(numpy.random.Generator): The random number generator to use, defaults to the global one
         """
         for layer in self.layers:
-            layer.mutate()
+            layer.mutate(rng)
+
+
+class BrainArena:
+    """
+    The parameters of many neural networks, stored contiguously.
+
+    Networks are identified by a key (the size of their hidden layers) that determines their topology. Every topology
+    has its own parameter matrix with one row per network, a row holds the weights (row major) followed by the biases of
+    every layer. Rows of dead networks are recycled, so breeding is a row copy and a vectorized mutation and a whole
+    population can be created with a single random fill.
+
+    Every method takes an array of keys and an array of rows of the same length, the rows are processed grouped by key.
+
+    Args:
+        topology(callable): A function that returns the amount of nodes for every layer of a key's networks
+        xp(module): The array module the parameters are stored with, numpy or cupy. See :meth:`nn.array_module`
+    """
+
+    def __init__(self, topology, xp=numpy) -> None:
+        self.topology = topology
+        self.xp = xp
+        self._params = {}
+        self._size = {}
+        self._free = {}
+        self._layout = {}
+        self._allocate = None
+
+    def __len__(self) -> int:
+        return sum(self._size[key] - len(self._free[key]) for key in self._size)
+
+    def params(self, key) -> numpy.ndarray:
+        """
+        Get the parameter matrix of a key (rows that aren't allocated hold garbage)
+
+        Args:
+            key: The key of the topology
+
+        Returns:
+            numpy.ndarray: The parameter matrix, one row per network
+        """
+        self._init(key)
+        return self._params[key]
+
+    def keys(self) -> list:
+        """
+        The keys of the topologies the arena holds
+
+        Returns:
+            list: The keys
+        """
+        return list(self._params)
+
+    def relocate(self, allocate) -> None:
+        """
+        Move the parameter matrices into memory given by allocate, the arena keeps allocating there when it grows (see
+        :class:`parallel.SharedArrays`). Only supported on the CPU
+
+        Args:
+            allocate(callable): A function ``allocate(shape, dtype)`` that returns a zeroed numpy array, None for ordinary memory
+        """
+        self._allocate = allocate
+        for key, params in self._params.items():
+            self._params[key] = self._empty(params.shape)
+            self._params[key][:] = params
+
+    def attach(self, key, params: numpy.ndarray) -> None:
+        """
+        Use an existing parameter matrix for a key, e.g. one in shared memory. Only the networks can be evaluated, the
+        rows of the matrix are allocated by the arena that owns it
+
+        Args:
+            key: The key of the topology
+            params(numpy.ndarray): The parameter matrix
+        """
+        self._init(key)
+        self._params[key] = params
+
+    def _empty(self, shape: tuple):
+        if self._allocate is None:
+            return self.xp.empty(shape)
+        return self._allocate(shape, float)
+
+    def _init(self, key) -> None:
+        if key in self._params:
+            return
+        nodes = list(self.topology(key))
+        layers = []
+        offset = 0
+        for i in range(len(nodes) - 1):
+            layers.append((offset, nodes[i], nodes[i + 1]))
+            offset += nodes[i] * nodes[i + 1] + nodes[i + 1]
+        self._layout[key] = (nodes, layers, offset)
+        self._params[key] = self._empty((0, offset))
+        self._size[key] = 0
+        self._free[key] = numpy.empty(0, dtype=int)
+
+    @staticmethod
+    def _groups(keys: numpy.ndarray):
+        keys = numpy.asarray(keys)
+        for key in numpy.unique(keys).tolist():
+            yield key, numpy.flatnonzero(keys == key)
+
+    def alloc(self, keys: numpy.ndarray) -> numpy.ndarray:
+        """
+        Allocate a row for every key, the new rows are not initialized
+
+        Args:
+            keys(numpy.ndarray): The key of every new network
+
+        Returns:
+            numpy.ndarray: The allocated rows
+        """
+        rows = numpy.empty(len(keys), dtype=int)
+        for key, idx in self._groups(keys):
+            self._init(key)
+            free = self._free[key]
+            reused = free[max(len(free) - len(idx), 0):]
+            self._free[key] = free[:len(free) - len(reused)]
+            count = len(idx) - len(reused)
+            size = self._size[key]
+            params = self._params[key]
+            if size + count > len(params):  # grow geometrically
+                grown = self._empty((max(size + count, 2 * len(params)), params.shape[1]))
+                grown[:size] = params[:size]
+                self._params[key] = grown
+            self._size[key] = size + count
+            rows[idx] = numpy.concatenate([reused, numpy.arange(size, size + count)])
+        return rows
+
+    def free(self, keys: numpy.ndarray, rows: numpy.ndarray) -> None:
+        """
+        Release rows so they can be reused
+
+        Args:
+            keys(numpy.ndarray): The key of every network
+            rows(numpy.ndarray): The rows to release
+        """
+        for key, idx in self._groups(keys):
+            self._free[key] = numpy.concatenate([self._free[key], rows[idx]])
+
+    def randomize(self, keys: numpy.ndarray, rows: numpy.ndarray, rng=None) -> None:
+        """
+        Fill rows with new random parameters (the same distribution as :class:`nn.NNLayer`)
+
+        Args:
+            keys(numpy.ndarray): The key of every network
+            rows(numpy.ndarray): The rows to fill
+            rng(numpy.random.Generator): The random number generator to use, defaults to the global one
+        """
+        rng = self.xp.random if rng is None else rng
+        for key, idx in self._groups(keys):
+            params = self._params[key]
+            params[self.xp.asarray(rows[idx])] = self.xp.asarray(rng.random((len(idx), params.shape[1])))
+
+    def clone(self, keys: numpy.ndarray, rows: numpy.ndarray) -> numpy.ndarray:
+        """
+        Copy networks into newly allocated rows
+
+        Args:
+            keys(numpy.ndarray): The key of every network
+            rows(numpy.ndarray): The rows to copy
+
+        Returns:
+            numpy.ndarray: The rows of the copies
+        """
+        new = self.alloc(keys)
+        self.copy(keys, rows, new)
+        return new
+
+    def copy(self, keys: numpy.ndarray, rows: numpy.ndarray, to: numpy.ndarray) -> None:
+        """
+        Copy networks into allocated rows
+
+        Args:
+            keys(numpy.ndarray): The key of every network
+            rows(numpy.ndarray): The rows to copy
+            to(numpy.ndarray): The rows to overwrite
+        """
+        for key, idx in self._groups(keys):
+            params = self._params[key]
+            params[self.xp.asarray(to[idx])] = params[self.xp.asarray(rows[idx])]
+
+    def mutate(self, keys: numpy.ndarray, rows: numpy.ndarray, rng=None) -> None:
+        """
+        Mutate networks, equivalent to :meth:`nn.NeuralNetwork.mutate` (one random shift for the weights and one for the biases of every layer)
+
+        Args:
+            keys(numpy.ndarray): The key of every network
+            rows(numpy.ndarray): The rows to mutate
+            rng(numpy.random.Generator): The random number generator to use, defaults to the global one
+        """
+        self.shift(keys, rows, self.mutation(keys, rng))
+
+    def mutation(self, keys: numpy.ndarray, rng=None):
+        """
+        Draw the random shifts of :meth:`nn.BrainArena.mutate` without applying them, see :meth:`nn.BrainArena.shift`
+
+        Args:
+            keys(numpy.ndarray): The key of every network
+            rng(numpy.random.Generator): The random number generator to use, defaults to the global one
+
+        Returns:
+            numpy.ndarray: One row per network with the shift of the weights and the shift of the biases of every layer, padded with zeros
+        """
+        rng = self.xp.random if rng is None else rng
+        groups = list(self._groups(keys))
+        for key, _ in groups:
+            self._init(key)
+        shifts = self.xp.zeros((len(keys), max((2 * len(self._layout[key][1]) for key, _ in groups), default=0)))
+        for key, idx in groups:
+            count = 2 * len(self._layout[key][1])
+            shifts[self.xp.asarray(idx), :count] = self.xp.asarray(rng.normal(0, 0.1, (len(idx), count)))
+        return shifts
+
+    def shift(self, keys: numpy.ndarray, rows: numpy.ndarray, shifts) -> None:
+        """
+        Apply shifts drawn by :meth:`nn.BrainArena.mutation` to networks
+
+        Args:
+            keys(numpy.ndarray): The key of every network
+            rows(numpy.ndarray): The rows to mutate
+            shifts(numpy.ndarray): The shifts of every network
+        """
+        for key, idx in self._groups(keys):
+            nodes, layers, width = self._layout[key]
+            segment = numpy.empty(width, dtype=int)  # the shift used for every parameter
+            for i, (offset, prev_nodes, nodes) in enumerate(layers):
+                segment[offset:offset + prev_nodes * nodes] = 2 * i
+                segment[offset + prev_nodes * nodes:offset + prev_nodes * nodes + nodes] = 2 * i + 1
+            shift = shifts[self.xp.asarray(idx)]
+            self._params[key][self.xp.asarray(rows[idx])] += shift[:, self.xp.asarray(segment)]
+
+    def feed_forward(self, keys: numpy.ndarray, rows: numpy.ndarray, xs: numpy.ndarray) -> numpy.ndarray:
+        """
+        Feed forward a row of inputs through each of the given networks, with one batched matmul per layer and key.
+        This is how brains are evaluated in bulk, the result matches :meth:`nn.NeuralNetwork.feed_forward` on every network
+
+        Args:
+            keys(numpy.ndarray): The key of every network, all of them must have the same amount of output nodes
+            rows(numpy.ndarray): The rows of the networks
+            xs(numpy.ndarray): A matrix of inputs, one row per network
+
+        Returns:
+            numpy.ndarray: A matrix of outputs, one row per network
+        """
+        xs = self.xp.asarray(xs, dtype=float)
+        out = None
+        for key, idx in self._groups(keys):
+            nodes, layers, width = self._layout[key]
+            params = self._params[key][self.xp.asarray(rows[idx])]
+            ys = xs[self.xp.asarray(idx)]
+            for offset, prev_nodes, n in layers:
+                weights = params[:, offset:offset + prev_nodes * n].reshape(len(idx), prev_nodes, n)
+                bias = params[:, offset + prev_nodes * n:offset + prev_nodes * n + n]
+                ys = 1 / (1 + self.xp.exp(-(self.xp.matmul(ys[:, None, :], weights)[:, 0, :] + bias)))  # sigmoid
+            if out is None:
+                out = self.xp.empty((len(keys), nodes[-1]))
+            out[self.xp.asarray(idx)] = ys
+        if out is None:
+            out = self.xp.empty((0, 0))
+        return asnumpy(out)
+
+    def snapshot(self) -> dict:
+        """
+        Copy the allocated rows of every topology
+
+        Returns:
+            dict: Named arrays, see :meth:`nn.BrainArena.restore`
+        """
+        state = {}
+        for key in self._params:
+            state["{}/params".format(key)] = asnumpy(self._params[key][:self._size[key]]).copy()
+            state["{}/free".format(key)] = self._free[key].copy()
+        return state
+
+    def restore(self, state: dict) -> None:
+        """
+        Restore the arena to a snapshot, see :meth:`nn.BrainArena.snapshot`
+
+        Args:
+            state(dict): The snapshot
+        """
+        self._params = {}
+        self._size = {}
+        self._free = {}
+        for name in state:
+            key, field = name.split("/")
+            if field == "params":
+                key = int(key)
+                self._init(key)
+                self._params[key] = self._empty(state[name].shape)
+                self._params[key][:] = self.xp.asarray(state[name])
+                self._size[key] = len(state[name])
+                self._free[key] = numpy.array(state["{}/free".format(key)], dtype=int)
+
+    def network(self, key, row: int) -> NeuralNetwork:
+        """
+        Get a network as a :class:`nn.NeuralNetwork` whose layers are views into the arena.
+        The view is only valid until the arena grows
+
+        Args:
+            key: The key of the network
+            row(int): The row of the network
+
+        Returns:
+            NeuralNetwork: The network
+        """
+        return NeuralNetwork.from_params(self._layout[key][0], self._params[key][row])
+
+    def put(self, key, network: NeuralNetwork) -> int:
+        """
+        Copy a :class:`nn.NeuralNetwork` into a newly allocated row
+
+        Args:
+            key: The key of the network, it must match the network's topology
+            network(NeuralNetwork): The network
+
+        Returns:
+            int: The row of the network
+
+        Raises:
+            Exception: If the network's topology doesn't match the key
+        """
+        row = int(self.alloc(numpy.array([key]))[0])
+        self.set(key, row, network)
+        return row
+
+    def set(self, key, row: int, network: NeuralNetwork) -> None:
+        """
+        Copy a :class:`nn.NeuralNetwork` into an allocated row
+
+        Args:
+            key: The key of the network, it must match the network's topology
+            row(int): The row to overwrite
+            network(NeuralNetwork): The network
+
+        Raises:
+            Exception: If the network's topology doesn't match the key
+        """
+        self._init(key)
+        if list(network.topology) != self._layout[key][0]:
+            raise Exception("error, expected topology {} got {}".format(self._layout[key][0], network.topology))
+        self._params[key][row] = self.xp.asarray(numpy.concatenate(
+            [numpy.concatenate([numpy.ravel(asnumpy(l.weights)), numpy.ravel(asnumpy(l.bias))]) for l in network.layers]))
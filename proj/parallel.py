@@ -0,0 +1,697 @@
+#!/usr/bin/env python3
+
+# Ecosystem project - studying natural biological systems using a simulated ecosystem and reinforcement learning.
+# Copyright (C) 2020 Inbar Koursh
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import multiprocessing
+import os
+import signal
+import traceback
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from agents import AgentStore, FIELD_NAMES
+from model2 import Sim, interact_batch, map_from_to, mk_round, move_topology, nearest_food, social_topology
+from nn import BrainArena
+
+# how many ranks past the edges of its segment a worker reads: the nearest agent of an agent is one rank away, and the
+# energy an agent interacts with depends on the interactions of its neighbours
+HALO = 3
+
+
+class SharedArrays:
+    """
+    Allocates numpy arrays in shared memory blocks, so that worker processes can attach to them.
+
+    Arrays (and views that start at the beginning of one) are described by the name of their block, see
+    :meth:`parallel.SharedArrays.describe`. Blocks are freed with :meth:`parallel.SharedArrays.release` once they are no
+    longer used, e.g. after a column grew into a new block.
+    """
+
+    def __init__(self) -> None:
+        self._blocks = {}  # the address of every block -> the block and the array allocated in it
+        self._stale = []  # released blocks that were still referenced, closed later
+
+    def allocate(self, shape: tuple, dtype) -> np.ndarray:
+        """
+        Allocate a zeroed array in a new block
+
+        Args:
+            shape(tuple): The shape of the array
+            dtype: The dtype of the array
+
+        Returns:
+            numpy.ndarray: The array
+        """
+        dtype = np.dtype(dtype)
+        shape = tuple(int(size) for size in shape)
+        block = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        array.fill(0)
+        self._blocks[array.__array_interface__["data"][0]] = (block, array)
+        return array
+
+    def describe(self, array: np.ndarray) -> tuple:
+        """
+        Describe an array so another process can attach to it (see :class:`parallel._Attached`)
+
+        Args:
+            array(numpy.ndarray): An array allocated by :meth:`parallel.SharedArrays.allocate`, or a view that starts where it starts
+
+        Returns:
+            tuple: The block name and the shape and dtype of the allocated array
+        """
+        block, allocated = self._blocks[array.__array_interface__["data"][0]]
+        return block.name, allocated.shape, allocated.dtype.str
+
+    def release(self, keep=()) -> None:
+        """
+        Free blocks
+
+        Args:
+            keep: The arrays whose blocks are still used, every other block is freed
+        """
+        keep = {array.__array_interface__["data"][0] for array in keep}
+        for address in [address for address in self._blocks if address not in keep]:
+            block, _ = self._blocks.pop(address)
+            block.unlink()
+            self._stale.append(block)
+        self._stale = [block for block in self._stale if not _close(block)]
+
+
+def _close(block: shared_memory.SharedMemory) -> bool:
+    try:
+        block.close()
+    except BufferError:  # still referenced by an array, the block is unlinked so its memory goes with the array
+        return False
+    return True
+
+
+class _Attached:
+    """
+    The shared arrays a worker process uses, by block name
+    """
+
+    def __init__(self) -> None:
+        self._blocks = {}
+        self._stale = []
+
+    def update(self, layout: dict) -> dict:
+        """
+        Attach to the arrays of a layout and detach from the blocks it no longer has
+
+        Args:
+            layout(dict): Array names mapped to :meth:`parallel.SharedArrays.describe` tuples
+
+        Returns:
+            dict: The arrays, by name
+        """
+        names = {name for name, _, _ in layout.values()}
+        for name in [name for name in self._blocks if name not in names]:
+            self._stale.append(self._blocks.pop(name)[0])
+        self._stale = [block for block in self._stale if not _close(block)]  # closes once the old views are gone
+        arrays = {}
+        for key, (name, shape, dtype) in layout.items():
+            if name not in self._blocks:
+                block = shared_memory.SharedMemory(name=name)
+                self._blocks[name] = (block, np.ndarray(shape, dtype=dtype, buffer=block.buf))
+            arrays[key] = self._blocks[name][1]
+        return arrays
+
+
+def _window(lo: int, hi: int, n: int) -> tuple:
+    """
+    The ranks from lo to hi (excluded), wrapping around the ring. Rank r is at index (r - first) % n of the window, so
+    agents are found in it without a search
+
+    Args:
+        lo(int): The first rank, may be negative
+        hi(int): The end rank, may be past n
+        n(int): The number of agents
+
+    Returns:
+        (tuple): tuple containing:
+            (numpy.ndarray): The ranks, every rank at most once
+            (int): The first rank
+    """
+    if hi - lo >= n:
+        return np.arange(n), 0
+    return np.arange(lo, hi) % n, lo
+
+
+class _Segment:
+    """
+    The agents of one segment of a :class:`parallel.ParallelSim`, as seen by the worker process that owns them.
+
+    Every round of a step gathers the rows the segment needs from the shared columns into a small
+    :class:`agents.AgentStore`, runs the same code as :class:`model2.Sim` on it and writes back the rows of the segment's
+    own agents only, so workers never write the same rows. Only the agents at the edges of the segment are exchanged
+    with the neighbouring segments: the halo is read in place and the claims on food items and the agents that migrate
+    are passed through small shared buffers.
+
+    Args:
+        config(SimConfig): The parameters of the simulation
+        size_factor(float): The size factor of the simulation
+        col_const(float): The collision distance of the simulation
+        segment(int): The index of the segment
+        workers(int): The number of segments
+    """
+
+    # the phases of a Sim that run unchanged on the gathered agents
+    _eat = Sim._eat
+    _move = Sim._move
+    _age = Sim._age
+    _health = Sim._health
+    _offspring = Sim._offspring
+
+    def __init__(self, config, size_factor: float, col_const: float, segment: int, workers: int) -> None:
+        self.config = config
+        self.size_factor = size_factor
+        self.col_const = col_const
+        self.segment = segment
+        self.edges = np.linspace(-1, 1, workers + 1)  # the positions where the segments start
+        self.move_brains = BrainArena(move_topology)
+        self.social_brains = BrainArena(social_topology)
+        self.agents = None
+        self._attached = _Attached()
+
+    def _attach(self, layout: dict, n: int) -> None:
+        arrays = self._attached.update(layout)
+        self.cols = {name: arrays["agents/" + name][:n] for name in FIELD_NAMES}
+        for prefix, arena in (("move/", self.move_brains), ("social/", self.social_brains)):
+            for name, params in arrays.items():
+                if name.startswith(prefix):
+                    arena.attach(int(name[len(prefix):]), params)
+        self.arrays = arrays
+
+    def _gather(self, slots: np.ndarray, names) -> AgentStore:
+        store = AgentStore(self.size_factor, None, max(len(slots), 1), self.move_brains, self.social_brains,
+                           self.config)
+        store.extend(**{name: self.cols[name][slots] for name in names})
+        return store
+
+    def forage(self, layout: dict, n: int, n_food: int, lo: int, hi: int) -> int:
+        """
+        Attach to the shared state of the step, find the closest food item of the segment's agents and settle the
+        contests between them: the first agent (by position) that reached a food item gets it. Claims on the food items
+        agents of other segments can reach are written to the claims buffer from rank lo on
+
+        Args:
+            layout(dict): The shared arrays, see :meth:`parallel.ParallelSim._publish`
+            n(int): The number of agents
+            n_food(int): The number of food items
+            lo(int): The first rank of the segment
+            hi(int): The end rank of the segment
+
+        Returns:
+            int: The number of claims written
+        """
+        self._attach(layout, n)
+        arrays = self.arrays
+        self.order = arrays["order"][:n]
+        self.rank = arrays["rank"][:n]
+        self.rolls = arrays["rolls"][:5 * n].reshape(5, n)
+        self.n, self.lo, self.hi = n, lo, hi
+        self.own = self.order[lo:hi]
+
+        if n_food == 0 or lo == hi:
+            self.dfood = np.ones(len(self.own))
+            self.eaters = self.targets = np.empty(0, dtype=int)
+            return 0
+        food = arrays["food"][:n_food]
+        self.dfood, target = nearest_food(food, self.cols["x"][self.own])
+        hungry = np.flatnonzero(np.abs(self.dfood) < self.col_const)  # in rank order
+        _, first = np.unique(target[hungry], return_index=True)
+        self.eaters = self.own[hungry[first]]
+        self.targets = target[hungry[first]]
+
+        # an agent of another segment can only reach the first and the last food item in the segment's range, or the
+        # food items outside of it
+        start, end = np.searchsorted(food, self.edges[self.segment:self.segment + 2])
+        if self.segment == len(self.edges) - 2:
+            end = n_food
+        shared = self.targets[(self.targets <= start) | (self.targets >= end - 1)]
+        arrays["claims"][lo:lo + len(shared)] = shared
+        return len(shared)
+
+    def eat(self, claims: list) -> int:
+        """
+        Make the agents that won a food item eat it, unless an agent of an earlier segment (by position) claimed it
+        too. The eaten food items are set in the eaten buffer
+
+        Args:
+            claims(list): The start and length of the claims of every earlier segment in the claims buffer
+
+        Returns:
+            int: The number of agents that ate
+        """
+        lost = np.concatenate([self.arrays["claims"][start:start + count] for start, count in claims] +
+                              [np.empty(0, dtype=int)])
+        won = ~np.isin(self.targets, lost)
+        eaters = self.eaters[won]
+        self.arrays["eaten"][self.targets[won]] = True
+        self.agents = agents = self._gather(eaters, ("mass", "energy", "speed", "final_mass"))
+        self._eat(np.arange(len(eaters)), self.config.FOOD_CONST)
+        for name in ("mass", "energy", "speed"):
+            self.cols[name][eaters] = getattr(agents, name)
+        return len(eaters)
+
+    def interact(self) -> tuple:
+        """
+        Make the segment's agents interact and evaluate their move brains.
+
+        The agents up to :data:`parallel.HALO` ranks past the edges (the halo, owned by the neighbouring segments) are
+        gathered too: every pair that involves an agent of the segment is resolved with all the pairs that change the
+        energy of its agents, exactly as :func:`model2.interact_batch` resolves them for the whole population. The results
+        are kept until :meth:`parallel._Segment.update`, because the neighbours are reading the halo meanwhile
+
+        Returns:
+            tuple: The interactions, fights, help and nothing counts of the pairs started by the segment's agents
+        """
+        n, lo, hi = self.n, self.lo, self.hi
+        if hi == lo:
+            self.out = np.empty(0)
+            return 0, 0, 0, 0
+        x = self.cols["x"]
+        inner, first = _window(lo - (HALO - 1), hi + (HALO - 1), n)
+        slots = self.order[inner]
+        ta = self.order[(inner + 1) % n]  # the closest agent is either the agent before or the one after
+        la = self.order[(inner - 1) % n]
+        dta = mk_round(x[ta] - x[slots])
+        dla = mk_round(x[la] - x[slots])
+        closest = dta < dla
+        dagent = np.where(closest, dta, dla)
+        a_s = np.where(closest, ta, la)
+
+        colliding = np.flatnonzero(np.abs(dagent) < self.col_const)
+        colliding = colliding[np.argsort(slots[colliding], kind="stable")]  # the pairs in the order of the whole sim
+        a1 = slots[colliding]
+        a2 = a_s[colliding]
+        halo, start = _window(lo - HALO, hi + HALO, n)
+        local = self._gather(self.order[halo], ("mass", "energy", "health", "eq", "id", "parent_id", "social_row"))
+        fights, help1, help2 = interact_batch(local, (self.rank[a1] - start) % n, (self.rank[a2] - start) % n, None)
+        mine = (self.rank[a1] >= lo) & (self.rank[a1] < hi)
+        counts = (int(np.count_nonzero(mine)), int(np.count_nonzero(fights[mine])),
+                  int(np.count_nonzero(help1[mine]) + np.count_nonzero(help2[mine])),
+                  int(np.count_nonzero(mine)) - int(np.count_nonzero(help2[mine])))
+        at = (np.arange(lo, hi) - start) % n
+        self.energy = local.energy[at]
+        self.health = local.health[at]
+
+        at = (np.arange(lo, hi) - first) % n
+        mass = self.cols["mass"]
+        inputs = np.stack([map_from_to(self.dfood, -1, 1, 0, 1), map_from_to(dagent[at], -1, 1, 0, 1),
+                           (mass[a_s[at]] > mass[self.own]).astype(float)], axis=1)
+        self.out = self.move_brains.feed_forward(self.cols["iq"][self.own], self.cols["move_row"][self.own],
+                                                 inputs)[:, 0]
+        return counts
+
+    def update(self) -> tuple:
+        """
+        Move and age the segment's agents, roll their breeding dice and breed them (see :meth:`model2.Sim._offspring`).
+        The survivors and the newborns are kept until :meth:`parallel._Segment.compact`, their slots change once the
+        simulation knows every segment's deaths and births
+
+        Returns:
+            (tuple): tuple containing:
+                (numpy.ndarray): The slots of the parents that survived childbirth, one per newborn
+                (numpy.ndarray): The slots of the agents that died
+        """
+        own = self.own
+        self.agents = agents = self._gather(own, FIELD_NAMES)
+        if len(own):
+            agents.energy = self.energy
+            agents.health = self.health
+            agents.energy -= agents.iq * self.config.INT_CONST  # the cost of the move brain's thought
+            self._move(map_from_to(self.out, 0, 1, -agents.speed, agents.speed))
+            self._age()
+            self._health()
+        will_breed = (self.rolls[0, own] < agents.breed_chance) & (agents.health > 0) & (
+                agents.mass >= agents.final_mass)
+        parents = np.flatnonzero(will_breed)
+        parents, self.newborns = self._offspring(parents, self.rolls[1:, own[parents]])
+        self.parent_rows = agents.move_row[parents], agents.social_row[parents]
+        alive = agents.health >= -1e-5  # if the agent's health is <=0, kill it
+        self.survivors = {name: getattr(agents, name)[alive] for name in FIELD_NAMES}
+        self.slots = own[alive]
+        return own[parents], own[~alive]
+
+    def compact(self, layout: dict, n: int, dead: int, born: np.ndarray, first_slot: int, first_id: int,
+                move_rows: np.ndarray, move_shifts: np.ndarray, social_rows: np.ndarray, social_shifts: np.ndarray,
+                start: int) -> list:
+        """
+        Write the segment's survivors to their slots after the dead are removed (the same slots as
+        :meth:`agents.AgentStore.compact` gives them) and its newborns after them, with mutated copies of their parents'
+        brains (see :meth:`model2.Sim._inherit`). The agents that now belong to another segment are written to the
+        outbox buffer from start on, grouped by segment
+
+        Args:
+            layout(dict): The shared arrays after the store was resized
+            n(int): The number of agents after the step
+            dead(int): The number of agents that died, their sorted slots are in the dead buffer
+            born(numpy.ndarray): The index of every newborn of the segment among all the newborns
+            first_slot(int): The slot of the first newborn
+            first_id(int): The id of the first newborn
+            move_rows(numpy.ndarray): The allocated rows of the newborns' move brains
+            move_shifts(numpy.ndarray): The mutation of the newborns' move brains, see :meth:`nn.BrainArena.mutation`
+            social_rows(numpy.ndarray): The allocated rows of the newborns' social brains
+            social_shifts(numpy.ndarray): The mutation of the newborns' social brains
+            start(int): The start of the segment's part of the outbox
+
+        Returns:
+            list: The number of the segment's agents (survivors and newborns) that belong to every segment
+        """
+        self._attach(layout, n)
+        survivors = self.survivors
+        newborns = self.newborns
+        newborns.update(id=first_id + born, move_row=move_rows, social_row=social_rows)
+        self.move_brains.copy(newborns["iq"], self.parent_rows[0], move_rows)
+        self.move_brains.shift(newborns["iq"], move_rows, move_shifts)
+        self.social_brains.copy(newborns["eq"], self.parent_rows[1], social_rows)
+        self.social_brains.shift(newborns["eq"], social_rows, social_shifts)
+        dead = self.arrays["dead"][:dead]
+        slots = np.concatenate([self.slots - np.searchsorted(dead, self.slots), first_slot + born])
+        for name in FIELD_NAMES:
+            self.cols[name][slots[:len(self.slots)]] = survivors[name]
+            self.cols[name][slots[len(self.slots):]] = newborns.get(name, 0)
+
+        x = np.concatenate([survivors["x"], newborns["x"]])
+        owner = np.searchsorted(self.edges[1:-1], x, side="right")
+        stay = owner == self.segment
+        self.slots = slots[stay]
+        leaving = np.argsort(owner[~stay], kind="stable")
+        self.arrays["outbox"][start:start + len(leaving)] = slots[~stay][leaving]
+        return np.bincount(owner, minlength=len(self.edges) - 1).tolist()
+
+    def sort(self, incoming: list, offset: int) -> None:
+        """
+        Merge the segment's agents with the ones that migrated to it and write them, ordered by position, to the shared
+        index from offset on
+
+        Args:
+            incoming(list): The start and length of every part of the outbox that belongs to the segment
+            offset(int): The rank of the segment's first agent
+        """
+        slots = np.concatenate([self.slots] + [self.arrays["outbox"][start:start + count] for start, count in incoming])
+        x = self.cols["x"][slots]
+        order = np.argsort(x, kind="stable")
+        slots = slots[order]
+        end = offset + len(slots)
+        self.arrays["order"][offset:end] = slots
+        self.arrays["xs"][offset:end] = x[order]
+        self.arrays["rank"][slots] = np.arange(offset, end)
+
+
+def _worker(conn, config, size_factor: float, col_const: float, segment: int, workers: int) -> None:
+    """
+    The loop of a worker process: runs the rounds the simulation sends until it is told to stop
+
+    Args:
+        conn: The worker's end of a pipe to the simulation
+        config(SimConfig): The parameters of the simulation
+        size_factor(float): The size factor of the simulation
+        col_const(float): The collision distance of the simulation
+        segment(int): The index of the worker's segment
+        workers(int): The number of workers
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the simulation's process handles interrupts and stops the workers
+    segment = _Segment(config, size_factor, col_const, segment, workers)
+    while True:
+        message = conn.recv()
+        if message is None:
+            return
+        cmd, args = message
+        try:
+            conn.send((True, getattr(segment, cmd)(*args)))
+        except Exception:
+            conn.send((False, traceback.format_exc()))
+
+
+def _shutdown(conns: list, processes: list, memory: SharedArrays) -> None:
+    for conn in conns:
+        try:
+            conn.send(None)
+            conn.close()
+        except OSError:
+            pass
+    for process in processes:
+        process.join(5)
+        if process.is_alive():
+            process.terminate()
+    memory.release()
+
+
+class ParallelSim(Sim):
+    """
+    A simulation whose steps are computed by several worker processes, for very large populations.
+
+    Agents only interact with their neighbours on the ring, so the ring is split into as many contiguous segments as
+    there are workers (equal ranges of positions) and every worker owns the agents of its segment. The agents, their
+    brains and the food live in shared memory (see :class:`parallel.SharedArrays`), the workers read them in place and
+    only exchange the agents at the edges of their segments.
+
+    A step has six rounds, the simulation waits for all the workers between them:
+
+    1. forage: every worker finds the closest food item of its agents and settles the contests between them. It shares its claims on the food items agents of other segments can reach
+    2. eat: the agents that won a food item eat it, unless an earlier segment (by position) claimed it too
+    3. interact: every worker gathers its agents and a halo of :data:`parallel.HALO` agents past both of its edges from the neighbouring segments, resolves the interactions that involve its agents and evaluates their move brains
+    4. update: every worker moves and ages its agents, rolls their breeding dice and takes the children's mass from the parents. It keeps its survivors and newborns
+    5. compact: every worker writes its survivors and newborns to their new slots and copies and mutates the newborns' brains. The agents that moved to another segment (the migrants) are passed to it through a shared buffer
+    6. sort: every worker orders its agents and the migrants it received by position, together the workers write the whole spatial index
+
+    Between the rounds the simulation only passes the edges of the segments, allocates the newborns' brains and draws
+    their mutations, and releases the brains of the dead. All the random numbers are drawn by the simulation, so a
+    parallel simulation gives the same results as a :class:`model2.Sim` with the same seed, for any number of workers.
+
+    Call :meth:`parallel.ParallelSim.close` (or use the simulation as a context manager) to stop the workers.
+
+    Args:
+        agents: The number of agents the simulation should start with
+        food_count: The amount of food that should be provided
+        journal: A directory to stream the recorded statistics to
+        config: The parameters of the simulation, USE_GPU isn't supported
+        seed: The seed of the simulation's random number generator
+        profile: Time every phase of the simulation
+        workers: The number of worker processes, defaults to the number of cpus
+
+    Raises:
+        ValueError: If the config uses the GPU
+    """
+
+    def __init__(self, agents: int = 500, food_count: int = None, journal: str = None, config=None, seed=None,
+                 profile: bool = False, workers: int = None) -> None:
+        super().__init__(agents, food_count, journal, config, seed, profile)
+        self._start(workers)
+
+    @classmethod
+    def load(cls, filename: str, workers: int = None) -> "ParallelSim":
+        """
+        Load a simulation from a checkpoint file, see :meth:`model2.Sim.load`
+
+        Args:
+            filename: the path to the file
+            workers: The number of worker processes, defaults to the number of cpus
+
+        Returns:
+            the loaded sim
+        """
+        sim = super().load(filename)
+        sim._start(workers)
+        return sim
+
+    def _start(self, workers: int) -> None:
+        if self.config.USE_GPU:
+            raise ValueError("Parallel simulations keep the brains in shared memory, USE_GPU isn't supported")
+        self.workers = workers or os.cpu_count()
+        self._memory = SharedArrays()
+        for part in (self.agents, self.agents.move_brains, self.agents.social_brains, self.food):
+            part.relocate(self._memory.allocate)
+        self._scratch = {}
+
+        context = multiprocessing.get_context()
+        self._conns = []
+        self._processes = []
+        for segment in range(self.workers):
+            conn, child = context.Pipe()
+            process = context.Process(target=_worker, args=(child, self.config, self.size_factor, self.col_const, segment,
+                                                            self.workers),
+                                      name="segment-{}".format(segment), daemon=True)
+            process.start()
+            child.close()
+            self._conns.append(conn)
+            self._processes.append(process)
+        self._finalizer = weakref.finalize(self, _shutdown, self._conns, self._processes, self._memory)
+
+    def close(self) -> None:
+        """
+        Stop the workers and move the simulation back to ordinary memory, later steps run in this process
+        """
+        if self._finalizer.alive:
+            for part in (self.agents, self.agents.move_brains, self.agents.social_brains, self.food):
+                part.relocate(None)
+            self._scratch = {}
+            self._finalizer()
+
+    def __enter__(self) -> "ParallelSim":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _buffer(self, name: str, size: int, dtype) -> np.ndarray:
+        """
+        Get a per step shared array with room for size items, growing it geometrically
+        """
+        buffer = self._scratch.get(name)
+        if buffer is None or len(buffer) < size:
+            buffer = self._scratch[name] = self._memory.allocate((max(size, 2 * len(buffer) if buffer is not None
+                                                                      else size),), dtype)
+        return buffer
+
+    def _publish(self) -> dict:
+        """
+        Share the state of the step with the workers and free the blocks that are no longer used
+
+        Returns:
+            dict: The layout of the shared arrays (the columns, the brains, the food and the per step buffers), see :meth:`parallel.SharedArrays.describe`
+        """
+        arrays = {"agents/" + name: getattr(self.agents, name) for name in FIELD_NAMES}
+        for prefix, arena in (("move/", self.agents.move_brains), ("social/", self.agents.social_brains)):
+            arrays.update({prefix + str(key): arena.params(key) for key in arena.keys()})
+        arrays["food"] = self.food.x
+        arrays.update(self._scratch)
+        layout = {name: self._memory.describe(array) for name, array in arrays.items()}
+        self._memory.release(arrays.values())
+        return layout
+
+    def _round(self, cmd: str, args: list) -> list:
+        """
+        Run a round on every worker and wait for all of them
+
+        Args:
+            cmd(str): The :class:`parallel._Segment` method to call
+            args(list): The arguments of every worker
+
+        Returns:
+            list: The result of every worker
+
+        Raises:
+            Exception: If a worker failed
+        """
+        for conn, a in zip(self._conns, args):
+            conn.send((cmd, a))
+        replies = [conn.recv() for conn in self._conns]
+        for ok, value in replies:
+            if not ok:
+                raise Exception("A worker failed:\n" + value)
+        return [value for _, value in replies]
+
+    def _update_agents(self, rolls: np.ndarray) -> None:
+        """
+        Everything a step does to the agents, computed by the workers. The simulation only passes the edges of the
+        segments between the rounds, draws the newborns' brains (so the random numbers are drawn in the same order as
+        :meth:`model2.Sim._breed` draws them) and releases the brains of the dead. The move brains are timed with
+        interacting and aging and breeding with moving
+
+        Args:
+            rolls(numpy.ndarray): The random numbers of the step, see :meth:`model2.Sim.step`
+        """
+        if not self._finalizer.alive:
+            return super()._update_agents(rolls)
+        timer = self.profiler
+        agents = self.agents
+        workers = range(self.workers)
+        n = len(agents)
+        with timer.phase("step/publish"):
+            for name, size, dtype in (("order", n, np.int64), ("rank", n, np.int64), ("rolls", 5 * n, np.float64),
+                                      ("claims", n, np.int64), ("eaten", len(self.food), bool)):
+                self._buffer(name, size, dtype)
+            self._scratch["order"][:n] = self.index.order
+            self._scratch["rank"][:n] = self.index.rank
+            self._scratch["rolls"][:5 * n] = rolls.ravel()
+            self._scratch["eaten"][:] = False
+            layout = self._publish()
+            edges = np.linspace(-1, 1, self.workers + 1)
+            bounds = np.concatenate([[0], np.searchsorted(self.index.xs, edges[1:-1]), [n]]).tolist()
+
+        with timer.phase("step/forage"):
+            claims = self._round("forage", [(layout, n, len(self.food), bounds[k], bounds[k + 1]) for k in workers])
+        with timer.phase("step/eat"):
+            self.eat += sum(self._round("eat", [([(bounds[j], claims[j]) for j in range(k)],) for k in workers]))
+            self.food.remove(self._scratch["eaten"][:len(self.food)])
+
+        with timer.phase("step/interact"):
+            for interactions, fights, helped, nothing in self._round("interact", [()] * self.workers):
+                self.interactions += interactions
+                self.fight += fights
+                self.help += helped
+                self.nothing += nothing
+
+        with timer.phase("step/move"):
+            parents, dead = zip(*self._round("update", [()] * self.workers))
+
+        with timer.phase("step/breed"):
+            births = [len(p) for p in parents]
+            parents = np.concatenate(parents)
+            by_slot = np.argsort(parents, kind="stable")  # the order Sim._breed takes the parents in
+            born = np.empty(len(parents), dtype=int)
+            born[by_slot] = np.arange(len(parents))
+            brains = []  # the rows and the mutation of the newborns' move and social brains, see Sim._inherit
+            for keys, arena in ((agents.iq[parents], agents.move_brains), (agents.eq[parents], agents.social_brains)):
+                rows = np.empty(len(parents), dtype=int)
+                rows[by_slot] = arena.alloc(keys[by_slot])
+                drawn = arena.mutation(keys[by_slot], self.rng)
+                shifts = np.empty_like(drawn)
+                shifts[by_slot] = drawn
+                brains.append((rows, shifts))
+            (move_rows, move_shifts), (social_rows, social_shifts) = brains
+            first_id = self.id
+            self.breed += len(parents)
+            self.id += len(parents)
+
+        with timer.phase("step/deaths"):
+            dead = np.sort(np.concatenate(dead))
+            self.kill += len(dead)
+            agents.release(dead)
+            alive = n - len(dead)
+            agents.resize(alive + len(parents))  # newborns are only checked in the next step
+            self._buffer("outbox", n + len(parents), np.int64)  # room for every segment's agents and newborns
+            self._buffer("dead", len(dead), np.int64)[:len(dead)] = dead
+            for name, dtype in (("order", np.int64), ("rank", np.int64), ("xs", np.float64)):
+                self._buffer(name, len(agents), dtype)
+            layout = self._publish()
+            split = np.cumsum([0] + births)
+            starts = np.cumsum([0] + [bounds[k + 1] - bounds[k] + births[k] for k in workers])
+            owners = np.array(self._round("compact", [
+                (layout, len(agents), len(dead), born[split[k]:split[k + 1]], alive, first_id,
+                 move_rows[split[k]:split[k + 1]], move_shifts[split[k]:split[k + 1]],
+                 social_rows[split[k]:split[k + 1]], social_shifts[split[k]:split[k + 1]], int(starts[k]))
+                for k in workers]))  # owners[k, j] agents of segment k belong to segment j
+
+        with timer.phase("step/sort"):
+            offsets = np.cumsum(np.concatenate([[0], owners.sum(axis=0)])).tolist()
+            incoming = [[] for _ in workers]
+            for k in workers:
+                start = int(starts[k])
+                for j in workers:
+                    if j != k:
+                        incoming[j].append((start, int(owners[k, j])))
+                        start += int(owners[k, j])
+            self._round("sort", [(incoming[k], offsets[k]) for k in workers])
+            self.index.order = self._scratch["order"][:len(agents)].copy()
+            self.index.xs = self._scratch["xs"][:len(agents)].copy()
+            self.index.rank = self._scratch["rank"][:len(agents)].copy()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+# Ecosystem project - studying natural biological systems using a simulated ecosystem and reinforcement learning.
+# Copyright (C) 2020 Inbar Koursh
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+from time import perf_counter
+
+
+class _Phase:
+    __slots__ = ("timer", "name", "start")
+
+    def __init__(self, timer: "PhaseTimer", name: str) -> None:
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        self.timer.add(self.name, perf_counter() - self.start)
+
+
+class _NoPhase:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NO_PHASE = _NoPhase()
+
+
+class PhaseTimer:
+    """
+    Accumulates the time spent in every phase of the simulation.
+
+    Phases are timed with ``with timer.phase(name):``. The context managers are created once per phase name, so timing a
+    phase costs two perf_counter calls. Phases may be nested, a nested phase is also counted in the outer one.
+
+    Attributes:
+        totals(dict): The total time of every phase, in seconds
+        calls(dict): The number of times every phase was timed
+    """
+
+    enabled = True
+
+    def __init__(self) -> None:
+        self.totals = {}
+        self.calls = {}
+        self._phases = {}
+
+    def phase(self, name: str) -> _Phase:
+        """
+        Time a phase
+
+        Args:
+            name(str): The name of the phase
+
+        Returns:
+            A context manager that adds the time spent in it to the phase
+        """
+        phase = self._phases.get(name)
+        if phase is None:
+            phase = self._phases[name] = _Phase(self, name)
+        return phase
+
+    def add(self, name: str, seconds: float) -> None:
+        """
+        Add time to a phase
+
+        Args:
+            name(str): The name of the phase
+            seconds(float): The time spent in the phase
+        """
+        self.totals[name] = self.totals.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def summary(self) -> dict:
+        """
+        Summarize the timings
+
+        Returns:
+            dict: The total time (seconds), the number of calls, the mean time of a call and the share of the time of a
+            step (for the phases of the step) of every phase, slowest first
+        """
+        step = self.totals.get("step")
+        summary = {}
+        for name in sorted(self.totals, key=self.totals.get, reverse=True):
+            summary[name] = {"seconds": self.totals[name], "calls": self.calls[name],
+                             "mean": self.totals[name] / self.calls[name]}
+            if step and name.startswith("step/"):
+                summary[name]["share"] = self.totals[name] / step
+        return summary
+
+    def report(self) -> str:
+        """
+        Format the summary as a table
+
+        Returns:
+            str: A line per phase
+        """
+        lines = ["{:<20} {:>12} {:>10} {:>12} {:>7}".format("phase", "total (s)", "calls", "mean (ms)", "share")]
+        for name, row in self.summary().items():
+            lines.append("{:<20} {:>12.3f} {:>10} {:>12.4f} {:>7}".format(
+                name, row["seconds"], row["calls"], row["mean"] * 1000,
+                "{:.1%}".format(row["share"]) if "share" in row else ""))
+        return "\n".join(lines)
+
+    def save(self, file: str) -> str:
+        """
+        Write the summary to a json file
+
+        Args:
+            file(str): The file name
+
+        Returns:
+            str: The file name
+        """
+        with open(file, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+        return file
+
+
+class NullTimer(PhaseTimer):
+    """
+    A :class:`profiler.PhaseTimer` that doesn't time anything, used when profiling is disabled
+    """
+
+    enabled = False
+
+    def phase(self, name: str) -> _NoPhase:
+        return _NO_PHASE
+
+    def add(self, name: str, seconds: float) -> None:
+        pass
+
+
+class Throughput:
+    """
+    Measures the speed of a run between progress reports
+
+    Args:
+        step(int): The step the run starts at
+    """
+
+    def __init__(self, step: int = 0) -> None:
+        self.start = self.last = perf_counter()
+        self.start_step = self.last_step = step
+        self.agent_steps = self.last_agent_steps = 0
+
+    def add(self, agents: int) -> None:
+        """
+        Count a step
+
+        Args:
+            agents(int): The number of agents updated in the step
+        """
+        self.agent_steps += agents
+
+    def sample(self, step: int, steps: int) -> dict:
+        """
+        Measure the speed since the previous sample
+
+        Args:
+            step(int): The current step
+            steps(int): The number of steps in the run
+
+        Returns:
+            dict: steps_per_sec and agent_steps_per_sec since the previous sample and the estimated seconds left (eta,
+            from the average speed of the run, None until it is known)
+        """
+        now = perf_counter()
+        elapsed = now - self.last
+        rate = (step - self.last_step) / elapsed if elapsed > 0 else 0.0
+        agent_rate = (self.agent_steps - self.last_agent_steps) / elapsed if elapsed > 0 else 0.0
+        average = (step - self.start_step) / (now - self.start) if now > self.start else 0.0
+        self.last, self.last_step, self.last_agent_steps = now, step, self.agent_steps
+        return {"steps_per_sec": rate, "agent_steps_per_sec": agent_rate,
+                "eta": (steps - step) / average if average > 0 else None}
+
+
+def format_eta(seconds) -> str:
+    """
+    Format an ETA as h:mm:ss
+
+    Args:
+        seconds(float): The seconds left, or None if unknown
+
+    Returns:
+        str: The formatted ETA, "?" if unknown
+    """
+    if seconds is None:
+        return "?"
+    seconds = int(round(seconds))
+    return "{}:{:02d}:{:02d}".format(seconds // 3600, seconds // 60 % 60, seconds % 60)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+# Ecosystem project - studying natural biological systems using a simulated ecosystem and reinforcement learning.
+# Copyright (C) 2020 Inbar Koursh
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+
+import numpy as np
+
+# the arrays of every frame, in the order they are stored, with the dtype they are stored as
+# the agent arrays have an element per agent, the food array an element per food item
+FRAME_FIELDS = (
+    ("x", np.float32),
+    ("mass", np.float16),
+    ("group", np.int32),
+    ("food", np.float32),
+)
+
+# the columns of the frame index
+INDEX_FIELDS = ("step", "offset", "agents", "food")
+
+
+def _files(path: str):
+    return (os.path.join(path, "recording.json"), os.path.join(path, "frames.bin"),
+            os.path.join(path, "index.bin"))
+
+
+class Recorder:
+    """
+    Records the agents' positions, mass and group and the food positions of a run, for replaying it later (see
+    :class:`recorder.Recording` and replay.py).
+
+    A recording is a folder with two append-only files: ``frames.bin`` holds the raw arrays of every frame back to back
+    (see :data:`recorder.FRAME_FIELDS`) and ``index.bin`` holds a row of int64 values per frame (see
+    :data:`recorder.INDEX_FIELDS`) with the byte offset of the frame. A frame is indexed only after its data is written,
+    so a crashed run leaves a readable recording. Opening an existing recording continues it.
+
+    Args:
+        path(str): The recording folder
+        size_factor(float): The size factor of the recorded simulation, see :attr:`model2.Sim.size_factor`
+    """
+
+    def __init__(self, path: str, size_factor: float) -> None:
+        meta, frames, index = _files(path)
+        os.makedirs(path, exist_ok=True)
+        if not os.path.isfile(meta):
+            with open(meta, "w") as f:
+                json.dump({"size_factor": size_factor}, f)
+        self._frames = open(frames, "ab")
+        self._index = open(index, "ab")
+
+    def append(self, step: int, x: np.ndarray, mass: np.ndarray, group: np.ndarray, food: np.ndarray) -> None:
+        """
+        Record a frame
+
+        Args:
+            step(int): The step of the frame
+            x(numpy.ndarray): The positions of the agents
+            mass(numpy.ndarray): The mass of the agents
+            group(numpy.ndarray): The group of the agents
+            food(numpy.ndarray): The positions of the food items
+        """
+        self._frames.seek(0, os.SEEK_END)
+        offset = self._frames.tell()
+        for (_, dtype), values in zip(FRAME_FIELDS, (x, mass, group, food)):
+            self._frames.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+        self._frames.flush()
+        self._index.write(np.array([step, offset, len(x), len(food)], dtype=np.int64).tobytes())
+        self._index.flush()
+
+    def truncate(self, step: int) -> None:
+        """
+        Drop every frame recorded at or after step, used when a run goes back to an earlier step
+
+        Args:
+            step(int): The first step to drop
+        """
+        index = np.fromfile(self._index.name, dtype=np.int64).reshape(-1, len(INDEX_FIELDS))
+        keep = int(np.count_nonzero(index[:, 0] < step))  # frames are recorded in step order
+        if keep == len(index):
+            return
+        self._index.truncate(keep * index.itemsize * len(INDEX_FIELDS))
+        self._frames.truncate(index[keep, 1])
+
+    def close(self) -> None:
+        """
+        Close the recording files
+        """
+        self._frames.close()
+        self._index.close()
+
+    def __enter__(self) -> "Recorder":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class Recording:
+    """
+    Reads a recording made by :class:`recorder.Recorder`. The frames file is memory mapped, so only the frames that are
+    read are loaded.
+
+    Args:
+        path(str): The recording folder
+
+    Attributes:
+        size_factor(float): The size factor of the recorded simulation
+        index(numpy.ndarray): A row per frame, see :data:`recorder.INDEX_FIELDS`
+    """
+
+    def __init__(self, path: str) -> None:
+        meta, frames, index = _files(path)
+        with open(meta) as f:
+            self.size_factor = json.load(f)["size_factor"]
+        self.index = np.fromfile(index, dtype=np.int64).reshape(-1, len(INDEX_FIELDS))
+        self._frames = np.memmap(frames, dtype=np.uint8, mode="r") if os.path.getsize(frames) else np.empty(0, np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def steps(self) -> np.ndarray:
+        """
+        The step of every frame
+        """
+        return self.index[:, 0]
+
+    def select(self, start: int = 0, stop: int = None) -> np.ndarray:
+        """
+        Find the frames in a range of steps
+
+        Args:
+            start(int): The first step
+            stop(int): The step after the last one, defaults to the end of the recording
+
+        Returns:
+            numpy.ndarray: The frame numbers
+        """
+        steps = self.steps
+        return np.flatnonzero((steps >= start) & (steps < (np.inf if stop is None else stop)))
+
+    def frame(self, i: int) -> dict:
+        """
+        Read a frame
+
+        Args:
+            i(int): The frame number
+
+        Returns:
+            dict: The frame's arrays (see :data:`recorder.FRAME_FIELDS`), views into the memory mapped file
+        """
+        step, offset, agents, food = self.index[i]
+        frame = {"step": int(step)}
+        for name, dtype in FRAME_FIELDS:
+            count = food if name == "food" else agents
+            size = int(count) * np.dtype(dtype).itemsize
+            frame[name] = self._frames[offset:offset + size].view(dtype)
+            offset += size
+        return frame
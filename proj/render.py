@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+# Ecosystem project - studying natural biological systems using a simulated ecosystem and reinforcement learning.
+# Copyright (C) 2020 Inbar Koursh
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+import numpy as np
+
+FOOD_VALUE = 100  # pixel value of a bucket with food
+AGENT_VALUE = 255  # pixel value of a bucket with agents, drawn over food
+
+# the pixels drawn for every bucket, relative to the point on the ring
+_STAMP = ((0, 0), (1, 0), (-1, 0), (0, 1), (0, -1))
+
+
+class RingRenderer:
+    """
+    Renders the ring world frame by frame straight into a movie file.
+
+    The ring is split into buckets, every frame counts the food and the agents in every bucket with numpy.bincount and
+    paints the buckets through a pixel map that is computed once. Frames are written as soon as they are rendered, so
+    memory doesn't grow with the number of frames.
+    The movie is encoded with ffmpeg. If ffmpeg isn't available, every frame is saved as a png file in a folder instead
+    (matplotlib's gif and apng writers keep all the frames in memory until the end).
+
+    Args:
+        size_factor(float): The size factor of the simulation, sets the resolution of the ring. See :attr:`model2.Sim.size_factor`
+        fn(str): The output file name, without an extension
+        res_mult: The size of each frame (plt figure size)
+        fps(int): The animation's FPS (frames per second)
+        bitrate(int): The animation's bitrate (higher -> less compression)
+
+    Attributes:
+        file(str): The movie file, or the folder of png frames
+        buckets(int): The number of buckets the ring is split into
+    """
+
+    def __init__(self, size_factor: float, fn: str, res_mult=5, fps: int = 10, bitrate: int = 20000) -> None:
+        self.buckets = len(np.arange(0, 1, size_factor / 25))
+        r = self.buckets / (2 * np.pi)
+        side = int(np.ceil(2 * r)) + 10
+        self.shape = (side, side)
+
+        angle = 2 * np.pi * np.arange(self.buckets) / self.buckets
+        x = np.round(r * np.cos(angle) + r).astype(int) + 5
+        y = np.round(r * np.sin(angle) + r).astype(int) + 5
+        pixels = np.concatenate([((y + dy) * side + x + dx)[:, None] for dy, dx in _STAMP], axis=1).ravel()
+        owners = np.repeat(np.arange(self.buckets), len(_STAMP))
+        # neighbouring buckets share pixels, the later bucket is drawn on top
+        self._pixels, last = np.unique(pixels[::-1], return_index=True)
+        self._owners = owners[::-1][last]
+
+        import matplotlib.pyplot as plt  # slow to import, only loaded when something is rendered
+        from matplotlib import animation
+
+        self._fig = plt.figure(figsize=(res_mult, res_mult))
+        self._image = plt.imshow(np.zeros(self.shape), interpolation='nearest', aspect='auto', vmin=0,
+                                 vmax=AGENT_VALUE)
+        self._frames = 0
+        if animation.writers.is_available("ffmpeg"):
+            self.file = fn + ".mp4"
+            self._writer = animation.FFMpegWriter(fps=fps, metadata=dict(artist='Me'), bitrate=bitrate)
+            self._writer.setup(self._fig, self.file)
+        else:
+            print("WARNING ffmpeg is not available, saving the frames as png files")
+            self.file = fn
+            self._writer = None
+            os.makedirs(self.file)
+
+    def rasterize(self, agents_x: np.ndarray, food_x: np.ndarray) -> np.ndarray:
+        """
+        Draw a single frame
+
+        Args:
+            agents_x(numpy.ndarray): The positions of the agents
+            food_x(numpy.ndarray): The positions of the food items
+
+        Returns:
+            numpy.ndarray: The frame's pixel values
+        """
+        values = np.zeros(self.buckets)
+        values[np.bincount(self._bucket(food_x), minlength=self.buckets) > 0] = FOOD_VALUE
+        values[np.bincount(self._bucket(agents_x), minlength=self.buckets) > 0] = AGENT_VALUE
+        frame = np.zeros(self.shape[0] * self.shape[1])
+        frame[self._pixels] = values[self._owners]
+        return frame.reshape(self.shape)
+
+    def _bucket(self, xs: np.ndarray) -> np.ndarray:
+        return np.floor((np.asarray(xs) + 1) / 2 * self.buckets).astype(int) % self.buckets
+
+    def write(self, agents_x: np.ndarray, food_x: np.ndarray) -> None:
+        """
+        Draw a frame and write it to the output
+
+        Args:
+            agents_x(numpy.ndarray): The positions of the agents
+            food_x(numpy.ndarray): The positions of the food items
+        """
+        self._image.set_data(self.rasterize(agents_x, food_x))
+        if self._writer is not None:
+            self._writer.grab_frame()
+        else:
+            self._fig.savefig(os.path.join(self.file, "frame-{:06d}.png".format(self._frames)))
+        self._frames += 1
+
+    def close(self) -> None:
+        """
+        Finish the output file
+        """
+        import matplotlib.pyplot as plt
+
+        if self._writer is not None:
+            self._writer.finish()
+        plt.close(self._fig)
+
+    def __enter__(self) -> "RingRenderer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+# Ecosystem project - studying natural biological systems using a simulated ecosystem and reinforcement learning.
+# Copyright (C) 2020 Inbar Koursh
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from recorder import Recording
+from render import RingRenderer
+
+
+def render(path: str, fn: str, frames, res_mult=5, fps: int = 10, bitrate: int = 20000) -> str:
+    """
+    Render frames of a recording
+
+    Args:
+        path(str): The recording folder, see :class:`recorder.Recorder`
+        fn(str): The output file name, without an extension
+        frames(list[int]): The frame numbers to render
+        res_mult: The size of each frame (plt figure size)
+        fps(int): The animation's FPS (frames per second)
+        bitrate(int): The animation's bitrate (higher -> less compression)
+
+    Returns:
+        str: The filename of the animation, see :class:`render.RingRenderer`
+    """
+    recording = Recording(path)
+    with RingRenderer(recording.size_factor, fn, res_mult, fps, bitrate) as renderer:
+        for i in frames:
+            frame = recording.frame(i)
+            renderer.write(frame["x"], frame["food"])
+    return renderer.file
+
+
+def replay(path: str, fn: str, start: int = 0, stop: int = None, workers: int = 1, **kwargs) -> list:
+    """
+    Render a range of steps of a recording. With more than one worker, the range is split into consecutive segments
+    that are rendered in parallel, each to its own file.
+
+    Args:
+        path(str): The recording folder, see :class:`recorder.Recorder`
+        fn(str): The output file name, without an extension. Segments are suffixed with their number
+        start(int): The first step to render
+        stop(int): The step after the last one to render, defaults to the end of the recording
+        workers(int): The number of worker processes
+        **kwargs: Passed to :meth:`replay.render`
+
+    Returns:
+        list[str]: The filename of every segment, in order
+    """
+    frames = Recording(path).select(start, stop)
+    if workers <= 1:
+        return [render(path, fn, frames, **kwargs)]
+    segments = [segment for segment in np.array_split(frames, workers) if len(segment)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(render, path, "{}-{}".format(fn, k), segment, **kwargs)
+                   for k, segment in enumerate(segments)]
+        return [future.result() for future in futures]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Render a recorded ecosystem simulation',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("recording", type=str, help="The recording folder (see auto.py --record)")
+    parser.add_argument("-o", type=str, dest="out", help="The output file name, without an extension",
+                        default="replay")
+    parser.add_argument("--start", type=int, dest="start", help="The first step to render", default=0)
+    parser.add_argument("--stop", type=int, dest="stop", help="The step after the last one to render")
+    parser.add_argument("-w", type=int, dest="workers",
+                        help="Number of worker processes, each renders a segment of the range to its own file",
+                        default=1)
+    parser.add_argument("--fps", type=int, dest="fps", help="The animation's FPS", default=10)
+
+    args = parser.parse_args()
+    for file in replay(args.recording, args.out, args.start, args.stop, args.workers, fps=args.fps):
+        print(file)
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+
+# Ecosystem project - studying natural biological systems using a simulated ecosystem and reinforcement learning.
+# Copyright (C) 2020 Inbar Koursh
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from auto import BLAS_THREAD_VARS, parser as run_parser, simulate
+
+# the auto.py options that name files or folders, they have to stay inside the server's working directory
+PATH_OPTIONS = ("checkpoint", "journal", "record", "resume", "config")
+
+SOCKET = "simulation.sock"  # the default unix domain socket, in the server's working directory
+
+# the states of a run
+QUEUED, RUNNING, PAUSED, DONE, CANCELLED, FAILED = "queued", "running", "paused", "done", "cancelled", "failed"
+
+
+class Cancelled(Exception):
+    """
+    Raised inside a worker to stop a cancelled run
+    """
+
+
+def inside(root: str, path: str) -> bool:
+    """
+    Check if a relative path stays inside a folder (after following symbolic links)
+
+    Args:
+        root(str): The folder
+        path(str): The path, relative to the folder
+
+    Returns:
+        bool: If the path is relative and resolves to the folder or to something inside it
+    """
+    if os.path.isabs(path):
+        return False
+    root = os.path.realpath(root)
+    return os.path.commonpath([root, os.path.realpath(os.path.join(root, path))]) == root
+
+
+class _Controller:
+    """
+    The progress hook of a run in a worker process (see :meth:`auto.simulate`): reports the progress and the latest
+    statistics and obeys pause and cancel requests. It is called every step, but only looks at the requests and reports
+    every interval seconds.
+    """
+
+    def __init__(self, run: int, events, control, interval: float) -> None:
+        self.run = run
+        self.events = events
+        self.control = control
+        self.interval = interval
+        self.last = 0.0
+        self.data_points = 0
+
+    def __call__(self, sim, steps: int, csteps: int, gui: bool) -> None:
+        now = time.monotonic()
+        if now - self.last < self.interval and csteps < steps:
+            return
+        self.last = now
+        state = self.control.get(self.run)
+        if state == PAUSED:
+            self.events.put({"event": PAUSED, "run": self.run, "steps": csteps})
+            while state == PAUSED:
+                time.sleep(self.interval)
+                state = self.control.get(self.run)
+            self.events.put({"event": RUNNING, "run": self.run, "steps": csteps})
+            sim.throughput.sample(csteps, steps)  # the pause doesn't count in the speed
+        if state == CANCELLED:
+            raise Cancelled()
+
+        speed = sim.throughput.sample(csteps, steps)
+        self.events.put(dict({"event": "progress", "run": self.run, "steps": csteps, "total": steps,
+                              "agents": len(sim.agents), "food": len(sim.food)}, **speed))
+        if len(sim.sink) != self.data_points:
+            self.data_points = len(sim.sink)
+            self.events.put({"event": "stats", "run": self.run, "data_points": self.data_points,
+                             "stats": sim.sink.last()})
+
+
+def _run(run: int, argv: list, name: str, events, control, interval: float) -> dict:
+    """
+    Run a simulation in a worker process
+
+    Args:
+        run(int): The run id
+        argv(list[str]): The auto.py arguments of the run
+        name(str): The output folder, relative to the graphs folder
+        events: The queue to put the run's events on
+        control: The shared mapping of run ids to requested states
+        interval(float): The time between progress reports, in seconds
+
+    Returns:
+        dict: The output folder and the printed output, or that the run was cancelled
+    """
+    args = run_parser.parse_args(argv)
+    out = io.StringIO()  # the printed output belongs to the run, not to the worker
+    try:
+        with contextlib.redirect_stdout(out):
+            folder = simulate(args, name=name, progress=_Controller(run, events, control, interval), print_freq=1)
+    except Cancelled:
+        return {"cancelled": True, "output": out.getvalue()}
+    return {"folder": folder, "output": out.getvalue()}
+
+
+class Server:
+    """
+    A long lived simulation server, for the GUI and other front ends.
+
+    Clients connect over a unix domain socket (or a localhost tcp port, e.g. on Windows) and send requests as json
+    objects, one per line. The connection isn't authenticated, so runs may only read and write files inside the
+    server's working directory: the path options of auto.py and the output folder names have to be relative paths that
+    stay inside it.
+    Every request gets a reply (``{"reply": <the request's id>, "ok": true, ...}`` or ``"ok": false`` with an
+    ``"error"``) and every client receives the events of all the runs, also as json lines.
+
+    Requests (the "cmd" key):
+        - ``run``: start a simulation, "argv" holds auto.py arguments (e.g. ``["-s", "1000", "--spss"]``) and "name" is an optional output folder. Replies with the "run" id
+        - ``pause``, ``resume``, ``cancel``: control the run with the given "run" id. Replies with the run's state, a paused run stays paused until it is resumed
+        - ``list``: replies with the "runs", their arguments and their states
+        - ``shutdown``: cancel all the runs and stop the server
+
+    Events (the "event" key, every event has the "run" id):
+        - ``queued``: the run is waiting for a worker
+        - ``progress``: steps, total, agents, food, steps_per_sec, agent_steps_per_sec and eta
+        - ``stats``: the latest recorded data point (see :meth:`journal.StatsBuffer.last`)
+        - ``paused``, ``running``: the run stopped and continued
+        - ``done``: the output folder and the printed output of the run
+        - ``cancelled``, ``failed``: the run ended early, failures have an error
+
+    Runs are executed by a pool of worker processes, the workers import the simulation once and run many simulations.
+
+    Args:
+        workers(int): The number of worker processes, defaults to the number of cpus
+        interval(float): The time between progress reports of a run, in seconds
+    """
+
+    def __init__(self, workers: int = None, interval: float = 0.25) -> None:
+        self.workers = workers or os.cpu_count()
+        self.interval = interval
+        self.runs = {}  # id -> {"argv", "name", "state", "started", "job" (the pool's future), "future" (awaitable)}
+        self.root = os.getcwd()  # runs resolve their paths here
+        self._ids = itertools.count()
+        self._clients = set()
+        self._handlers = set()  # the tasks serving the clients
+        self._prefix = "server-" + time.strftime("%d%M%Y%H%M%S", time.localtime())
+        self._stopped = None
+
+    async def serve(self, path: str = SOCKET, host: str = "127.0.0.1", port: int = None) -> None:
+        """
+        Serve until a shutdown request
+
+        Args:
+            path(str): The unix domain socket to listen on, used unless a tcp port is given
+            host(str): The tcp host
+            port(int): The tcp port to listen on instead of the socket
+        """
+        # every worker gets an equal share of the cpus, this has to be set before the workers import numpy
+        threads = max(1, os.cpu_count() // self.workers)
+        for var in BLAS_THREAD_VARS:
+            os.environ.setdefault(var, str(threads))
+
+        self._stopped = asyncio.Event()
+        with multiprocessing.Manager() as manager, ProcessPoolExecutor(max_workers=self.workers) as pool:
+            self._pool = pool
+            self._events = manager.Queue()
+            self._control = manager.dict()
+            if port is None:
+                server = await asyncio.start_unix_server(self._client, path=path)
+            else:
+                server = await asyncio.start_server(self._client, host=host, port=port)
+            pump = asyncio.ensure_future(self._pump())
+            print("serving on {}".format(path if port is None else "{}:{}".format(host, port)), flush=True)
+            await self._stopped.wait()
+            server.close()
+            for run in self.runs:
+                self._cancel(run)
+            await asyncio.gather(*(info["future"] for info in self.runs.values()), return_exceptions=True)
+            self._events.put(None)
+            await pump
+            # the clients got the last events, disconnect them and wait for their handlers to end
+            for writer in list(self._clients):
+                writer.close()
+            await asyncio.gather(*(writer.wait_closed() for writer in list(self._clients)), return_exceptions=True)
+            for handler in self._handlers:
+                handler.cancel()
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            await server.wait_closed()
+
+    async def _pump(self) -> None:
+        # a thread waits on the events queue, so the loop is never blocked
+        loop = asyncio.get_event_loop()
+        while True:
+            event = await loop.run_in_executor(None, self._events.get)
+            if event is None:
+                return
+            info = self.runs[event["run"]]
+            info["started"] = True
+            if event["event"] in (PAUSED, RUNNING) and info["state"] in (QUEUED, PAUSED, RUNNING):
+                info["state"] = event["event"]
+            elif event["event"] == "progress" and info["state"] == QUEUED:
+                info["state"] = RUNNING
+            self._broadcast(event)
+
+    def _broadcast(self, message: dict) -> None:
+        line = (json.dumps(message) + "\n").encode()
+        for writer in list(self._clients):
+            if writer.is_closing():
+                self._clients.discard(writer)
+            else:
+                writer.write(line)
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        handler = asyncio.current_task()
+        self._handlers.add(handler)
+        self._clients.add(writer)
+        try:
+            while not reader.at_eof():
+                request = {}
+                try:
+                    line = await reader.readline()
+                    if not line.strip():
+                        continue
+                    request = json.loads(line)
+                    reply = dict(self._handle(request), ok=True)
+                except Exception as e:
+                    reply = {"ok": False, "error": str(e)}
+                reply["reply"] = request.get("id") if isinstance(request, dict) else None
+                writer.write((json.dumps(reply) + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.discard(writer)
+            self._handlers.discard(handler)
+            writer.close()
+
+    def _handle(self, request: dict) -> dict:
+        """
+        Handle a request
+
+        Args:
+            request(dict): The request
+
+        Returns:
+            dict: The reply
+
+        Raises:
+            ValueError: If the request is invalid
+        """
+        cmd = request.get("cmd")
+        if cmd == "run":
+            return {"run": self._submit(list(request.get("argv", [])), request.get("name"))}
+        if cmd in ("pause", "resume", "cancel"):
+            run = request.get("run")
+            if run not in self.runs:
+                raise ValueError("Unknown run {}".format(run))
+            getattr(self, "_" + cmd)(run)
+            return {"run": run, "state": self.runs[run]["state"]}
+        if cmd == "list":
+            return {"runs": {run: {"argv": info["argv"], "name": info["name"], "state": info["state"]}
+                             for run, info in self.runs.items()}}
+        if cmd == "shutdown":
+            self._stopped.set()
+            return {}
+        raise ValueError("Unknown command {}".format(cmd))
+
+    def _submit(self, argv: list, name: str = None) -> int:
+        err = io.StringIO()
+        try:
+            with contextlib.redirect_stderr(err):
+                args = run_parser.parse_args(argv)
+        except SystemExit:
+            raise ValueError(err.getvalue().strip().splitlines()[-1] if err.getvalue().strip() else
+                             "Invalid arguments: {}".format(" ".join(argv)))
+        if args.replicates is not None:
+            raise ValueError("--replicates isn't supported by the server, start a run per replicate")
+        for option in PATH_OPTIONS:
+            value = getattr(args, option)
+            if value is not None and not inside(self.root, value):
+                raise ValueError("--{} must be a relative path inside the server's working directory".format(option))
+        from model2 import GRAPHS_FOLDER  # not imported before serve limits the blas threads
+        if name is not None and not inside(os.path.join(self.root, GRAPHS_FOLDER), name):
+            raise ValueError("The name must be a relative path inside the {} folder".format(GRAPHS_FOLDER))
+        run = next(self._ids)
+        if name is None:
+            name = "{}/run-{}".format(self._prefix, run)
+        self._control[run] = RUNNING
+        job = self._pool.submit(_run, run, argv, name, self._events, self._control, self.interval)
+        future = asyncio.wrap_future(job)
+        self.runs[run] = {"argv": argv, "name": name, "state": QUEUED, "started": False, "job": job, "future": future}
+        future.add_done_callback(lambda f: self._finished(run, f))
+        self._broadcast({"event": QUEUED, "run": run})
+        return run
+
+    def _finished(self, run: int, future: asyncio.Future) -> None:
+        info = self.runs[run]
+        if future.cancelled():
+            info["state"] = CANCELLED
+            self._broadcast({"event": CANCELLED, "run": run})
+        elif future.exception() is not None:
+            info["state"] = FAILED
+            self._broadcast({"event": FAILED, "run": run, "error": repr(future.exception())})
+        elif future.result().get("cancelled"):
+            info["state"] = CANCELLED
+            self._broadcast(dict(future.result(), event=CANCELLED, run=run))
+        else:
+            info["state"] = DONE
+            self._broadcast(dict(future.result(), event=DONE, run=run))
+
+    def _pause(self, run: int) -> None:
+        info = self.runs[run]
+        if info["state"] in (QUEUED, RUNNING):
+            self._control[run] = PAUSED
+            info["state"] = PAUSED  # the run stops at its next report
+
+    def _resume(self, run: int) -> None:
+        info = self.runs[run]
+        if self._control.get(run) == PAUSED:
+            self._control[run] = RUNNING
+            if info["state"] == PAUSED:
+                info["state"] = RUNNING if info["started"] else QUEUED
+
+    def _cancel(self, run: int) -> None:
+        info = self.runs[run]
+        if info["state"] in (DONE, CANCELLED, FAILED):
+            return
+        self._control[run] = CANCELLED
+        info["job"].cancel()  # only cancels runs that are still queued, running ones stop at their next report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve ecosystem simulations to the GUI',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--socket", type=str, dest="socket", help="Listen on this unix domain socket", default=SOCKET)
+    parser.add_argument("--port", type=int, dest="port",
+                        help="Listen on this localhost tcp port instead of the socket (unix domain sockets aren't "
+                             "available on Windows)")
+    parser.add_argument("--host", type=str, dest="host", help="The tcp host", default="127.0.0.1")
+    parser.add_argument("-w", type=int, dest="workers", help="Number of worker processes, defaults to the number of cpus")
+    parser.add_argument("--interval", type=float, dest="interval", help="Seconds between progress reports of a run",
+                        default=0.25)
+
+    args = parser.parse_args()
+    asyncio.run(Server(args.workers, args.interval).serve(args.socket, args.host, args.port))
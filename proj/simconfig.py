@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+# Ecosystem project - studying natural biological systems using a simulated ecosystem and reinforcement learning.
+# Copyright (C) 2020 Inbar Koursh
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import configparser
+import os
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+CONFIG_FILE = os.path.join(dir_path, 'config.ini')
+
+# the simulation parameters of the [VARIABLES] section, see config.ini for their meaning
+VARIABLES = ("INT_CONST", "MOV_CONST", "ENLB_CONST", "ENGB_CONST", "ENL_CONST", "ENG_CONST", "MAX_LIFE_SPAN",
+             "AGE_CONST", "POP_DENCITY", "AGING_TIME", "G_SPEED_FACTOR", "FOOD_CONST", "START_MASS_P", "G_COL_CONST",
+             "MIN_IQ", "MAX_IQ", "MIN_EQ", "MAX_EQ", "FOOD_FLUCT", "GROUP_FACTOR")
+
+
+def _check(overrides: dict) -> None:
+    unknown = set(overrides) - set(VARIABLES) - {"USE_GPU"}
+    if unknown:
+        raise ValueError("Unknown config parameters: {}".format(", ".join(sorted(unknown))))
+
+
+class SimConfig:
+    """
+    The parameters of a simulation.
+
+    The parameters are read from config.ini and any of them can be overridden, so simulations with different
+    parameters can run side by side in one process. Every parameter is an attribute named like its config.ini key
+    (``config.FOOD_CONST``), all of them are floats except for USE_GPU.
+
+    Args:
+        file(str): The config file to read, defaults to the config.ini next to this module
+        **overrides: Parameters that replace the values from the file. AGE_CONST may be "auto", see config.ini
+
+    Attributes:
+        USE_GPU(bool): Whether the neural networks run on the GPU with CuPy
+        AGE_CONST(float): The age suffered every step, derived from ENG_CONST and MAX_LIFE_SPAN if it is "auto"
+
+    Raises:
+        ValueError: If an override isn't a known parameter
+    """
+
+    def __init__(self, file: str = None, **overrides) -> None:
+        _check(overrides)
+        config = configparser.ConfigParser(inline_comment_prefixes="#")
+        config.read(CONFIG_FILE if file is None else file)
+        values = {name: config["VARIABLES"][name] for name in VARIABLES}
+        values["USE_GPU"] = config["GPU"]["USE_GPU"]
+        values.update(overrides)
+        self._set(values)
+
+    def _set(self, values: dict) -> None:
+        self._values = values
+        for name in VARIABLES:
+            if name != "AGE_CONST":
+                setattr(self, name, float(values[name]))
+        if str(values["AGE_CONST"]).lower() == "auto":
+            self.AGE_CONST = self.ENG_CONST - (100 / self.MAX_LIFE_SPAN)
+        else:
+            self.AGE_CONST = float(values["AGE_CONST"])
+        use_gpu = values["USE_GPU"]
+        self.USE_GPU = use_gpu.lower() == "true" if isinstance(use_gpu, str) else bool(use_gpu)
+
+    def replace(self, **overrides) -> "SimConfig":
+        """
+        Copy the config with some parameters replaced
+
+        Args:
+            **overrides: The parameters to replace
+
+        Returns:
+            SimConfig: The new config
+
+        Raises:
+            ValueError: If an override isn't a known parameter
+        """
+        _check(overrides)
+        config = SimConfig.__new__(SimConfig)
+        config._set(dict(self._values, **overrides))
+        return config
+
+    def items(self) -> dict:
+        """
+        The parameters as they were given (AGE_CONST may be "auto")
+
+        Returns:
+            dict: A mapping of parameter name to value
+        """
+        return dict(self._values)
+
+    @staticmethod
+    def parse(assignments) -> dict:
+        """
+        Parse NAME=VALUE overrides, as given on the command line
+
+        Args:
+            assignments(list[str]): The overrides
+
+        Returns:
+            dict: The overrides, to be passed to :class:`simconfig.SimConfig`
+
+        Raises:
+            ValueError: If an assignment has no "="
+        """
+        overrides = {}
+        for assignment in assignments or ():
+            if "=" not in assignment:
+                raise ValueError("Expected NAME=VALUE, got {}".format(assignment))
+            name, value = assignment.split("=", 1)
+            overrides[name.strip().upper()] = value.strip()
+        return overrides
+
+    def __repr__(self) -> str:
+        return "SimConfig({})".format(", ".join("{}={}".format(k, v) for k, v in self._values.items()))
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+# Ecosystem project - studying natural biological systems using a simulated ecosystem and reinforcement learning.
+# Copyright (C) 2020 Inbar Koursh
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from typing import Tuple
+
+import numpy as np
+
+
+def ring_distance(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    The absolute distance between positions on the [-1, 1] ring
+
+    Args:
+        a(numpy.ndarray): Positions
+        b(numpy.ndarray): Positions
+
+    Returns:
+        numpy.ndarray: The element wise distance, at most 1
+    """
+    d = np.abs(a - b)
+    return np.minimum(d, 2 - d)
+
+
+class RingIndex:
+    """
+    A spatial index for agents living on the [-1, 1] ring.
+
+    The index keeps the agents' slots ordered by position. Agents only move by a small amount (at most their speed) every
+    step, so after a step almost all of the previous order is still valid: :meth:`spatial.RingIndex.update` only takes
+    out the agents that broke the order and inserts them back with a binary search, instead of sorting the whole
+    population again.
+
+    Attributes:
+        order(numpy.ndarray): The agents' slots ordered by position
+        xs(numpy.ndarray): The agents' positions in that order
+        rank(numpy.ndarray): The position of every slot in the order (the inverse of order)
+    """
+
+    def __init__(self) -> None:
+        self.order = np.empty(0, dtype=int)
+        self.xs = np.empty(0)
+        self.rank = np.empty(0, dtype=int)
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def update(self, x: np.ndarray, keep: np.ndarray = None) -> None:
+        """
+        Update the index after agents moved, died or were born
+
+        Args:
+            x(numpy.ndarray): The current position of every slot
+            keep(numpy.ndarray): If slots were compacted since the last update (see :meth:`agents.AgentStore.compact`), the boolean mask that was used. Slots appended after the compaction are treated as new agents
+        """
+        order = self.order
+        if keep is not None:
+            new_slot = np.cumsum(keep) - 1
+            order = new_slot[order[keep[order]]]
+        known = len(order)
+
+        xs = x[order]
+        movers = [np.arange(known, len(x))]  # new agents have to be inserted
+        while len(xs) > 1:
+            broken = xs[1:] < xs[:-1]
+            if not broken.any():
+                break
+            out = np.zeros(len(xs), dtype=bool)  # take out both sides of every break until what is left is sorted
+            out[1:] |= broken
+            out[:-1] |= broken
+            movers.append(order[out])
+            order = order[~out]
+            xs = xs[~out]
+
+        movers = np.concatenate(movers).astype(int)
+        if len(movers):
+            movers = movers[np.argsort(x[movers], kind="stable")]
+            at = np.searchsorted(xs, x[movers], side="right")
+            order = np.insert(order, at, movers)
+            xs = x[order]
+
+        self.order = order
+        self.xs = xs
+        self.rank = np.empty(len(order), dtype=int)
+        self.rank[order] = np.arange(len(order))
+
+    def neighbours(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the agents right after and right before every agent, wrapping around the ring
+
+        Returns:
+            (tuple): tuple containing:
+                (numpy.ndarray): The slot of the next agent of every slot
+                (numpy.ndarray): The slot of the previous agent of every slot
+        """
+        n = len(self.order)
+        return self.order[(self.rank + 1) % n], self.order[(self.rank - 1) % n]
+
+    def nearest(self, points: np.ndarray) -> np.ndarray:
+        """
+        Find the agent nearest to every point
+
+        Args:
+            points(numpy.ndarray): Positions on the ring
+
+        Returns:
+            numpy.ndarray: The slot of the nearest agent to every point
+        """
+        n = len(self.order)
+        after = np.searchsorted(self.xs, points) % n
+        before = (after - 1) % n
+        closer = ring_distance(self.xs[after], points) <= ring_distance(self.xs[before], points)
+        return self.order[np.where(closer, after, before)]
+
+    def knearest(self, k: int) -> np.ndarray:
+        """
+        Find the k nearest agents of every agent (not including itself)
+
+        Args:
+            k(int): The amount of neighbours, at most len(index) - 1
+
+        Returns:
+            numpy.ndarray: A matrix with the slots of the neighbours of every slot, ordered by distance
+        """
+        n = len(self.order)
+        k = min(k, n - 1)
+        if 2 * k < n - 1:  # on a line the k nearest are always within k places on either side
+            offsets = np.concatenate([np.arange(1, k + 1), -np.arange(1, k + 1)])
+        else:
+            offsets = np.arange(1, n)
+        candidates = (self.rank[:, None] + offsets[None, :]) % n
+        d = ring_distance(self.xs[candidates], self.xs[self.rank][:, None])
+        closest = np.argsort(d, axis=1, kind="stable")[:, :k]
+        return self.order[np.take_along_axis(candidates, closest, axis=1)]
+
+    def within(self, radius: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find every pair of agents that are within radius of each other
+
+        Args:
+            radius(float): The maximum distance, smaller than 1
+
+        Returns:
+            (tuple): tuple containing:
+                (numpy.ndarray): The slot of the first agent of every pair
+                (numpy.ndarray): The slot of the second agent of every pair, every pair appears in both orders
+        """
+        xs = self.xs
+        n = len(xs)
+        ranks = np.arange(n)
+        lo = np.searchsorted(xs, xs - radius, side="left")
+        hi = np.searchsorted(xs, xs + radius, side="right")
+        # ranges of ranks [start, end) near every rank, the second and third ranges wrap around the ring
+        starts = np.concatenate([lo, np.searchsorted(xs, xs - radius + 2, side="left"), np.zeros(n, dtype=int)])
+        ends = np.concatenate([hi, np.where(xs - radius < -1, n, 0),
+                               np.where(xs + radius > 1, np.searchsorted(xs, xs + radius - 2, side="right"), 0)])
+        starts[n:2 * n] = np.where(xs - radius < -1, np.maximum(starts[n:2 * n], hi), n)
+        ends[2 * n:] = np.minimum(ends[2 * n:], lo)
+        lengths = np.maximum(ends - starts, 0)
+
+        first = np.repeat(np.tile(ranks, 3), lengths)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        second = np.repeat(starts, lengths) + offsets
+        pair = first != second
+        return self.order[first[pair]], self.order[second[pair]]